@@ -1,10 +1,37 @@
+import os
+
 from flask import Flask
-from flasgger import Swagger
+
+
+def start_background_jobs():
+    from .services.proxy_pool import pool as proxy_pool
+    proxy_pool.start()
+    from .services import session_keeper
+    session_keeper.start()
+    from .services import webhooks
+    webhooks.start()
+    from .services import profile_history
+    profile_history.start()
+    from .services import operations
+    operations.start()
+
 
 def create_app():
     app = Flask(__name__)
 
-    # Swagger configuration (adjust according to your setup)
+    # orjson-backed JSON for every jsonify()/request.get_json()
+    from .utils import json_provider
+    json_provider.init_app(app)
+
+    # ETag/304 and gzip/br compression of GET responses
+    from .utils import http_cache
+    http_cache.init_app(app)
+
+    # Structured (JSON), queued and sampled logging
+    from .utils import log
+    log.init_app(app)
+
+    # Swagger configuration (adjust according to your setup; DOCS_ENABLED=false turns the docs off)
     app.config["SWAGGER"] = {
         "title": "Pipegram (Flask) - Instagram API",
         "uiversion": 3,
@@ -56,10 +83,19 @@ def create_app():
             {
                 "name": "Stories",
                 "description": "Story operations"
+            },
+            {
+                "name": "Webhooks",
+                "description": "Event delivery to registered URLs"
+            },
+            {
+                "name": "Health",
+                "description": "Service and upstream health"
             }
         ]
     }
-    Swagger(app)
+    from .utils import api_docs
+    api_docs.init_app(app)
 
     # Root route for testing
     @app.route("/")
@@ -67,18 +103,36 @@ def create_app():
         return "🚀 Unofficial Instagram API (Flask) is running!"
 
     # Import and register blueprints
-    from .routes import auth, post, profile, stories, dm
+    from .routes import auth, post, profile, stories, dm, webhooks, health
 
     app.register_blueprint(auth.bp, url_prefix="/auth")
     app.register_blueprint(post.bp, url_prefix="/post")
     app.register_blueprint(profile.bp, url_prefix="/profile")
     app.register_blueprint(stories.bp, url_prefix="/stories")
     app.register_blueprint(dm.bp, url_prefix="/dm")
+    app.register_blueprint(webhooks.bp, url_prefix="/webhooks")
+    app.register_blueprint(health.bp)
 
     # Register error handlers
     from .errors import register_error_handlers
     register_error_handlers(app)
 
+    # Request metrics and /metrics endpoint
+    from .utils import metrics
+    metrics.init_app(app)
+
+    # Request ids and tracing spans
+    from .utils import tracing
+    tracing.init_app(app)
+
+    # Load shedding (after metrics and tracing, so shed requests are still counted and traced)
+    from .utils import admission
+    admission.init_app(app)
+
+    # Background jobs (a preforking master leaves them to each worker, see gunicorn.conf.py)
+    if not os.getenv("DEFER_BACKGROUND_JOBS"):
+        start_background_jobs()
+
     # Global middlewares, handlers, etc. (if any)
     return app
 
@@ -1,4 +1,9 @@
-from flask import Flask, jsonify
+import logging
+
+from flask import Flask, jsonify, request
+from werkzeug.exceptions import HTTPException
+
+logger = logging.getLogger("pipegram.errors")
 
 
 class UnauthorizedError(Exception):
@@ -17,15 +22,64 @@ class ResourceNotFoundError(Exception):
     pass
 
 
+class ConflictError(Exception):
+    pass
+
+
+class TooManyRequestsError(Exception):
+    def __init__(self, message: str, retry_after: int = 1) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class ServiceUnavailableError(Exception):
+    def __init__(self, message: str, retry_after: int = 1) -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, message: str, retry_after: int = 1, scope: str = "global") -> None:
+        super().__init__(message)
+        self.retry_after = retry_after
+        self.scope = scope
+
+
+def _with_retry_after(err, status: int):
+    response = jsonify({"error": str(err)})
+    response.headers["Retry-After"] = str(max(1, err.retry_after))
+    return response, status
+
+
 def register_error_handlers(app: Flask) -> None:
     @app.errorhandler(BadRequestError)
     def handle_bad_request(err):
+        # Routes wrap upstream failures in BadRequestError; a tripped breaker
+        # is not the caller's fault and must keep its 503
+        if isinstance(err.__context__, CircuitOpenError):
+            return _with_retry_after(err.__context__, 503)
         return jsonify({"error": str(err)}), 400
 
     @app.errorhandler(ResourceNotFoundError)
     def handle_not_found(err):
         return jsonify({"error": str(err)}), 404
 
+    @app.errorhandler(ConflictError)
+    def handle_conflict(err):
+        return jsonify({"error": str(err)}), 409
+
+    @app.errorhandler(TooManyRequestsError)
+    def handle_too_many_requests(err):
+        return _with_retry_after(err, 429)
+
+    @app.errorhandler(CircuitOpenError)
+    def handle_circuit_open(err):
+        return _with_retry_after(err, 503)
+
+    @app.errorhandler(ServiceUnavailableError)
+    def handle_service_unavailable(err):
+        return _with_retry_after(err, 503)
+
     @app.errorhandler(UnauthorizedError)
     def handle_unauthorized(err):
         return jsonify({"error": str(err)}), 401
@@ -36,4 +90,8 @@ def register_error_handlers(app: Flask) -> None:
 
     @app.errorhandler(Exception)
     def handle_generic(err):
+        if isinstance(err, HTTPException):
+            # 404/405/... raised by Flask itself keep their status
+            return jsonify({"error": err.description}), err.code
+        logger.error("Unhandled error on %s %s", request.method, request.path, exc_info=err)
         return jsonify({"error": str(err)}), 500
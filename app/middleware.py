@@ -1,43 +1,182 @@
 import os
+import hashlib
 import inspect
+import json
+import threading
+import time
 from functools import wraps
-from flask import request
-from .errors import UnauthorizedError, ForbiddenError
+from typing import Any, Dict, Iterable, List, Optional, Set
+from flask import Response, g, request
+from .errors import UnauthorizedError, ForbiddenError, TooManyRequestsError
+from .utils.metrics import API_KEY_REJECTIONS, API_KEY_REQUESTS
+from .utils.state_store import get_store
 
 ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+# Per-tenant keys, a JSON list (inline or in a file) of
+#   {"name": "crm", "key": "...", "usernames": ["shop_a"], "rate_limit": 120, "concurrency": 4}
+# "key_sha256" (hex) can replace "key" so the file holds no plaintext secrets.
+# rate_limit is requests per minute, counted in the state store: shared by
+# every worker with the sqlite/redis backends, per worker with memory.
+# concurrency is in-flight requests per worker; omit either for no limit.
+API_KEYS = os.getenv("API_KEYS")
+API_KEYS_FILE = os.getenv("API_KEYS_FILE")
+
+
+class ApiKey:
+    __slots__ = ("name", "digest", "usernames", "rate_limit", "concurrency", "_in_flight", "_lock")
+
+    def __init__(self, name: str, digest: bytes, usernames: Optional[Iterable[str]] = None,
+                 rate_limit: Optional[int] = None, concurrency: Optional[int] = None) -> None:
+        self.name = name
+        self.digest = digest
+        usernames = None if usernames is None or "*" in usernames else frozenset(u.lower() for u in usernames)
+        self.usernames = usernames
+        self.rate_limit = rate_limit
+        self.concurrency = concurrency
+        self._in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def scoped(self) -> bool:
+        return self.usernames is not None
+
+    def allows(self, username: Optional[str]) -> bool:
+        # Scoped keys only act on their own accounts; None means "every account"
+        if self.usernames is None:
+            return True
+        return username is not None and username.lower() in self.usernames
+
+    def acquire(self) -> bool:
+        if not self.concurrency:
+            return True
+        with self._lock:
+            if self._in_flight >= self.concurrency:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self) -> None:
+        if self.concurrency:
+            with self._lock:
+                self._in_flight -= 1
+
+
+def _digest(token: str) -> bytes:
+    return hashlib.sha256(token.encode("utf-8")).digest()
+
+
+def _load_keys() -> Dict[bytes, ApiKey]:
+    entries: List[dict] = []
+    if API_KEYS_FILE:
+        with open(API_KEYS_FILE, encoding="utf-8") as fh:
+            entries.extend(json.load(fh))
+    if API_KEYS:
+        entries.extend(json.loads(API_KEYS))
+    keys: Dict[bytes, ApiKey] = {}
+    for entry in entries:
+        digest = bytes.fromhex(entry["key_sha256"]) if "key_sha256" in entry else _digest(entry["key"])
+        keys[digest] = ApiKey(entry["name"], digest, entry.get("usernames"),
+                              entry.get("rate_limit"), entry.get("concurrency"))
+    if ADMIN_TOKEN:
+        # The historical shared token keeps working as an unrestricted key
+        keys[_digest(ADMIN_TOKEN)] = ApiKey("admin", _digest(ADMIN_TOKEN))
+    return keys
+
+
+# Loaded once per process; lookups are a single hash of the presented token
+_keys = _load_keys()
+
+
+def current_api_key() -> Optional[ApiKey]:
+    return g.get("api_key")
+
+
+def _names(value: Any) -> Iterable[str]:
+    if isinstance(value, str) and value.strip():
+        yield value.strip().lower()
+
+
+def request_usernames() -> Set[str]:
+    """Every account a request names: each ?username=, the body's "username" and the
+    "username" of each entry of a bulk list. The body is parsed the way the routes parse
+    it (force=True), so the Content-Type header can't hide it."""
+    usernames = {name for value in request.args.getlist("username") for name in _names(value)}
+    body = request.get_json(force=True, silent=True)
+    if isinstance(body, dict):
+        usernames.update(_names(body.get("username")))
+        for value in body.values():
+            if isinstance(value, list):
+                usernames.update(name for item in value if isinstance(item, dict)
+                                 for name in _names(item.get("username")))
+    return usernames
+
+
+def _authenticate() -> ApiKey:
+    auth_header = request.headers.get("Authorization")
+    if not auth_header:
+        raise UnauthorizedError("Missing authentication token")
+
+    # Aceita tanto "Bearer token" quanto apenas "token"
+    token = auth_header[7:] if auth_header.startswith("Bearer ") else auth_header
+    # Keys are looked up by the SHA-256 of the presented token: lookup timing can
+    # only leak bits of that hash, which does not help guess a token
+    key = _keys.get(_digest(token))
+    if key is None:
+        raise ForbiddenError("Invalid token")
+
+    if key.scoped:
+        denied = sorted(u for u in request_usernames() if not key.allows(u))
+        if denied:
+            API_KEY_REJECTIONS.inc(key=key.name, reason="scope")
+            raise ForbiddenError(f"This API key cannot act on account {', '.join(denied)}")
+    # Only requests that get through count against the rate quota
+    if not key.acquire():
+        API_KEY_REJECTIONS.inc(key=key.name, reason="concurrency")
+        raise TooManyRequestsError("Too many concurrent requests for this API key", retry_after=1)
+    if key.rate_limit:
+        now = time.time()
+        window = f"ratelimit:{key.name}:{int(now // 60)}"
+        if get_store().incr(window, ttl=61) > key.rate_limit:
+            get_store().incr(window, -1, ttl=61)
+            key.release()
+            API_KEY_REJECTIONS.inc(key=key.name, reason="rate")
+            raise TooManyRequestsError("Rate limit exceeded for this API key", retry_after=60 - int(now) % 60)
+    API_KEY_REQUESTS.inc(key=key.name)
+    g.api_key = key
+    return key
+
+
+def _release_when_done(key: ApiKey, rv: Any) -> Any:
+    # A streamed body (NDJSON, exports) is still being produced after the view
+    # returns: keep the concurrency slot until the server closes the response
+    response = rv[0] if isinstance(rv, tuple) else rv
+    if isinstance(response, Response) and response.is_streamed:
+        response.call_on_close(key.release)
+    else:
+        key.release()
+    return rv
+
 
 def admin_auth_required(fn):
     if inspect.iscoroutinefunction(fn):
         @wraps(fn)
         async def async_wrapper(*args, **kwargs):
-            auth_header = request.headers.get("Authorization")
-            if not auth_header:
-                raise UnauthorizedError("Missing authentication token")
-            
-            # Aceita tanto "Bearer token" quanto apenas "token"
-            if auth_header.startswith("Bearer "):
-                token = auth_header.split(" ", 1)[1]
-            else:
-                token = auth_header
-                
-            if not ADMIN_TOKEN or token != ADMIN_TOKEN:
-                raise ForbiddenError("Invalid token")
-            return await fn(*args, **kwargs)
+            key = _authenticate()
+            try:
+                rv = await fn(*args, **kwargs)
+            except BaseException:
+                key.release()
+                raise
+            return _release_when_done(key, rv)
         return async_wrapper
 
     @wraps(fn)
     def wrapper(*args, **kwargs):
-        auth_header = request.headers.get("Authorization")
-        if not auth_header:
-            raise UnauthorizedError("Missing authentication token")
-        
-        # Aceita tanto "Bearer token" quanto apenas "token"
-        if auth_header.startswith("Bearer "):
-            token = auth_header.split(" ", 1)[1]
-        else:
-            token = auth_header
-            
-        if not ADMIN_TOKEN or token != ADMIN_TOKEN:
-            raise ForbiddenError("Invalid token")
-        return fn(*args, **kwargs)
+        key = _authenticate()
+        try:
+            rv = fn(*args, **kwargs)
+        except BaseException:
+            key.release()
+            raise
+        return _release_when_done(key, rv)
     return wrapper
@@ -0,0 +1,42 @@
+import asyncio
+import gc
+import logging
+import time
+from typing import Any, Dict
+
+# One-time work done in a preforking master (gunicorn --preload, see
+# gunicorn.conf.py): everything loaded here is shared copy-on-write by the
+# workers, and a recycled worker is forked warm from it again.
+
+logger = logging.getLogger("pipegram.preload")
+
+
+def warm() -> Dict[str, Any]:
+    started = time.perf_counter()
+
+    # Heavy imports the lazy startup path would otherwise pay on first use, per worker
+    import requests  # noqa: F401
+    from instagrapi import Client  # noqa: F401
+
+    from .services import instagram_client
+    from .utils import api_docs, session_manager
+
+    api_docs.warm()
+    sessions = session_manager.read_session_files()
+    clients = asyncio.run(instagram_client.prewarm(sessions))
+
+    stats = {"sessions": len(sessions), "clients": clients, "seconds": round(time.perf_counter() - started, 3)}
+    logger.info("Preloaded %(sessions)d sessions, %(clients)d warm clients in %(seconds).3fs", stats)
+    return stats
+
+
+def freeze() -> None:
+    # Move everything allocated so far out of the GC's reach: collections in the
+    # workers then stop touching (and copying) the shared pages
+    gc.collect()
+    gc.freeze()
+
+
+def after_fork() -> None:
+    from . import start_background_jobs
+    start_background_jobs()
@@ -0,0 +1,175 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+from flask import Flask, Response, jsonify, request
+from requests.adapters import HTTPAdapter
+
+from .utils.sharding import HashRing, extract_username
+
+# Front process: routes every request for an account to the same backend worker,
+# so that worker keeps the account's warm client, caches and rate-limit state.
+SHARD_BACKENDS = os.getenv("SHARD_BACKENDS", "")
+SHARD_BACKENDS_FILE = os.getenv("SHARD_BACKENDS_FILE")
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "2"))
+SHARD_BASE_PORT = int(os.getenv("SHARD_BASE_PORT", "3101"))
+SHARD_ROUTER_WORKERS = int(os.getenv("SHARD_ROUTER_WORKERS", "1"))
+SHARD_ROUTER_THREADS = int(os.getenv("SHARD_ROUTER_THREADS", "32"))
+SHARD_TIMEOUT = float(os.getenv("SHARD_TIMEOUT", "300"))
+
+HOP_BY_HOP_HEADERS = {
+    "connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+    "te", "trailers", "transfer-encoding", "upgrade", "content-length", "host",
+}
+
+
+def _parse_backends(raw: str) -> List[str]:
+    return [b.strip().rstrip("/") for b in raw.replace("\n", ",").split(",") if b.strip()]
+
+
+class BackendTable:
+    """Current backend list; re-read from SHARD_BACKENDS_FILE when it changes."""
+
+    def __init__(self, backends: Optional[List[str]] = None, path: Optional[str] = SHARD_BACKENDS_FILE) -> None:
+        self.path = Path(path) if path else None
+        self.ring = HashRing(backends if backends is not None else _parse_backends(SHARD_BACKENDS))
+        self._mtime = 0.0
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> HashRing:
+        if self.path is None or time.monotonic() - self._checked < 1.0:
+            return self.ring
+        with self._lock:
+            self._checked = time.monotonic()
+            try:
+                mtime = self.path.stat().st_mtime
+            except OSError:
+                return self.ring
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self.ring.rebuild(_parse_backends(self.path.read_text(encoding="utf-8")))
+        return self.ring
+
+
+def create_router(backends: Optional[List[str]] = None) -> Flask:
+    router = Flask(__name__)
+    table = BackendTable(backends)
+    upstream = requests.Session()
+    upstream.mount("http://", HTTPAdapter(pool_connections=16, pool_maxsize=SHARD_ROUTER_THREADS))
+
+    @router.route("/", defaults={"path": ""}, methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"])
+    @router.route("/<path:path>", methods=["GET", "POST", "PUT", "PATCH", "DELETE", "HEAD", "OPTIONS"])
+    def forward(path: str):
+        body = request.get_data()
+        key = request.headers.get("X-Shard-Key") or extract_username(request.args, request.get_json(silent=True))
+        ring = table.current()
+        url = request.path + (f"?{request.query_string.decode()}" if request.query_string else "")
+        headers = {k: v for k, v in request.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS}
+
+        # Owner first; if it is down, fall through to the next node on the ring
+        for backend in ring.iter_nodes(key or request.path):
+            try:
+                resp = upstream.request(
+                    request.method, backend + url, headers=headers, data=body,
+                    stream=True, allow_redirects=False, timeout=SHARD_TIMEOUT,
+                )
+            except requests.ConnectionError:
+                continue
+            out_headers = [(k, v) for k, v in resp.raw.headers.items() if k.lower() not in HOP_BY_HOP_HEADERS]
+            out_headers.append(("X-Shard-Backend", backend))
+            return Response(resp.raw.stream(64 * 1024, decode_content=False), status=resp.status_code,
+                            headers=out_headers, direct_passthrough=True)
+        return jsonify({"error": "No backend available"}), 502
+
+    return router
+
+
+class Supervisor:
+    """Runs N single-process backends plus the router.
+
+    SIGTTIN adds a backend and SIGTTOU removes one (same signals gunicorn uses);
+    the hash ring only moves the accounts owned by the added/removed backend.
+    """
+
+    def __init__(self, workers: int = SHARD_WORKERS, base_port: int = SHARD_BASE_PORT) -> None:
+        from .utils.session_manager import SESSIONS_DIR
+
+        self.base_port = base_port
+        self.backends_file = Path(SHARD_BACKENDS_FILE) if SHARD_BACKENDS_FILE else SESSIONS_DIR / ".shard_backends"
+        self.procs: Dict[int, subprocess.Popen] = {}
+        self.router: Optional[subprocess.Popen] = None
+        self.target = workers
+        self.running = True
+
+    def _spawn_backend(self, port: int) -> None:
+        self.procs[port] = subprocess.Popen([
+            sys.executable, "-m", "gunicorn", "--workers", "1", "--bind", f"127.0.0.1:{port}", "app:app",
+        ])
+
+    def _write_backends(self) -> None:
+        tmp = self.backends_file.with_suffix(".tmp")
+        tmp.write_text("\n".join(f"http://127.0.0.1:{p}" for p in sorted(self.procs)), encoding="utf-8")
+        tmp.replace(self.backends_file)
+
+    def _scale(self) -> None:
+        while len(self.procs) < self.target:
+            port = next(p for p in range(self.base_port, self.base_port + 1024) if p not in self.procs)
+            self._spawn_backend(port)
+        removed = []
+        while len(self.procs) > self.target:
+            port = max(self.procs)
+            removed.append(self.procs.pop(port))
+        self._write_backends()
+        if removed:
+            # Give the router time to pick up the new ring before stopping the backend
+            time.sleep(2)
+            for proc in removed:
+                proc.send_signal(signal.SIGTERM)
+
+    def _on_signal(self, signum, _frame) -> None:
+        if signum == signal.SIGTTIN:
+            self.target += 1
+        elif signum == signal.SIGTTOU:
+            self.target = max(1, self.target - 1)
+        else:
+            self.running = False
+
+    def run(self) -> None:
+        for sig in (signal.SIGTTIN, signal.SIGTTOU, signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, self._on_signal)
+        self._scale()
+        # The router never loads the app, so skip the preload hooks in gunicorn.conf.py
+        env = dict(os.environ, SHARD_BACKENDS_FILE=str(self.backends_file), PRELOAD_APP="false")
+        self.router = subprocess.Popen([
+            sys.executable, "-m", "gunicorn", "--workers", str(SHARD_ROUTER_WORKERS),
+            "--worker-class", "gthread", "--threads", str(SHARD_ROUTER_THREADS),
+            "--bind", f"0.0.0.0:{os.getenv('PORT', '3000')}", "app.router:router",
+        ], env=env)
+        try:
+            while self.running:
+                if len(self.procs) != self.target:
+                    self._scale()
+                for port, proc in list(self.procs.items()):
+                    if proc.poll() is not None:
+                        self._spawn_backend(port)
+                time.sleep(0.5)
+        finally:
+            for proc in [self.router, *self.procs.values()]:
+                if proc and proc.poll() is None:
+                    proc.send_signal(signal.SIGTERM)
+            for proc in [self.router, *self.procs.values()]:
+                if proc:
+                    proc.wait()
+
+
+router = create_router()
+
+if __name__ == "__main__":
+    Supervisor().run()
@@ -3,5 +3,7 @@ from . import post
 from . import profile
 from . import stories
 from . import dm
+from . import webhooks
+from . import health
 
-__all__ = ["auth", "post", "profile", "stories", "dm"]
+__all__ = ["auth", "post", "profile", "stories", "dm", "webhooks", "health"]
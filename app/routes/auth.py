@@ -1,9 +1,13 @@
-from flask import Blueprint, request, jsonify
-from pydantic import BaseModel
-from typing import Optional, Any, Dict
+from flask import Blueprint, Response, request, jsonify, stream_with_context
+from pydantic import BaseModel, Field, field_validator
+from typing import Optional, Any, Dict, List
 from ..errors import BadRequestError, ResourceNotFoundError
 from ..services.instagram_client import login_with_password, resume_session
+from ..services import session_status
+from ..services.session_keeper import check_session
+from ..services.bulk_onboarding import run_bulk
 from ..utils import session_manager
+from ..utils.json_provider import dumps_bytes
 
 bp = Blueprint("auth", __name__)
 
@@ -22,6 +26,54 @@ class ImportBody(BaseModel):
     username: str
     session: Dict[str, Any]
 
+def reject_duplicate_usernames(entries):
+    # Results are keyed by username, so a repeated one would run twice but be
+    # reported and saved once
+    seen, repeated = set(), []
+    for entry in entries:
+        key = entry.username.lower()
+        if key in seen and entry.username not in repeated:
+            repeated.append(entry.username)
+        seen.add(key)
+    if repeated:
+        raise ValueError(f"Duplicate usernames in batch: {', '.join(repeated)}")
+    return entries
+
+class BulkLoginBody(BaseModel):
+    accounts: List[LoginBody] = Field(min_length=1)
+    parallelism: Optional[int] = None
+    include_session: bool = False
+
+    @field_validator("accounts")
+    @classmethod
+    def validate_accounts(cls, v):
+        return reject_duplicate_usernames(v)
+
+class BulkImportBody(BaseModel):
+    sessions: List[ImportBody] = Field(min_length=1)
+    parallelism: Optional[int] = None
+
+    @field_validator("sessions")
+    @classmethod
+    def validate_sessions(cls, v):
+        return reject_duplicate_usernames(v)
+
+def login_error_message(exc: Exception) -> str:
+    error_msg = str(exc)
+    if "checkpoint_challenge_required" in error_msg:
+        return "Additional verification required (2FA/Captcha)"
+    elif "bad_password" in error_msg:
+        return "Incorrect password"
+    elif "invalid_user" in error_msg:
+        return "User not found"
+    return f"Authentication failed: {error_msg}"
+
+def ndjson_response(lines) -> Response:
+    return Response(
+        stream_with_context(dumps_bytes(line) + b"\n" for line in lines),
+        mimetype="application/x-ndjson",
+    )
+
 @bp.post("/login")
 async def login():
     """
@@ -81,17 +133,71 @@ async def login():
     body = LoginBody.model_validate(request.get_json(force=True))
     try:
         _, session = await login_with_password(body.username, body.password, body.proxy)
+        session_status.set_status(body.username, session_status.ACTIVE)
         return jsonify({"message": "Login successful", "session": session})
     except Exception as exc:
-        error_msg = str(exc)
-        if "checkpoint_challenge_required" in error_msg:
-            return jsonify({"error": "Additional verification required (2FA/Captcha)"}), 400
-        elif "bad_password" in error_msg:
-            return jsonify({"error": "Incorrect password"}), 400
-        elif "invalid_user" in error_msg:
-            return jsonify({"error": "User not found"}), 400
-        else:
-            return jsonify({"error": f"Authentication failed: {error_msg}"}), 400
+        return jsonify({"error": login_error_message(exc)}), 400
+
+@bp.post("/login/bulk")
+def login_bulk():
+    """
+    Login many accounts at once
+    ---
+    tags: [Auth]
+    summary: Bulk login with Instagram credentials
+    description: >
+      Logs in every account concurrently (bounded by BULK_MAX_PARALLEL, at most
+      BULK_PER_PROXY_PARALLEL logins per proxy at a time). Accounts without a proxy
+      get one from the proxy pool. Sessions are written in batches and one NDJSON
+      line is streamed per account once its session is saved (or its login failed),
+      followed by a summary line. If the client disconnects, logins already running
+      are still completed and saved.
+    consumes:
+      - application/json
+    produces:
+      - application/x-ndjson
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            accounts:
+              type: array
+              items:
+                type: object
+                properties:
+                  username: { type: string, example: "my_username" }
+                  password: { type: string, example: "my_password123" }
+                  proxy: { type: string, example: "http://proxy:8080" }
+                required: [username, password]
+            parallelism:
+              type: integer
+              description: Max concurrent logins (capped by BULK_MAX_PARALLEL)
+              example: 8
+            include_session:
+              type: boolean
+              description: Include the saved session in each result line
+              example: false
+          required: [accounts]
+    responses:
+      200:
+        description: >
+          NDJSON stream, e.g. {"username": "a", "status": "ok"} /
+          {"username": "b", "status": "error", "error": "Incorrect password"} /
+          {"summary": {"total": 2, "ok": 1, "failed": 1, "saved": 1}}
+      400:
+        description: The same username appears more than once in the batch
+    """
+    try:
+        body = BulkLoginBody.model_validate(request.get_json(force=True))
+    except ValueError as exc:
+        raise BadRequestError(str(exc))
+    entries = [a.model_dump() for a in body.accounts]
+    return ndjson_response(run_bulk(
+        entries, "login", body.parallelism, include_session=body.include_session, error_message=login_error_message,
+    ))
 
 @bp.post("/resume")
 async def resume():
@@ -119,24 +225,60 @@ async def resume():
         raise ResourceNotFoundError("Session not found or invalid")
 
 @bp.get("/status")
-def status():
+async def status():
     """
     Check session status
     ---
     tags: [Auth]
+    description: >
+      Reports the validity of the stored session as last seen by the background
+      session keeper or by a failing request (active, expired, challenge, error).
+      Sessions that were never checked report `unknown`; pass `refresh=true` to
+      check the session against Instagram right now.
     parameters:
       - in: query
         name: username
         required: true
         schema: { type: string }
+      - in: query
+        name: refresh
+        required: false
+        schema: { type: boolean }
     responses:
-      200: { description: Status returned }
+      200:
+        description: Status returned
+        schema:
+          type: object
+          properties:
+            username:
+              type: string
+              example: "my_account"
+            status:
+              type: string
+              enum: [active, expired, challenge, error, unknown, not_found]
+              example: "active"
+            checked_at:
+              type: number
+              description: Unix time of the last check
+            detail:
+              type: string
+              description: Error that marked the session as broken
     """
     username = request.args.get("username")
     if not username:
         raise BadRequestError("username is required")
-    exists = session_manager.session_exists(username)
-    return jsonify({"username": username, "status": "active" if exists else "not_found"})
+    if not session_manager.session_exists(username):
+        return jsonify({"username": username, "status": "not_found"})
+    if request.args.get("refresh", "").lower() in ("1", "true", "yes"):
+        record = await check_session(username)
+    else:
+        record = session_status.get_status(username) or {"status": session_status.UNKNOWN}
+    return jsonify({
+        "username": username,
+        "status": record["status"],
+        "checked_at": record.get("checked_at"),
+        "detail": record.get("detail"),
+    })
 
 @bp.delete("/delete")
 def logout():
@@ -156,6 +298,7 @@ def logout():
     if not username:
         raise BadRequestError("username is required")
     success = session_manager.delete_session(username)
+    session_status.clear_status(username)
     if success:
         return jsonify({"message": "Session removed successfully"})
     raise ResourceNotFoundError("Session not found")
@@ -184,6 +327,58 @@ async def import_session():
         session_manager.save_session(body.username, body.session)
         client = await resume_session(body.username)
         user = await client.current_user()
+        session_status.set_status(body.username, session_status.ACTIVE)
         return jsonify({"message": "Session imported successfully.", "logged_in_user": user})
     except Exception as exc:
         raise BadRequestError(f"Error importing session: {exc}")
+
+@bp.post("/import-session/bulk")
+def import_session_bulk():
+    """
+    Import many sessions at once
+    ---
+    tags: [Auth]
+    summary: Bulk import of existing sessions
+    description: >
+      Verifies every session concurrently (bounded by BULK_MAX_PARALLEL and spread
+      per proxy), writes the valid ones in batches and streams one NDJSON line per
+      account, followed by a summary line.
+    consumes:
+      - application/json
+    produces:
+      - application/x-ndjson
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            sessions:
+              type: array
+              items:
+                type: object
+                properties:
+                  username: { type: string, example: "my_username" }
+                  session: { type: object, description: "Complete exported session JSON" }
+                required: [username, session]
+            parallelism:
+              type: integer
+              example: 8
+          required: [sessions]
+    responses:
+      200:
+        description: >
+          NDJSON stream, e.g. {"username": "a", "status": "ok", "logged_in_user": {...}} /
+          {"summary": {"total": 1, "ok": 1, "failed": 0, "saved": 1}}
+      400:
+        description: The same username appears more than once in the batch
+    """
+    try:
+        body = BulkImportBody.model_validate(request.get_json(force=True))
+    except ValueError as exc:
+        raise BadRequestError(str(exc))
+    entries = [s.model_dump() for s in body.sessions]
+    return ndjson_response(run_bulk(
+        entries, "import", body.parallelism, error_message=lambda exc: f"Error importing session: {exc}",
+    ))
@@ -1,12 +1,15 @@
 from flask import Blueprint, request, jsonify
-from pydantic import BaseModel, field_validator
+from pydantic import BaseModel, Field, field_validator
 from typing import Optional
-import base64
-import requests
 
 from ..errors import BadRequestError
 from ..middleware import admin_auth_required
 from ..services.instagram_client import resume_session
+from ..services.projections import parse_fields, select
+from ..services import media, message_index, operations, webhooks
+from ..utils import http_cache
+from ..utils.idempotency import idempotent
+from ..utils.json_provider import json_response
 
 bp = Blueprint("dm", __name__)
 
@@ -18,6 +21,17 @@ class SendDMBody(BaseModel):
 class InboxBody(BaseModel):
     username: str
 
+class SearchQuery(BaseModel):
+    username: str
+    q: str = Field(min_length=1, max_length=500)
+    threadId: Optional[str] = None
+    limit: int = Field(default=20, ge=1, le=message_index.SEARCH_MAX_LIMIT)
+    offset: int = Field(default=0, ge=0)
+
+class SyncIndexBody(BaseModel):
+    username: str
+    maxThreads: Optional[int] = Field(default=None, ge=1)
+
 class SendPhotoDMBody(BaseModel):
     username: str
     toUsername: str
@@ -33,6 +47,7 @@ class SendPhotoDMBody(BaseModel):
 
 @bp.post("/send")
 @admin_auth_required
+@idempotent
 def send_text_dm():
     """
     Send text DM
@@ -47,6 +62,12 @@ def send_text_dm():
     produces:
       - application/json
     parameters:
+      - in: header
+        name: Idempotency-Key
+        required: false
+        type: string
+        description: Client-generated key; a retry with the same key returns the first response instead of sending again
+        example: "6f1c2e0a-3b7d-4f55-9a0e-2d8e1c7b9f10"
       - in: body
         name: body
         description: Message data
@@ -79,6 +100,8 @@ def send_text_dm():
             message:
               type: string
               example: "DM sent"
+      202:
+        description: The worker was shutting down; the operation was queued (see /health/operations) and runs when a worker starts
       400:
         description: Error sending DM
         schema:
@@ -91,18 +114,23 @@ def send_text_dm():
         description: Missing or invalid authentication token
       403:
         description: Invalid token
+      409:
+        description: Idempotency-Key reused for a different request, or the original is still running
     """
     import asyncio
     body = SendDMBody.model_validate(request.get_json(force=True))
     try:
         client = asyncio.run(resume_session(body.username))
-        asyncio.run(client.send_text_dm(body.toUsername, body.message))
+        op = asyncio.run(operations.perform("dm.text", client, {"to": body.toUsername, "message": body.message}))
+        if op["status"] == operations.QUEUED:
+            return jsonify(operations.queued_body(op)), 202
         return jsonify({"message": "DM sent"})
     except Exception as exc:
         raise BadRequestError(f"Error sending DM: {exc}")
 
 @bp.get("/inbox")
 @admin_auth_required
+@http_cache.cached
 async def get_inbox():
     """
     Get message inbox
@@ -121,6 +149,12 @@ async def get_inbox():
         type: string
         description: Account username
         example: "my_account"
+      - in: query
+        name: fields
+        required: false
+        type: string
+        description: Comma-separated subset of thread fields to return (default all)
+        example: "thread_id,thread_title,last_message"
     responses:
       200:
         description: Conversation list returned
@@ -174,13 +208,16 @@ async def get_inbox():
     body = InboxBody.model_validate({"username": username})
     try:
         client = await resume_session(body.username)
-        threads = await client.inbox()
-        return jsonify(threads)
+        fields = parse_fields(request.args.get("fields"))
+        threads = await client.inbox(fields)
+        webhooks.inbox_changes(body.username, threads)
+        return json_response(select(threads, fields))
     except Exception as exc:
         raise BadRequestError(str(exc))
 
 @bp.post("/send-photo")
 @admin_auth_required
+@idempotent
 async def send_photo_dm():
     """
     Send image via DM (base64 or URL)
@@ -195,6 +232,12 @@ async def send_photo_dm():
     produces:
       - application/json
     parameters:
+      - in: header
+        name: Idempotency-Key
+        required: false
+        type: string
+        description: Client-generated key; a retry with the same key returns the first response instead of sending again
+        example: "6f1c2e0a-3b7d-4f55-9a0e-2d8e1c7b9f10"
       - in: body
         name: body
         description: Image data (base64 or URL)
@@ -230,6 +273,8 @@ async def send_photo_dm():
             message:
               type: string
               example: "Image sent successfully"
+      202:
+        description: The worker was shutting down; the operation was queued (see /health/operations) and runs when a worker starts
       400:
         description: Error sending image
         schema:
@@ -242,24 +287,23 @@ async def send_photo_dm():
         description: Missing or invalid authentication token
       403:
         description: Invalid token
+      409:
+        description: Idempotency-Key reused for a different request, or the original is still running
     """
     body = SendPhotoDMBody.model_validate(request.get_json(force=True))
     try:
         client = await resume_session(body.username)
-        if body.url:
-            resp = requests.get(body.url)
-            resp.raise_for_status()
-            await client.send_photo_dm_from_bytes(body.toUsername, resp.content)
-        else:
-            data_str = body.base64.split(",", 1)[1] if "," in body.base64 else body.base64
-            data = base64.b64decode(data_str)
-            await client.send_photo_dm_from_bytes(body.toUsername, data)
+        with media.ingest(body.base64, body.url) as staged:
+            op = await operations.perform("dm.photo", client, {"to": body.toUsername}, str(staged.path))
+        if op["status"] == operations.QUEUED:
+            return jsonify(operations.queued_body(op)), 202
         return jsonify({"message": "Image sent successfully"})
     except Exception as exc:
         raise BadRequestError(f"Error sending image via DM: {exc}")
 
 @bp.get("/thread/<threadId>")
 @admin_auth_required
+@http_cache.cached
 async def get_thread_messages(threadId: str):
     """
     Get conversation messages
@@ -277,6 +321,12 @@ async def get_thread_messages(threadId: str):
         name: username
         required: true
         schema: { type: string }
+      - in: query
+        name: fields
+        required: false
+        schema: { type: string }
+        description: Comma-separated subset of message fields to return (default all)
+        example: "id,text,timestamp"
     responses:
       200: { description: Messages returned }
     """
@@ -285,7 +335,130 @@ async def get_thread_messages(threadId: str):
         raise BadRequestError("username is required")
     try:
         client = await resume_session(username)
-        messages = await client.thread_messages(threadId.strip())
-        return jsonify(messages)
+        fields = parse_fields(request.args.get("fields"))
+        thread = await client.thread_messages(threadId.strip())
+        message_index.record_thread(username, thread["thread_id"], thread["messages"])
+        thread["messages"] = select(thread["messages"], fields)
+        return json_response(thread)
     except Exception as exc:
         raise BadRequestError(f"Error fetching thread messages {threadId}: {exc}")
+
+@bp.get("/search")
+@admin_auth_required
+def search_messages():
+    """
+    Search DM messages
+    ---
+    tags: [DM]
+    summary: Full-text search over the account's indexed messages
+    description: >
+      Answers from the local message index, without calling Instagram. Messages
+      are indexed whenever /dm/thread/<threadId> is fetched and by
+      POST /dm/search/sync. Every word must match (accents and case are ignored);
+      end a word with * for a prefix match. Best matches come first.
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: username
+        required: true
+        schema: { type: string }
+      - in: query
+        name: q
+        required: true
+        schema: { type: string }
+        example: "order 10482"
+      - in: query
+        name: threadId
+        required: false
+        schema: { type: string }
+        description: Only search this thread
+      - in: query
+        name: limit
+        required: false
+        schema: { type: integer }
+        description: Results per page (default 20, max 100)
+      - in: query
+        name: offset
+        required: false
+        schema: { type: integer }
+        description: Value of next_offset from the previous page
+    responses:
+      200:
+        description: Matching messages
+        schema:
+          type: object
+          properties:
+            total: { type: integer }
+            next_offset: { type: integer }
+            results:
+              type: array
+              items:
+                type: object
+                properties:
+                  id: { type: string }
+                  thread_id: { type: string }
+                  user_id: { type: string }
+                  timestamp: { type: integer }
+                  text: { type: string }
+                  snippet: { type: string, example: "your [order] [10482] ships tomorrow" }
+                  score: { type: number }
+            index:
+              type: object
+              description: Indexed messages/threads for the account and when it was last synced
+      400:
+        description: Missing or invalid parameters
+    """
+    try:
+        query = SearchQuery.model_validate(request.args.to_dict())
+        result = message_index.search(query.username, query.q, query.threadId, query.limit, query.offset)
+    except ValueError as exc:
+        raise BadRequestError(str(exc))
+    result["index"] = message_index.stats(query.username)
+    return jsonify(result)
+
+@bp.post("/search/sync")
+@admin_auth_required
+async def sync_message_index():
+    """
+    Index the account's threads
+    ---
+    tags: [DM]
+    summary: Fetch inbox threads with new messages into the search index
+    description: >
+      Only threads whose last message is newer than what is already indexed are fetched,
+      paging back until the newest indexed message (at most MESSAGE_SYNC_MAX_MESSAGES per thread).
+    security:
+      - bearerAuth: []
+    consumes:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            username: { type: string, example: "my_account" }
+            maxThreads: { type: integer, description: "Only the most recent N inbox threads" }
+          required: [username]
+    responses:
+      200:
+        description: Sync counts
+        schema:
+          type: object
+          properties:
+            threads: { type: integer }
+            fetched: { type: integer }
+            unchanged: { type: integer }
+            failed: { type: integer }
+            truncated: { type: integer, description: "Threads with more new messages than MESSAGE_SYNC_MAX_MESSAGES" }
+            messages: { type: integer, description: "Messages newly indexed" }
+      400:
+        description: Session not found or Instagram error
+    """
+    body = SyncIndexBody.model_validate(request.get_json(force=True))
+    try:
+        return jsonify(await message_index.sync_account(body.username, body.maxThreads))
+    except Exception as exc:
+        raise BadRequestError(f"Error syncing message index: {exc}")
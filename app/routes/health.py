@@ -0,0 +1,223 @@
+import math
+import os
+import time
+
+from flask import Blueprint, g, request, jsonify
+from ..middleware import admin_auth_required, current_api_key
+from ..errors import BadRequestError
+from ..services import circuit_breaker, operations, webhooks
+from ..utils import admission, lifecycle
+from ..utils.metrics import INSTAGRAM_IN_FLIGHT
+from ..utils.state_store import get_store
+
+bp = Blueprint("health", __name__)
+
+_started = time.time()
+# Share of the webhook queue above which the worker stops reporting ready
+READY_WEBHOOK_QUEUE_RATIO = float(os.getenv("READY_WEBHOOK_QUEUE_RATIO", "0.9"))
+
+
+@bp.get("/healthz")
+def healthz():
+    """
+    Liveness
+    ---
+    tags: [Health]
+    summary: The worker process is up and answering
+    description: >
+      Never checks dependencies, so a slow store or Instagram outage does not get
+      the worker restarted. Use /readyz to decide whether to send it traffic.
+    security: []
+    responses:
+      200:
+        description: Alive
+        schema:
+          type: object
+          properties:
+            status: { type: string, example: ok }
+            pid: { type: integer }
+            uptime: { type: number, description: "Seconds since the app was loaded" }
+    """
+    return jsonify({"status": "ok", "pid": os.getpid(), "uptime": round(time.time() - _started, 1)})
+
+
+def _store_check():
+    started = time.perf_counter()
+    try:
+        ok = get_store().ping()
+    except Exception:
+        ok = False
+    return {"ok": ok, "backend": type(get_store()).__name__,
+            "ms": round((time.perf_counter() - started) * 1000, 2)}
+
+
+@bp.get("/readyz")
+def readyz():
+    """
+    Readiness
+    ---
+    tags: [Health]
+    summary: Whether this worker should receive traffic
+    description: >
+      Not ready (503 with Retry-After) while the worker drains for a restart,
+      when the session store does not answer,
+      the worker is at its in-flight limit or refused a request for it in the last
+      READY_SHED_WINDOW seconds, this probe itself waited longer than
+      ADMISSION_MAX_QUEUE_MS in front of it (with TRUST_QUEUE_HEADER), the global Instagram circuit is open, or the
+      webhook queue is nearly full. Every check is per worker process.
+    security: []
+    responses:
+      200:
+        description: Ready
+        schema:
+          type: object
+          properties:
+            status: { type: string, enum: [ready, unavailable] }
+            pid: { type: integer }
+            checks:
+              type: object
+              properties:
+                draining: { type: object, description: "ok is false once the worker got SIGTERM" }
+                store: { type: object, description: "ok, backend, ms (ping time)" }
+                admission: { type: object, description: "ok, in_flight, limit, admitted, shed, shedding, queue_ms" }
+                circuit: { type: object, description: "ok, state of the global breaker" }
+                webhook_queue: { type: object, description: "ok, depth, size" }
+                instagram: { type: object, description: "in_flight instagrapi calls (informational)" }
+      503:
+        description: Not ready, same body
+    """
+    load = admission.controller.as_dict()
+    # The probe's own wait in front of the worker is the backlog it would add to
+    waited = g.get("queue_seconds")
+    queued_ms = round(waited * 1000, 1) if waited is not None else None
+    backlogged = bool(queued_ms and admission.ADMISSION_MAX_QUEUE_MS and queued_ms > admission.ADMISSION_MAX_QUEUE_MS)
+    circuit = circuit_breaker.global_state()
+    depth = webhooks.dispatcher.queued()
+    checks = {
+        "draining": {"ok": not lifecycle.draining()},
+        "store": _store_check(),
+        "admission": {"ok": not (load["shedding"] or backlogged) and
+                      (not load["limit"] or load["in_flight"] < load["limit"]), **load, "queue_ms": queued_ms},
+        "circuit": {"ok": circuit["state"] != circuit_breaker.OPEN, "state": circuit["state"]},
+        "webhook_queue": {"ok": depth < webhooks.WEBHOOK_QUEUE_SIZE * READY_WEBHOOK_QUEUE_RATIO,
+                          "depth": depth, "size": webhooks.WEBHOOK_QUEUE_SIZE},
+        "instagram": {"ok": True, "in_flight": int(INSTAGRAM_IN_FLIGHT.get())},
+    }
+    ready = all(check["ok"] for check in checks.values())
+    response = jsonify({"status": "ready" if ready else "unavailable", "pid": os.getpid(), "checks": checks})
+    if ready:
+        return response
+    response.headers["Retry-After"] = str(max(admission.ADMISSION_RETRY_AFTER, math.ceil(circuit.get("retry_after", 0))))
+    return response, 503
+
+
+def _visible_accounts():
+    # Scoped keys only see their own accounts; None means every account
+    key = current_api_key()
+    return key.usernames if key is not None and key.scoped else None
+
+
+@bp.get("/health/circuits")
+@admin_auth_required
+def circuits():
+    """
+    Circuit breaker state
+    ---
+    tags: [Health]
+    summary: Circuit breakers guarding Instagram calls in this worker
+    description: >
+      Breakers exist per account, per proxy and globally, and are kept per
+      worker process. "open" breakers fail calls immediately with 503 and a
+      Retry-After header; "half_open" ones are letting a probe call through.
+      Only breakers that are not closed or saw failures recently are listed
+      unless all=true. Keys scoped to some accounts only see those accounts' breakers.
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: all
+        required: false
+        schema: { type: boolean }
+        description: Also list healthy breakers
+    responses:
+      200:
+        description: Breaker states
+        schema:
+          type: object
+          properties:
+            enabled: { type: boolean }
+            pid: { type: integer }
+            global:
+              type: object
+              properties:
+                state: { type: string, enum: [closed, open, half_open] }
+                calls: { type: integer, description: "Calls in the current window" }
+                failures: { type: integer }
+                trips: { type: integer, description: "Times it opened since the worker started" }
+                retry_after: { type: number }
+            proxies: { type: array, items: { type: object } }
+            accounts: { type: array, items: { type: object } }
+    """
+    include_closed = request.args.get("all", "").lower() in ("1", "true", "yes")
+    return jsonify(circuit_breaker.snapshot(include_closed, _visible_accounts()))
+
+
+@bp.get("/health/operations")
+@admin_auth_required
+def list_operations():
+    """
+    Operations journal
+    ---
+    tags: [Health]
+    summary: Publishes, sends and profile edits recorded by the journal
+    description: >
+      Every operation that changes something on Instagram is journaled.
+      "queued" ones were accepted while a worker was shutting down and run
+      when a worker starts; "interrupted" ones were still running when their
+      worker was stopped, so Instagram may or may not have applied them and
+      they are not retried automatically. Keys scoped to some accounts only
+      see (and count) those accounts' operations.
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: state
+        required: false
+        schema: { type: string, enum: [queued, running, done, failed, interrupted] }
+      - in: query
+        name: username
+        required: false
+        schema: { type: string }
+      - in: query
+        name: limit
+        required: false
+        schema: { type: integer, default: 50, maximum: 500 }
+    responses:
+      200:
+        description: Counts per state and the most recent operations
+        schema:
+          type: object
+          properties:
+            counts: { type: object }
+            operations:
+              type: array
+              items:
+                type: object
+                properties:
+                  id: { type: string }
+                  kind: { type: string, example: post.feed }
+                  account: { type: string }
+                  state: { type: string }
+                  attempts: { type: integer }
+                  error: { type: string }
+                  created_at: { type: number }
+                  updated_at: { type: number }
+    """
+    state = request.args.get("state")
+    if state and state not in operations.STATES:
+        raise BadRequestError(f"state must be one of {', '.join(operations.STATES)}")
+    try:
+        limit = min(max(int(request.args.get("limit", 50)), 1), 500)
+    except ValueError:
+        raise BadRequestError("limit must be an integer")
+    return jsonify(operations.list_operations(state, request.args.get("username"), limit, _visible_accounts()))
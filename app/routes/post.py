@@ -2,11 +2,11 @@
 from flask import Blueprint, request, jsonify
 from pydantic import BaseModel
 from typing import Optional
-import base64
-import requests
 from ..errors import BadRequestError
 from ..middleware import admin_auth_required
 from ..services.instagram_client import resume_session
+from ..services import media, operations
+from ..utils.idempotency import idempotent
 
 bp = Blueprint("post", __name__)
 
@@ -21,24 +21,9 @@ class PhotoStoryBody(BaseModel):
     url: Optional[str] = None
     base64: Optional[str] = None
 
-def buffer_from_source(b64: Optional[str], url: Optional[str]) -> bytes:
-    if b64:
-        try:
-            data = b64.split(",", 1)[1] if "," in b64 else b64
-            return base64.b64decode(data)
-        except Exception as exc:
-            raise BadRequestError(f"Error decoding base64: {exc}")
-    if url:
-        try:
-            r = requests.get(url, headers={"User-Agent": "Mozilla/5.0"})
-            r.raise_for_status()
-            return r.content
-        except Exception as exc:
-            raise BadRequestError(f"Error downloading media from URL: {exc}")
-    raise BadRequestError("Neither base64 nor url provided.")
-
 @bp.post("/photo-feed")
 @admin_auth_required
+@idempotent
 async def post_photo_feed():
     """
     Publish photo to feed
@@ -53,6 +38,12 @@ async def post_photo_feed():
     produces:
       - application/json
     parameters:
+      - in: header
+        name: Idempotency-Key
+        required: false
+        type: string
+        description: Client-generated key; a retry with the same key returns the first response instead of sending again
+        example: "6f1c2e0a-3b7d-4f55-9a0e-2d8e1c7b9f10"
       - in: body
         name: body
         description: Photo data (base64 or URL)
@@ -91,6 +82,8 @@ async def post_photo_feed():
             media:
               type: object
               description: Published media information
+      202:
+        description: The worker was shutting down; the operation was queued (see /health/operations) and runs when a worker starts
       400:
         description: Error publishing photo
         schema:
@@ -103,15 +96,19 @@ async def post_photo_feed():
         description: Missing or invalid authentication token
       403:
         description: Invalid token
+      409:
+        description: Idempotency-Key reused for a different request, or the original is still running
     """
     body = PhotoFeedBody.model_validate(request.get_json(force=True))
     try:
         if not body.base64 and not body.url:
             raise BadRequestError("You must provide either base64 or url")
         client = await resume_session(body.username)
-        buffer = buffer_from_source(body.base64, body.url)
-        result = await client.publish_photo(buffer, caption=body.caption)
-        return jsonify({"message": "Photo published to Feed", "media": result})
+        with media.ingest(body.base64, body.url) as staged:
+            op = await operations.perform("post.feed", client, {"caption": body.caption}, str(staged.path))
+        if op["status"] == operations.QUEUED:
+            return jsonify(operations.queued_body(op)), 202
+        return jsonify({"message": "Photo published to Feed", "media": op["result"]})
     except Exception as exc:
         raise BadRequestError(str(exc))
 
@@ -164,6 +161,8 @@ async def post_photo_story():
             media:
               type: object
               description: Published media information
+      202:
+        description: The worker was shutting down; the operation was queued (see /health/operations) and runs when a worker starts
       400:
         description: Error publishing story
         schema:
@@ -182,8 +181,10 @@ async def post_photo_story():
         if not body.base64 and not body.url:
             raise BadRequestError("You must provide either base64 or url")
         client = await resume_session(body.username)
-        buffer = buffer_from_source(body.base64, body.url)
-        result = await client.publish_story_photo(buffer)
-        return jsonify({"message": "Story published", "media": result})
+        with media.ingest(body.base64, body.url, max_size=media.STORY_MAX_SIZE) as staged:
+            op = await operations.perform("post.story", client, {}, str(staged.path))
+        if op["status"] == operations.QUEUED:
+            return jsonify(operations.queued_body(op)), 202
+        return jsonify({"message": "Story published", "media": op["result"]})
     except Exception as exc:
         raise BadRequestError(str(exc))
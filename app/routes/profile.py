@@ -1,12 +1,13 @@
 
-from flask import Blueprint, request, jsonify
-from pydantic import BaseModel, model_validator
-from typing import Optional
-import base64
-import requests
-from ..errors import BadRequestError
+from flask import Blueprint, Response, request, jsonify
+from pydantic import BaseModel, Field, field_validator, model_validator
+from datetime import datetime, timezone
+from typing import Literal, Optional
+from ..errors import BadRequestError, ResourceNotFoundError
 from ..middleware import admin_auth_required
 from ..services.instagram_client import resume_session
+from ..services import media, operations, profile_history, relations_export
+from ..utils import http_cache
 
 bp = Blueprint("profile", __name__)
 
@@ -25,6 +26,28 @@ class UpdateBioBody(BaseModel):
 class GetProfileBody(BaseModel):
     username: str
 
+class ExportQuery(BaseModel):
+    username: str
+    format: Literal["ndjson", "csv"] = "ndjson"
+    cursor: str = ""
+    limit: Optional[int] = Field(default=None, ge=1)
+    checkpoint: Optional[str] = Field(default=None, pattern=r"^[A-Za-z0-9_.-]{1,64}$")
+
+class HistoryQuery(BaseModel):
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    bucket: Optional[Literal["hour", "day", "week"]] = None
+
+    @field_validator("since", "until")
+    @classmethod
+    def as_utc(cls, v):
+        # Dates without an offset are UTC, not the server's local time
+        if v is not None and v.tzinfo is None:
+            return v.replace(tzinfo=timezone.utc)
+        return v
+
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
 @bp.post("/update-bio")
 @admin_auth_required
 async def update_bio():
@@ -75,6 +98,8 @@ async def update_bio():
             message:
               type: string
               example: "Bio and/or profile picture updated successfully"
+      202:
+        description: The worker was shutting down; the operation was queued (see /health/operations) and runs when a worker starts
       400:
         description: Error updating profile
         schema:
@@ -91,22 +116,22 @@ async def update_bio():
     body = UpdateBioBody.model_validate(request.get_json(force=True))
     try:
         client = await resume_session(body.username)
+        ops = []
         if body.bio:
-            await client.edit_bio(body.bio)
+            ops.append(await operations.perform("profile.bio", client, {"bio": body.bio}))
         if body.base64 or body.url:
-            if body.base64:
-                data = base64.b64decode(body.base64.split(",", 1)[1] if "," in body.base64 else body.base64)
-            else:
-                resp = requests.get(body.url)
-                resp.raise_for_status()
-                data = resp.content
-            await client.change_profile_picture(data)
+            with media.ingest(body.base64, body.url, max_size=media.PROFILE_MAX_SIZE) as staged:
+                ops.append(await operations.perform("profile.picture", client, {}, str(staged.path)))
+        queued = [op for op in ops if op["status"] == operations.QUEUED]
+        if queued:
+            return jsonify({**operations.queued_body(queued[0]), "operations": [op["id"] for op in queued]}), 202
         return jsonify({"message": "Bio and/or profile picture updated successfully"})
     except Exception as exc:
         raise BadRequestError(f"Error updating bio/picture: {exc}")
 
 @bp.get("/<targetUsername>")
 @admin_auth_required
+@http_cache.cached
 async def get_profile_by_username(targetUsername: str):
     """
     Get public data from an Instagram profile
@@ -129,6 +154,226 @@ async def get_profile_by_username(targetUsername: str):
     try:
         client = await resume_session(body.username)
         profile = await client.user_info(targetUsername)
+        profile_history.record(profile)
         return jsonify(profile)
     except Exception as exc:
         raise BadRequestError(str(exc))
+
+async def _export_relations(kind: str, targetUsername: str) -> Response:
+    try:
+        query = ExportQuery.model_validate(request.args.to_dict())
+    except ValueError as exc:
+        raise BadRequestError(str(exc))
+    if query.format == "csv" and not query.checkpoint:
+        # A CSV body can't carry the resume cursor, so progress must live server-side
+        raise BadRequestError("format=csv requires a checkpoint")
+    cursor = query.cursor
+    resumed = 0
+    if query.checkpoint and not cursor:
+        saved = relations_export.load_checkpoint(query.username, kind, targetUsername, query.checkpoint)
+        if saved and saved.get("done"):
+            raise BadRequestError("Checkpoint already completed; use a new checkpoint name to export again")
+        if saved:
+            cursor, resumed = saved["cursor"], saved.get("exported", 0)
+    try:
+        client = await resume_session(query.username)
+        user_id = await client.user_id(targetUsername)
+    except Exception as exc:
+        raise BadRequestError(f"Error exporting {kind}: {exc}")
+    body = relations_export.export(client, kind, targetUsername, user_id, query.format, cursor,
+                                   query.limit, query.checkpoint, resumed)
+    # Plain generator (see json_response): the body needs no request context
+    response = Response(body, mimetype=EXPORT_MIMETYPES[query.format])
+    response.headers["Content-Disposition"] = f'attachment; filename="{targetUsername}-{kind}.{query.format}"'
+    response.headers["X-Export-Start-Cursor"] = cursor
+    return response
+
+@bp.get("/<targetUsername>/followers")
+@admin_auth_required
+async def export_followers(targetUsername: str):
+    """
+    Export followers
+    ---
+    tags: [Profile]
+    summary: Stream every follower of an account as NDJSON or CSV
+    description: >
+      Pages through the follower list and streams it as it is fetched, so any
+      size of list can be exported. NDJSON ends with a {"summary": {...}} line
+      whose `cursor` resumes the export (empty when done); if Instagram fails
+      midway the last line is {"error", "cursor"} instead. With `checkpoint`,
+      progress is also saved server-side (after each page is sent) and a new
+      request with the same checkpoint name continues where the last one
+      stopped. CSV requires `checkpoint`; if Instagram fails midway the CSV
+      response is aborted rather than ended, so it never looks complete.
+    security:
+      - bearerAuth: []
+    produces:
+      - application/x-ndjson
+      - text/csv
+    parameters:
+      - name: targetUsername
+        in: path
+        required: true
+        schema: { type: string }
+      - in: query
+        name: username
+        required: true
+        schema: { type: string }
+        description: Account used to fetch the list
+      - in: query
+        name: format
+        required: false
+        schema: { type: string, enum: [ndjson, csv] }
+        description: Output format (default ndjson); csv requires checkpoint
+      - in: query
+        name: cursor
+        required: false
+        schema: { type: string }
+        description: Resume from this cursor (from a previous summary line)
+      - in: query
+        name: limit
+        required: false
+        schema: { type: integer }
+        description: Stop after about this many users (whole pages, so the cursor stays exact)
+      - in: query
+        name: checkpoint
+        required: false
+        schema: { type: string }
+        description: Name under which progress is saved and resumed
+    responses:
+      200:
+        description: >
+          Stream of users, e.g. {"pk": "123", "username": "a", "full_name": "A",
+          "is_private": false, "profile_pic_url": "..."} per line
+      400:
+        description: Invalid parameters, session not found or target not found
+      401:
+        description: Missing or invalid authentication token
+      403:
+        description: Invalid token
+    """
+    return await _export_relations("followers", targetUsername)
+
+@bp.get("/<targetUsername>/following")
+@admin_auth_required
+async def export_following(targetUsername: str):
+    """
+    Export following
+    ---
+    tags: [Profile]
+    summary: Stream every account followed by an account as NDJSON or CSV
+    description: Same paging, formats, cursor and checkpoint behaviour as the followers export.
+    security:
+      - bearerAuth: []
+    produces:
+      - application/x-ndjson
+      - text/csv
+    parameters:
+      - name: targetUsername
+        in: path
+        required: true
+        schema: { type: string }
+      - in: query
+        name: username
+        required: true
+        schema: { type: string }
+        description: Account used to fetch the list
+      - in: query
+        name: format
+        required: false
+        schema: { type: string, enum: [ndjson, csv] }
+      - in: query
+        name: cursor
+        required: false
+        schema: { type: string }
+      - in: query
+        name: limit
+        required: false
+        schema: { type: integer }
+      - in: query
+        name: checkpoint
+        required: false
+        schema: { type: string }
+    responses:
+      200: { description: Stream of users, one per line }
+      400: { description: Invalid parameters, session not found or target not found }
+      401: { description: Missing or invalid authentication token }
+      403: { description: Invalid token }
+    """
+    return await _export_relations("following", targetUsername)
+
+@bp.get("/<targetUsername>/history")
+@admin_auth_required
+def get_profile_history(targetUsername: str):
+    """
+    Profile metrics over time
+    ---
+    tags: [Profile]
+    summary: Follower, following and media counts recorded for a profile
+    description: >
+      Served from the local snapshot store, without calling Instagram. Snapshots
+      are taken by the background collector (every managed account and
+      SNAPSHOT_TARGETS, every SNAPSHOT_INTERVAL seconds) and whenever
+      /profile/<targetUsername> is fetched. `delta` is last minus first point of
+      the window, `aggregates` are min/max/avg over every snapshot in it.
+    security:
+      - bearerAuth: []
+    parameters:
+      - name: targetUsername
+        in: path
+        required: true
+        schema: { type: string }
+      - in: query
+        name: since
+        required: false
+        schema: { type: string, format: date-time }
+        description: Window start (ISO date-time, UTC unless it has an offset, or unix seconds)
+      - in: query
+        name: until
+        required: false
+        schema: { type: string, format: date-time }
+        description: Window end, exclusive (default now)
+      - in: query
+        name: bucket
+        required: false
+        schema: { type: string, enum: [hour, day, week] }
+        description: Return only the last snapshot of each hour/day/week
+    responses:
+      200:
+        description: Snapshots, deltas and aggregates
+        schema:
+          type: object
+          properties:
+            username: { type: string }
+            pk: { type: string }
+            snapshots: { type: integer }
+            points:
+              type: array
+              items:
+                type: object
+                properties:
+                  ts: { type: integer }
+                  follower_count: { type: integer }
+                  following_count: { type: integer }
+                  media_count: { type: integer }
+            delta: { type: object }
+            per_day: { type: object }
+            aggregates: { type: object }
+      400:
+        description: Invalid parameters
+      404:
+        description: No snapshots recorded for this profile
+    """
+    try:
+        query = HistoryQuery.model_validate(request.args.to_dict())
+    except ValueError as exc:
+        raise BadRequestError(str(exc))
+    result = profile_history.history(
+        targetUsername,
+        since=int(query.since.timestamp()) if query.since else None,
+        until=int(query.until.timestamp()) if query.until else None,
+        bucket=query.bucket,
+    )
+    if result is None:
+        raise ResourceNotFoundError("No snapshots recorded for this profile")
+    return jsonify(result)
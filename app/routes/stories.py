@@ -1,9 +1,15 @@
 
-from flask import Blueprint, request, jsonify
-from pydantic import BaseModel
+from datetime import datetime
+from flask import Blueprint, Response, request, jsonify
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional
 from ..errors import BadRequestError
 from ..middleware import admin_auth_required
+from ..services import media_archive
 from ..services.instagram_client import resume_session
+from ..services.projections import parse_fields, select
+from ..utils import http_cache
+from ..utils.json_provider import dumps_bytes
 
 bp = Blueprint("stories", __name__)
 
@@ -11,8 +17,17 @@ class StoriesBody(BaseModel):
     username: str
     targetUsername: str
 
+class ArchiveBody(BaseModel):
+    username: str
+    targets: List[str] = Field(min_length=1, max_length=50)
+    include: List[Literal["stories", "posts"]] = ["stories", "posts"]
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    max_posts: int = Field(default=media_archive.ARCHIVE_MAX_POSTS, ge=0)
+
 @bp.get("/")
 @admin_auth_required
+@http_cache.cached
 async def get_user_stories():
     """
     List user stories
@@ -37,6 +52,12 @@ async def get_user_stories():
         schema: { type: string }
         description: Username of the target account to get stories from
         example: "target_user"
+      - in: query
+        name: fields
+        required: false
+        schema: { type: string }
+        description: Comma-separated subset of story fields to return (default all)
+        example: "id,media_url"
     responses:
       200:
         description: Stories retrieved successfully
@@ -77,6 +98,82 @@ async def get_user_stories():
     try:
         client = await resume_session(body.username)
         items = await client.user_stories(body.targetUsername)
-        return jsonify(items)
+        return jsonify(select(items, parse_fields(request.args.get("fields"))))
+    except Exception as exc:
+        raise BadRequestError(str(exc))
+
+@bp.post("/archive")
+@admin_auth_required
+async def archive_media():
+    """
+    Archive stories and posts to disk
+    ---
+    tags: [Stories]
+    summary: Download full-resolution stories and posts of target accounts
+    description: >
+      Enumerates the stories and posts of each target taken inside the date window and
+      downloads their full-resolution media concurrently into ARCHIVE_DIR/<target>/.
+      Each target keeps a manifest.json keyed by media id, so repeated runs only fetch
+      new items; ARCHIVE_DIR/index.json summarizes every archived target. The response
+      is NDJSON, one line per target as it finishes, then {"summary": {...}}.
+    security:
+      - bearerAuth: []
+    consumes:
+      - application/json
+    produces:
+      - application/x-ndjson
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            username:
+              type: string
+              description: Account used to fetch the media
+              example: "my_account"
+            targets:
+              type: array
+              items: { type: string }
+              example: ["target_user"]
+            include:
+              type: array
+              items: { type: string, enum: [stories, posts] }
+              description: What to archive (default both)
+            since:
+              type: string
+              format: date-time
+              description: Only media taken at or after this time (UTC if no offset)
+              example: "2025-01-01T00:00:00Z"
+            until:
+              type: string
+              format: date-time
+              description: Only media taken before this time
+            max_posts:
+              type: integer
+              description: Max posts enumerated per target (default ARCHIVE_MAX_POSTS)
+          required: [username, targets]
+    responses:
+      200:
+        description: >
+          NDJSON stream, e.g. {"target": "a", "status": "ok", "found": 12, "skipped": 10,
+          "downloaded": 2, "failed": 0, "bytes": 734003} / {"summary": {...}}
+      400:
+        description: Invalid body or session not found
+      401:
+        description: Missing or invalid authentication token
+      403:
+        description: Invalid token
+    """
+    try:
+        body = ArchiveBody.model_validate(request.get_json(force=True))
+    except ValueError as exc:
+        raise BadRequestError(str(exc))
+    try:
+        client = await resume_session(body.username)
     except Exception as exc:
         raise BadRequestError(str(exc))
+    lines = media_archive.run_archive(client, body.targets, body.include, body.since, body.until, body.max_posts)
+    # Plain generator (see json_response): targets are archived while the response streams
+    return Response((dumps_bytes(line) + b"\n" for line in lines), mimetype="application/x-ndjson")
@@ -0,0 +1,174 @@
+from flask import Blueprint, request, jsonify
+from pydantic import BaseModel, field_validator
+from typing import List, Optional
+from ..errors import BadRequestError, ForbiddenError, ResourceNotFoundError
+from ..middleware import admin_auth_required, current_api_key
+from ..services import webhooks
+
+bp = Blueprint("webhooks", __name__)
+
+class WebhookBody(BaseModel):
+    url: str
+    username: Optional[str] = None
+    events: List[str] = list(webhooks.EVENTS)
+
+    @field_validator("url")
+    @classmethod
+    def validate_url(cls, v):
+        webhooks.check_url(v)
+        return v
+
+    @field_validator("events")
+    @classmethod
+    def validate_events(cls, v):
+        unknown = sorted(set(v) - set(webhooks.EVENTS))
+        if unknown or not v:
+            raise ValueError(f"events must be a non-empty subset of {', '.join(webhooks.EVENTS)}")
+        return v
+
+def _visible_subscription(webhook_id: str) -> dict:
+    sub = webhooks.get_subscription(webhook_id)
+    # Keys scoped to some accounts don't see other tenants' webhooks
+    if not sub or not current_api_key().allows(sub.get("username")):
+        raise ResourceNotFoundError("Webhook not found")
+    return sub
+
+@bp.post("/")
+@admin_auth_required
+def create_webhook():
+    """
+    Register a webhook
+    ---
+    tags: [Webhooks]
+    summary: Register a URL for account events
+    description: >
+      Events are POSTed in batches as {"delivery_id", "attempt", "events": [...]}.
+      Each delivery is signed: X-Pipegram-Signature is "sha256=" + HMAC-SHA256 of
+      "<X-Pipegram-Timestamp>.<raw body>" with the secret returned here (shown only once).
+      Failed deliveries (network errors, 5xx, 429) are retried with exponential backoff.
+      URLs whose host resolves to a loopback, private, link-local or otherwise
+      non-public address are refused unless listed in WEBHOOK_ALLOWED_HOSTS;
+      redirects are not followed.
+    security:
+      - bearerAuth: []
+    consumes:
+      - application/json
+    produces:
+      - application/json
+    parameters:
+      - in: body
+        name: body
+        required: true
+        schema:
+          type: object
+          properties:
+            url:
+              type: string
+              example: "https://example.com/hooks/instagram"
+            username:
+              type: string
+              description: Account to watch; omit for every account
+              example: "my_account"
+            events:
+              type: array
+              items:
+                type: string
+                enum: [dm.received, post.published, session.expired]
+              description: Event types to deliver (default all)
+          required:
+            - url
+    responses:
+      201:
+        description: Webhook registered
+        schema:
+          type: object
+          properties:
+            id: { type: string }
+            url: { type: string }
+            username: { type: string }
+            events: { type: array, items: { type: string } }
+            secret: { type: string, description: "Signing secret, returned only on creation" }
+      400:
+        description: Invalid or non-public URL, or unknown event type
+      401:
+        description: Missing or invalid authentication token
+      403:
+        description: Invalid token, or the account is outside the API key's scope
+    """
+    try:
+        body = WebhookBody.model_validate(request.get_json(force=True))
+    except ValueError as exc:
+        raise BadRequestError(str(exc))
+    if not current_api_key().allows(body.username):
+        raise ForbiddenError("This API key can only watch its own accounts")
+    sub = webhooks.create_subscription(body.url, body.username, body.events)
+    return jsonify(sub), 201
+
+@bp.get("/")
+@admin_auth_required
+def list_webhooks():
+    """
+    List webhooks
+    ---
+    tags: [Webhooks]
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: query
+        name: username
+        required: false
+        schema: { type: string }
+        description: Only webhooks that receive this account's events
+    responses:
+      200: { description: Registered webhooks (without secrets) }
+    """
+    username = request.args.get("username")
+    key = current_api_key()
+    return jsonify([webhooks.public_view(s) for s in webhooks.list_subscriptions(username)
+                    if key.allows(s.get("username"))])
+
+@bp.delete("/<webhookId>")
+@admin_auth_required
+def delete_webhook(webhookId: str):
+    """
+    Delete a webhook
+    ---
+    tags: [Webhooks]
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: path
+        name: webhookId
+        required: true
+        schema: { type: string }
+    responses:
+      200: { description: Webhook removed }
+      404: { description: Webhook not found }
+    """
+    _visible_subscription(webhookId)
+    if webhooks.delete_subscription(webhookId):
+        return jsonify({"message": "Webhook removed"})
+    raise ResourceNotFoundError("Webhook not found")
+
+@bp.post("/<webhookId>/test")
+@admin_auth_required
+def test_webhook(webhookId: str):
+    """
+    Send a test event
+    ---
+    tags: [Webhooks]
+    security:
+      - bearerAuth: []
+    parameters:
+      - in: path
+        name: webhookId
+        required: true
+        schema: { type: string }
+    responses:
+      202: { description: webhook.test event queued }
+      404: { description: Webhook not found }
+    """
+    sub = _visible_subscription(webhookId)
+    if not webhooks.send_test(sub):
+        raise BadRequestError("Webhook queue is full, try again later")
+    return jsonify({"message": "Test event queued"}), 202
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import threading
+from collections import defaultdict
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from itertools import zip_longest
+from typing import Any, Callable, Dict, Iterator, List, Optional, Set
+
+from . import session_status
+from .proxy_pool import pool as proxy_pool
+from .session_adapter import InstagramSessionAdapter
+from .instagram_client import login_with_password
+from ..utils import session_manager
+
+BULK_MAX_PARALLEL = int(os.getenv("BULK_MAX_PARALLEL", "8"))
+BULK_PER_PROXY_PARALLEL = int(os.getenv("BULK_PER_PROXY_PARALLEL", "2"))
+BULK_WRITE_BATCH = int(os.getenv("BULK_WRITE_BATCH", "50"))
+
+
+async def _login_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    _, session = await login_with_password(entry["username"], entry["password"], entry.get("proxy"), persist=False)
+    return {"session": session}
+
+
+async def _import_entry(entry: Dict[str, Any]) -> Dict[str, Any]:
+    # Verify straight from the submitted session; it is written with the batch
+    session = entry["session"]
+    client = InstagramSessionAdapter(username=entry["username"], proxy=session.get("proxy"))
+    await client.deserialize(session)
+    user = await client.current_user()
+    return {"session": session, "logged_in_user": user}
+
+
+def _spread_by_proxy(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Interleave accounts of different proxies so no proxy gets a burst of logins
+    groups: Dict[Optional[str], List[Dict[str, Any]]] = defaultdict(list)
+    for entry in entries:
+        groups[entry.get("proxy")].append(entry)
+    return [e for batch in zip_longest(*groups.values()) for e in batch if e is not None]
+
+
+def run_bulk(
+    entries: List[Dict[str, Any]],
+    mode: str,
+    parallelism: Optional[int] = None,
+    include_session: bool = False,
+    error_message: Callable[[Exception], str] = str,
+) -> Iterator[Dict[str, Any]]:
+    """Process accounts concurrently and yield one result per account as it finishes."""
+    worker = _login_entry if mode == "login" else _import_entry
+    parallelism = max(1, min(parallelism or BULK_MAX_PARALLEL, BULK_MAX_PARALLEL))
+
+    for entry in entries:
+        if mode == "login" and not entry.get("proxy"):
+            entry["proxy"] = proxy_pool.assign(entry["username"])
+        elif mode == "import":
+            entry["proxy"] = entry["session"].get("proxy")
+    proxy_slots = {
+        proxy: threading.Semaphore(BULK_PER_PROXY_PARALLEL) for proxy in {e.get("proxy") for e in entries}
+    }
+
+    def process(entry: Dict[str, Any]) -> Dict[str, Any]:
+        with proxy_slots[entry.get("proxy")]:
+            return asyncio.run(worker(entry))
+
+    # Accounts that logged in / verified, waiting for their session to be written
+    pending: Dict[str, Dict[str, Any]] = {}
+    counts = {"total": len(entries), "ok": 0, "failed": 0, "saved": 0}
+
+    def flush() -> List[Dict[str, Any]]:
+        """Save the pending sessions in one batch and return their result lines:
+        an account is only reported ok once its session is stored."""
+        if not pending:
+            return []
+        results = dict(pending)
+        pending.clear()
+        try:
+            session_manager.save_sessions({username: r["session"] for username, r in results.items()})
+            for username in results:
+                session_status.set_status(username, session_status.ACTIVE)
+        except Exception as exc:
+            counts["failed"] += len(results)
+            return [{"username": username, "status": "error", "error": f"Error saving session: {exc}"}
+                    for username in results]
+        counts["ok"] += len(results)
+        counts["saved"] += len(results)
+        lines = []
+        for username, result in results.items():
+            line: Dict[str, Any] = {"username": username, "status": "ok"}
+            if "logged_in_user" in result:
+                line["logged_in_user"] = result["logged_in_user"]
+            if include_session:
+                line["session"] = result["session"]
+            lines.append(line)
+        return lines
+
+    executor = ThreadPoolExecutor(max_workers=parallelism, thread_name_prefix=f"bulk-{mode}")
+    futures: Dict[Future, Dict[str, Any]] = {}
+    settled: Set[Future] = set()
+    try:
+        for entry in _spread_by_proxy(entries):
+            futures[executor.submit(process, entry)] = entry
+        remaining = set(futures)
+        while remaining:
+            # Write as soon as nothing else has finished, so lines keep flowing;
+            # under load the batch grows up to BULK_WRITE_BATCH
+            done, remaining = wait(remaining, timeout=0 if pending else None, return_when=FIRST_COMPLETED)
+            if not done:
+                yield from flush()
+                continue
+            for future in done:
+                settled.add(future)
+                entry = futures[future]
+                try:
+                    pending[entry["username"]] = future.result()
+                except Exception as exc:
+                    counts["failed"] += 1
+                    yield {"username": entry["username"], "status": "error", "error": error_message(exc)}
+            if len(pending) >= BULK_WRITE_BATCH:
+                yield from flush()
+        yield from flush()
+    finally:
+        # Client went away: logins already running still succeed on Instagram,
+        # so wait for them and save every session we got; only the entries not
+        # started yet are dropped
+        executor.shutdown(wait=True, cancel_futures=True)
+        for future in futures.keys() - settled:
+            if not future.cancelled() and future.exception() is None:
+                pending[futures[future]["username"]] = future.result()
+        flush()
+    yield {"summary": counts}
@@ -0,0 +1,229 @@
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from ..errors import CircuitOpenError
+from ..utils.metrics import CIRCUIT_REJECTIONS, CIRCUIT_TRANSITIONS
+from .proxy_pool import is_proxy_error
+
+# Fail fast instead of letting every worker block on a degraded Instagram or
+# proxy. Breakers are per process (cheap, no shared-state round trip) at three
+# scopes: each account, each proxy, and everything. A breaker opens when, over
+# the last CIRCUIT_WINDOW seconds, at least `min_calls` calls were made and
+# CIRCUIT_FAILURE_RATIO of them failed; after CIRCUIT_OPEN_SECONDS one probe
+# call is let through (half-open) and its outcome closes or re-opens it.
+CIRCUIT_ENABLED = os.getenv("CIRCUIT_ENABLED", "true").lower() in ("1", "true", "yes")
+CIRCUIT_WINDOW = float(os.getenv("CIRCUIT_WINDOW", "30"))
+CIRCUIT_FAILURE_RATIO = float(os.getenv("CIRCUIT_FAILURE_RATIO", "0.5"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+CIRCUIT_GLOBAL_MIN_CALLS = int(os.getenv("CIRCUIT_GLOBAL_MIN_CALLS", "50"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_BUCKETS = 10
+
+# Errors that mean "Instagram answered, the request was just wrong" do not
+# count against a breaker (matched by class name, as in session_status)
+_CALLER_ERRORS = {
+    "UserNotFound", "ClientNotFoundError", "MediaNotFound", "StoryNotFound", "DirectThreadNotFound",
+    "PrivateAccount", "ValidationError", "ValueError", "TypeError", "KeyError",
+}
+
+
+def counts_as_failure(exc: BaseException) -> bool:
+    return not any(cls.__name__ in _CALLER_ERRORS for cls in type(exc).__mro__)
+
+
+class CircuitBreaker:
+    __slots__ = ("name", "min_calls", "state", "opened_at", "trips", "_buckets", "_probe_at", "_lock")
+
+    def __init__(self, name: str, min_calls: int) -> None:
+        self.name = name
+        self.min_calls = min_calls
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.trips = 0
+        # Ring of [bucket number, calls, failures], each CIRCUIT_WINDOW / _BUCKETS wide
+        self._buckets = [[-1, 0, 0] for _ in range(_BUCKETS)]
+        self._probe_at: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def _totals(self, now: float) -> Tuple[int, int]:
+        current = int(now * _BUCKETS / CIRCUIT_WINDOW)
+        live = [b for b in self._buckets if current - b[0] < _BUCKETS]
+        return sum(b[1] for b in live), sum(b[2] for b in live)
+
+    def _transition(self, state: str, now: float) -> None:
+        self.state = state
+        if state == OPEN:
+            self.opened_at = now
+            self.trips += 1
+        elif state == CLOSED:
+            self._buckets = [[-1, 0, 0] for _ in range(_BUCKETS)]
+        self._probe_at = None
+        CIRCUIT_TRANSITIONS.inc(scope=self.name.split(":", 1)[0], state=state)
+
+    def allow(self, claim: bool = True) -> Optional[float]:
+        """None when the call may proceed, otherwise seconds until the next probe.
+        With claim=False only checks, without taking the half-open probe slot."""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == CLOSED:
+                return None
+            if self.state == OPEN:
+                remaining = self.opened_at + CIRCUIT_OPEN_SECONDS - now
+                if remaining > 0:
+                    return remaining
+                if not claim:
+                    return None
+                self._transition(HALF_OPEN, now)
+            # Half-open: a single probe at a time; a probe that never reported
+            # back (e.g. its worker died) is replaced after a while
+            if self._probe_at is None or now - self._probe_at > CIRCUIT_OPEN_SECONDS:
+                if claim:
+                    self._probe_at = now
+                return None
+            return 1.0
+
+    def release_probe(self) -> None:
+        """Give the half-open probe slot back without deciding anything."""
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._probe_at = None
+
+    def record(self, ok: bool) -> None:
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED if ok else OPEN, now)
+                return
+            if self.state == OPEN:
+                return
+            number = int(now * _BUCKETS / CIRCUIT_WINDOW)
+            bucket = self._buckets[number % _BUCKETS]
+            if bucket[0] != number:
+                bucket[:] = [number, 0, 0]
+            bucket[1] += 1
+            if not ok:
+                bucket[2] += 1
+                calls, failures = self._totals(now)
+                if calls >= self.min_calls and failures >= calls * CIRCUIT_FAILURE_RATIO:
+                    self._transition(OPEN, now)
+
+    def as_dict(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            calls, failures = self._totals(now)
+            data: Dict[str, Any] = {"name": self.name, "state": self.state, "calls": calls,
+                                    "failures": failures, "trips": self.trips}
+            if self.state == OPEN:
+                data["retry_after"] = round(max(0.0, self.opened_at + CIRCUIT_OPEN_SECONDS - now), 1)
+            return data
+
+
+_global = CircuitBreaker("global", CIRCUIT_GLOBAL_MIN_CALLS)
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def _breaker(name: str) -> CircuitBreaker:
+    breaker = _breakers.get(name)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(name, CircuitBreaker(name, CIRCUIT_MIN_CALLS))
+    return breaker
+
+
+def _scopes(username: str, proxy: Optional[str]) -> List[CircuitBreaker]:
+    scopes = [_global, _breaker(f"account:{username}")]
+    if proxy:
+        scopes.insert(1, _breaker(f"proxy:{proxy}"))
+    return scopes
+
+
+def _reject(breaker: CircuitBreaker, retry_after: float) -> None:
+    scope = breaker.name.split(":", 1)[0]
+    CIRCUIT_REJECTIONS.inc(scope=scope)
+    raise CircuitOpenError(f"Circuit open for {_public_name(breaker.name)}; Instagram calls are "
+                           f"paused after repeated failures", retry_after=math.ceil(retry_after), scope=scope)
+
+
+def before_call(username: str, proxy: Optional[str]) -> None:
+    if not CIRCUIT_ENABLED:
+        return
+    scopes = _scopes(username, proxy)
+    # Check every scope before claiming any half-open probe: a probe slot taken
+    # by a call that another scope then refuses would never report back
+    for breaker in scopes:
+        retry_after = breaker.allow(claim=False)
+        if retry_after is not None:
+            _reject(breaker, retry_after)
+    claimed: List[CircuitBreaker] = []
+    for breaker in scopes:
+        retry_after = breaker.allow()
+        if retry_after is not None:
+            # Another call took a probe slot in between
+            for granted in claimed:
+                granted.release_probe()
+            _reject(breaker, retry_after)
+        claimed.append(breaker)
+
+
+def after_call(username: str, proxy: Optional[str], exc: Optional[BaseException] = None) -> None:
+    if not CIRCUIT_ENABLED:
+        return
+    if exc is None or not counts_as_failure(exc):
+        for breaker in _scopes(username, proxy):
+            breaker.record(True)
+        return
+    # A proxy/network error says nothing about the account: its probe slot,
+    # if this call held it, is given back. An account error came back through
+    # the proxy, so it counts as a success there.
+    _global.record(False)
+    account = _breaker(f"account:{username}")
+    if proxy and is_proxy_error(exc):
+        _breaker(f"proxy:{proxy}").record(False)
+        account.release_probe()
+    else:
+        account.record(False)
+        if proxy:
+            _breaker(f"proxy:{proxy}").record(True)
+
+
+def _public_name(name: str) -> str:
+    # Proxy URLs may carry credentials
+    if name.startswith("proxy:"):
+        parts = urlsplit(name[6:])
+        return f"proxy:{parts.scheme}://{parts.hostname}:{parts.port}" if parts.hostname else "proxy"
+    return name
+
+
+def global_state() -> Dict[str, Any]:
+    return _global.as_dict()
+
+
+def snapshot(include_closed: bool = False, accounts: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Breaker states; with accounts, account breakers of other accounts are left out."""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    if accounts is not None:
+        visible = {f"account:{a.lower()}" for a in accounts}
+        breakers = [b for b in breakers if not b.name.startswith("account:") or b.name.lower() in visible]
+    listed = [b.as_dict() for b in breakers]
+    if not include_closed:
+        listed = [b for b in listed if b["state"] != CLOSED or b["failures"]]
+    for item in listed:
+        item["name"] = _public_name(item["name"])
+    return {
+        "enabled": CIRCUIT_ENABLED,
+        "pid": os.getpid(),
+        "global": _global.as_dict(),
+        "proxies": [b for b in listed if b["name"].startswith("proxy")],
+        "accounts": [b for b in listed if b["name"].startswith("account:")],
+    }
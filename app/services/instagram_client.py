@@ -1,23 +1,103 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
 from typing import Optional, Tuple, Dict, Any
 from .session_adapter import InstagramSessionAdapter
+from .proxy_pool import pool as proxy_pool
 from ..utils import session_manager
+from ..utils.metrics import CLIENT_BUILD_SECONDS, CLIENT_CACHE, SESSION_LOAD_SECONDS
+from ..utils.tracing import span
 
-async def login_with_password(username: str, password: str, proxy: Optional[str]) -> Tuple[InstagramSessionAdapter, Dict[str, Any]]:
+# Warm adapters kept per process, keyed by username. With the sharded router
+# each account always lands on the same worker, so this stays hot.
+CLIENT_CACHE_SIZE = int(os.getenv("CLIENT_CACHE_SIZE", "256"))
+
+logger = logging.getLogger("pipegram.sessions")
+
+_clients: "OrderedDict[str, Tuple[Dict[str, Any], InstagramSessionAdapter]]" = OrderedDict()
+_clients_lock = threading.Lock()
+
+def _remember(username: str, saved: Dict[str, Any], client: InstagramSessionAdapter) -> None:
+    if CLIENT_CACHE_SIZE <= 0:
+        return
+    with _clients_lock:
+        _clients[username] = (saved, client)
+        _clients.move_to_end(username)
+        while len(_clients) > CLIENT_CACHE_SIZE:
+            _clients.popitem(last=False)
+
+def forget_client(username: str) -> None:
+    with _clients_lock:
+        _clients.pop(username, None)
+
+async def prewarm(sessions: Dict[str, Dict[str, Any]]) -> int:
+    # Build warm clients ahead of the first request (preforking master, see app/preload.py)
+    built = 0
+    for username, saved in list(sessions.items())[:max(CLIENT_CACHE_SIZE, 0)]:
+        if not saved.get("settings"):
+            continue
+        client = InstagramSessionAdapter(username=username, proxy=saved.get("proxy"))
+        try:
+            await client.deserialize(saved)
+        except Exception:
+            continue
+        _remember(username, saved, client)
+        built += 1
+    return built
+
+async def login_with_password(username: str, password: str, proxy: Optional[str], persist: bool = True) -> Tuple[InstagramSessionAdapter, Dict[str, Any]]:
+    if not proxy:
+        proxy = proxy_pool.assign(username)
     client = InstagramSessionAdapter(username=username, proxy=proxy)
     await client.login(username=username, password=password)
     session = await client.serialize()
+    if not persist:
+        # Caller writes the session itself (e.g. bulk onboarding batches writes)
+        return client, session
     try:
         session_manager.save_session(username, session)
-    except Exception as e:
-        print(f"Error saving session: {e}")
-        import traceback
-        print(f"Traceback: {traceback.format_exc()}")
+        _remember(username, session, client)
+    except Exception:
+        logger.exception("Error saving session for %s", username)
     return client, session
 
+async def persist_session(client: InstagramSessionAdapter) -> Dict[str, Any]:
+    # Write back refreshed cookies/settings and keep the warm client in sync
+    session = await client.serialize()
+    session_manager.save_session(client.username, session)
+    _remember(client.username, session, client)
+    return session
+
 async def resume_session(username: str) -> InstagramSessionAdapter:
-    saved = session_manager.load_session(username)
+    with span("session.resume", username=username) as current:
+        return await _resume_session(username, current)
+
+async def _resume_session(username: str, current) -> InstagramSessionAdapter:
+    with SESSION_LOAD_SECONDS.time(), span("session.load"):
+        saved = session_manager.load_session(username)
     if not saved:
+        forget_client(username)
         raise ValueError("Session not found")
-    client = InstagramSessionAdapter(username=username, proxy=saved.get("proxy"))
-    await client.deserialize(saved)  # uses set_settings(dict)
+    if saved.get("proxy") in proxy_pool:
+        # Move the account off a failing pool proxy and record the active one in the session
+        active = proxy_pool.assign(username, current=saved.get("proxy"))
+        if active != saved.get("proxy"):
+            saved = {**saved, "proxy": active}
+            session_manager.save_session(username, saved)
+    with _clients_lock:
+        cached = _clients.get(username)
+        if cached:
+            _clients.move_to_end(username)
+    # Reuse the warm client unless the stored session changed (re-login, import, refresh)
+    if cached and cached[0].get("settings") == saved.get("settings") and cached[0].get("proxy") == saved.get("proxy"):
+        CLIENT_CACHE.inc(result="hit")
+        if current is not None:
+            current.set("client_cache", "hit")
+        return cached[1]
+    CLIENT_CACHE.inc(result="miss")
+    with CLIENT_BUILD_SECONDS.time(), span("client.build"):
+        client = InstagramSessionAdapter(username=username, proxy=saved.get("proxy"))
+        await client.deserialize(saved)  # uses set_settings(dict)
+    _remember(username, saved, client)
     return client
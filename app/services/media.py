@@ -0,0 +1,320 @@
+import base64
+import binascii
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING, BinaryIO, Optional, Tuple
+
+from ..errors import BadRequestError
+from ..utils.metrics import MEDIA_BYTES, MEDIA_CACHE, MEDIA_SECONDS
+from ..utils.tracing import span
+
+if TYPE_CHECKING:
+    import requests
+
+# Every uploaded picture (feed, story, DM, profile) comes in through ingest():
+# base64 is decoded and URLs are streamed straight to a file under
+# MEDIA_STAGING_DIR, hashing and size-checking as they go, so no copy of the
+# whole image is held in memory. The format is read from the magic bytes; PNG
+# and WebP are re-encoded as JPEG (what instagrapi uploads) and oversized
+# pictures are scaled down, while a JPEG within bounds is passed through as is.
+# The bounds are the boxes instagrapi's prepare_image() fits uploads into, so
+# its own resize is a no-op and a picture is never scaled twice.
+# URL downloads and transformed files are kept for MEDIA_CACHE_TTL, so the
+# same picture sent to many threads is fetched and converted once.
+MEDIA_STAGING_DIR = Path(os.getenv("MEDIA_STAGING_DIR") or Path(tempfile.gettempdir()) / "pipegram-media")
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(20 * 1024 * 1024)))
+MEDIA_DOWNLOAD_TIMEOUT = float(os.getenv("MEDIA_DOWNLOAD_TIMEOUT", "30"))
+# (width, height) boxes for feed/DM pictures, stories and profile pictures
+MEDIA_MAX_SIZE = (1080, 1350)
+STORY_MAX_SIZE = (1080, 1920)
+PROFILE_MAX_SIZE = (1080, 1080)
+MEDIA_JPEG_QUALITY = int(os.getenv("MEDIA_JPEG_QUALITY", "90"))
+MEDIA_CACHE_TTL = float(os.getenv("MEDIA_CACHE_TTL", "600"))
+
+USER_AGENT = "Mozilla/5.0"
+_CHUNK = 256 * 1024
+# base64 is decoded in slices of this many characters (a multiple of 4)
+_B64_SLICE = 4 * 256 * 1024
+
+logger = logging.getLogger("pipegram.media")
+
+_session: Optional["requests.Session"] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+_last_sweep = 0.0
+
+
+class StagedMedia:
+    """A validated picture on local disk, ready to hand to the adapter by path.
+    Use as a context manager (or call release()) once the upload is done."""
+
+    __slots__ = ("path", "format", "size", "width", "height", "sha256", "cached")
+
+    def __init__(self, path: Path, format: str, size: int, width: Optional[int], height: Optional[int],
+                 sha256: str, cached: bool) -> None:
+        self.path = path
+        self.format = format
+        self.size = size
+        self.width = width
+        self.height = height
+        self.sha256 = sha256
+        # Cached files are shared with later requests and expire on their own
+        self.cached = cached
+
+    def release(self) -> None:
+        if not self.cached:
+            _remove(self.path)
+
+    def __enter__(self) -> "StagedMedia":
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.release()
+
+
+def _http() -> "requests.Session":
+    # One keep-alive pool per worker process
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=8, pool_maxsize=16, max_retries=1)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            session.headers["User-Agent"] = USER_AGENT
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def _remove(path: Path) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _staging_dir() -> Path:
+    MEDIA_STAGING_DIR.mkdir(parents=True, exist_ok=True)
+    return MEDIA_STAGING_DIR
+
+
+def _temp_path(suffix: str) -> Path:
+    fd, name = tempfile.mkstemp(dir=_staging_dir(), prefix="in-", suffix=suffix)
+    os.close(fd)
+    return Path(name)
+
+
+def _cached(path: Path) -> bool:
+    try:
+        if time.time() - path.stat().st_mtime < MEDIA_CACHE_TTL:
+            # Touch, so the sweep never removes a file a request is about to use
+            os.utime(path)
+            return True
+    except FileNotFoundError:
+        pass
+    return False
+
+
+def _sweep() -> None:
+    global _last_sweep
+    now = time.time()
+    if now - _last_sweep < 60:
+        return
+    _last_sweep = now
+    try:
+        entries = list(os.scandir(_staging_dir()))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            # Owned temp files are removed by their request; these are leftovers of killed workers
+            if now - entry.stat().st_mtime > max(MEDIA_CACHE_TTL, 3600 if entry.name.startswith("in-") else 0):
+                os.remove(entry.path)
+        except OSError:
+            pass
+
+
+def _too_large(size: int) -> BadRequestError:
+    return BadRequestError(f"Media is larger than the {MEDIA_MAX_BYTES / (1024 * 1024):g} MB limit ({size} bytes)")
+
+
+def _write_limited(fh: BinaryIO, chunk: bytes, size: int, digest: "hashlib._Hash") -> int:
+    size += len(chunk)
+    if size > MEDIA_MAX_BYTES:
+        raise _too_large(size)
+    digest.update(chunk)
+    fh.write(chunk)
+    return size
+
+
+def detect_format(head: bytes) -> Optional[str]:
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head[:6] in (b"GIF87a", b"GIF89a"):
+        return "gif"
+    if head[4:8] == b"ftyp":
+        return "heic" if head[8:12] in (b"heic", b"heix", b"mif1", b"msf1") else "mp4"
+    return None
+
+
+# instagrapi checks the file extension, so staged files always carry the right one
+EXTENSIONS = {"jpeg": ".jpg", "png": ".png", "webp": ".webp"}
+
+
+def _check_format(head: bytes) -> str:
+    fmt = detect_format(head)
+    if fmt not in EXTENSIONS:
+        raise BadRequestError(f"Unsupported media format: {fmt or 'unknown'} "
+                              f"(accepted: {', '.join(sorted(EXTENSIONS))})")
+    return fmt
+
+
+def _decode(b64: str) -> Tuple[Path, int, str, str]:
+    # Data URI prefix ("data:image/jpeg;base64,") is optional; line breaks are tolerated
+    data = b64.split(",", 1)[1] if "," in b64[:256] else b64
+    if "\n" in data or " " in data:
+        data = "".join(data.split())
+    if len(data) * 3 // 4 > MEDIA_MAX_BYTES:
+        raise _too_large(len(data) * 3 // 4)
+    size, digest = 0, hashlib.sha256()
+    path: Optional[Path] = None
+    try:
+        with MEDIA_SECONDS.time(stage="decode"), span("media.decode"):
+            first = base64.b64decode(data[:_B64_SLICE])
+            fmt = _check_format(first[:16])
+            path = _temp_path(EXTENSIONS[fmt])
+            with open(path, "wb") as fh:
+                size = _write_limited(fh, first, size, digest)
+                for start in range(_B64_SLICE, len(data), _B64_SLICE):
+                    size = _write_limited(fh, base64.b64decode(data[start:start + _B64_SLICE]), size, digest)
+    except Exception as exc:
+        if path is not None:
+            _remove(path)
+        if isinstance(exc, binascii.Error):
+            raise BadRequestError(f"Error decoding base64: {exc}")
+        raise
+    MEDIA_BYTES.inc(size, stage="decode")
+    return path, size, digest.hexdigest(), fmt
+
+
+def _download(url: str) -> Tuple[Path, int, str, str]:
+    stem = f"url-{hashlib.sha256(url.encode('utf-8')).hexdigest()[:40]}"
+    for fmt, ext in EXTENSIONS.items():
+        dest = _staging_dir() / (stem + ext)
+        if _cached(dest):
+            MEDIA_CACHE.inc(stage="download", result="hit")
+            with open(dest, "rb") as fh:
+                digest = hashlib.file_digest(fh, "sha256").hexdigest()
+            return dest, dest.stat().st_size, digest, fmt
+    MEDIA_CACHE.inc(stage="download", result="miss")
+    tmp = _temp_path(".part")
+    size, digest, fmt = 0, hashlib.sha256(), None
+    try:
+        with MEDIA_SECONDS.time(stage="download"), span("media.download"):
+            with _http().get(url, stream=True, timeout=MEDIA_DOWNLOAD_TIMEOUT) as resp:
+                resp.raise_for_status()
+                declared = int(resp.headers.get("Content-Length") or 0)
+                if declared > MEDIA_MAX_BYTES:
+                    raise _too_large(declared)
+                with open(tmp, "wb") as fh:
+                    for chunk in resp.iter_content(chunk_size=_CHUNK):
+                        if fmt is None:
+                            # Not an image (an HTML error page, a video...): stop after the first chunk
+                            fmt = _check_format(chunk[:16])
+                        size = _write_limited(fh, chunk, size, digest)
+        if fmt is None:
+            raise BadRequestError("Downloaded media is empty")
+        dest = _staging_dir() / (stem + EXTENSIONS[fmt])
+        os.replace(tmp, dest)
+    except BadRequestError:
+        _remove(tmp)
+        raise
+    except Exception as exc:
+        _remove(tmp)
+        raise BadRequestError(f"Error downloading media from URL: {exc}")
+    MEDIA_BYTES.inc(size, stage="download")
+    return dest, size, digest.hexdigest(), fmt
+
+
+def _transform(source: Path, sha256: str, fmt: str, max_size: Tuple[int, int]) -> StagedMedia:
+    """Open the picture (header only when it can stay as is) and re-encode it as a
+    bounded JPEG when needed. Converted files are cached by source hash."""
+    try:
+        from PIL import Image, ImageOps
+    except ImportError:  # without Pillow, pictures are uploaded as received
+        return StagedMedia(source, fmt, source.stat().st_size, None, None, sha256, cached=False)
+    try:
+        with Image.open(source) as image:
+            width, height = image.size
+            max_width, max_height = max_size
+            if fmt == "jpeg" and width <= max_width and height <= max_height:
+                return StagedMedia(source, fmt, source.stat().st_size, width, height, sha256, cached=False)
+            dest = _staging_dir() / f"jpeg-{sha256[:40]}-{max_width}x{max_height}.jpg"
+            if _cached(dest):
+                MEDIA_CACHE.inc(stage="transform", result="hit")
+                with Image.open(dest) as done:
+                    return StagedMedia(dest, "jpeg", dest.stat().st_size, *done.size, sha256, cached=True)
+            MEDIA_CACHE.inc(stage="transform", result="miss")
+            with MEDIA_SECONDS.time(stage="transform"), span("media.transform", format=fmt, width=width, height=height):
+                image = ImageOps.exif_transpose(image)
+                if image.mode != "RGB":
+                    # Transparent areas become white rather than black
+                    background = Image.new("RGB", image.size, (255, 255, 255))
+                    rgba = image.convert("RGBA")
+                    background.paste(rgba, mask=rgba.getchannel("A"))
+                    image = background
+                image.thumbnail(max_size, Image.LANCZOS)
+                tmp = _temp_path(".jpg")
+                try:
+                    image.save(tmp, format="JPEG", quality=MEDIA_JPEG_QUALITY, optimize=True)
+                    os.replace(tmp, dest)
+                except Exception:
+                    _remove(tmp)
+                    raise
+            MEDIA_BYTES.inc(dest.stat().st_size, stage="transform")
+            return StagedMedia(dest, "jpeg", dest.stat().st_size, *image.size, sha256, cached=True)
+    except BadRequestError:
+        raise
+    except Exception as exc:
+        raise BadRequestError(f"Invalid {fmt} image: {exc}")
+
+
+def ingest(b64: Optional[str] = None, url: Optional[str] = None,
+           max_size: Tuple[int, int] = MEDIA_MAX_SIZE) -> StagedMedia:
+    """Stage a picture given as base64 (data URI or bare) or URL for upload.
+    Raises BadRequestError for missing, oversized, undecodable or unsupported input."""
+    _sweep()
+    if b64:
+        path, size, sha256, fmt = _decode(b64)
+        owned = True
+    elif url:
+        path, size, sha256, fmt = _download(url)
+        owned = False
+    else:
+        raise BadRequestError("Neither base64 nor url provided.")
+    try:
+        staged = _transform(path, sha256, fmt, max_size)
+    except Exception:
+        if owned:
+            _remove(path)
+        raise
+    if staged.path != path:
+        if owned:
+            _remove(path)
+    elif not owned:
+        # A passed-through download stays in the cache; nothing to delete afterwards
+        staged.cached = True
+    logger.debug("Staged %s %s (%d bytes, %sx%s)", staged.format, staged.path.name, staged.size,
+                 staged.width, staged.height)
+    return staged
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from . import media
+from .projections import MediaItemDTO
+from .session_adapter import InstagramSessionAdapter
+from ..utils.metrics import MEDIA_BYTES, MEDIA_SECONDS
+from ..utils.state_store import get_store
+
+if TYPE_CHECKING:
+    import requests
+
+# Archive layout: <ARCHIVE_DIR>/<target>/{stories,posts}/<YYYYmmdd>_<id>[_<n>].<ext>,
+# plus <target>/manifest.json (media id -> files, used to skip what is already
+# archived) and <ARCHIVE_DIR>/index.json (one summary line per target).
+ARCHIVE_DIR = Path(os.getenv("ARCHIVE_DIR", "./archive"))
+ARCHIVE_DOWNLOAD_WORKERS = int(os.getenv("ARCHIVE_DOWNLOAD_WORKERS", "8"))
+ARCHIVE_DOWNLOAD_TIMEOUT = float(os.getenv("ARCHIVE_DOWNLOAD_TIMEOUT", "60"))
+ARCHIVE_MAX_POSTS = int(os.getenv("ARCHIVE_MAX_POSTS", "500"))
+ARCHIVE_LOCK_TTL = int(os.getenv("ARCHIVE_LOCK_TTL", "3600"))
+# Largest file kept; a bigger download is abandoned (and its partial file removed)
+ARCHIVE_MAX_BYTES = int(os.getenv("ARCHIVE_MAX_BYTES") or media.MEDIA_MAX_BYTES)
+ARCHIVE_PAGE_SIZE = 50
+
+logger = logging.getLogger("pipegram.archive")
+
+_session: Optional["requests.Session"] = None
+_session_pid: Optional[int] = None
+_session_lock = threading.Lock()
+_index_lock = threading.Lock()
+
+
+def _http() -> "requests.Session":
+    # One keep-alive pool per worker process, sized for the download threads
+    global _session, _session_pid
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            import requests
+            from requests.adapters import HTTPAdapter
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=ARCHIVE_DOWNLOAD_WORKERS, max_retries=2)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session, _session_pid = session, os.getpid()
+        return _session
+
+
+def _safe_name(value: str, fallback: str = "_") -> str:
+    name = "".join(c for c in value if c.isalnum() or c in "._-")
+    # "." and ".." would point at the folder itself or its parent
+    return name if name.strip(".") else fallback
+
+
+def _write_json(path: Path, data: Any) -> None:
+    tmp = path.with_suffix(path.suffix + ".tmp")
+    tmp.write_text(json.dumps(data, indent=1, sort_keys=True, default=str), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _load_manifest(path: Path) -> Dict[str, Dict[str, Any]]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except FileNotFoundError:
+        return {}
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _in_window(item: MediaItemDTO, since: Optional[datetime], until: Optional[datetime]) -> bool:
+    taken_at = _as_utc(item.taken_at)
+    return (since is None or taken_at >= since) and (until is None or taken_at < until)
+
+
+def _collect(client: InstagramSessionAdapter, user_id: str, include: List[str], since: Optional[datetime],
+             until: Optional[datetime], max_posts: int) -> List[MediaItemDTO]:
+    items: List[MediaItemDTO] = []
+    if "stories" in include:
+        items.extend(i for i in asyncio.run(client.story_items(user_id)) if _in_window(i, since, until))
+    if "posts" in include:
+        cursor, seen = "", 0
+        while seen < max_posts:
+            page, cursor = asyncio.run(client.post_items_page(user_id, cursor, min(ARCHIVE_PAGE_SIZE, max_posts - seen)))
+            seen += len(page)
+            items.extend(i for i in page if _in_window(i, since, until))
+            # Posts come newest first: once a whole page is older than the window, stop
+            if not cursor or not page or (since and all(_as_utc(i.taken_at) < since for i in page)):
+                break
+    return items
+
+
+def _targets(item: MediaItemDTO, target_dir: Path) -> List[Tuple[str, Path]]:
+    folder = target_dir / ("stories" if item.kind == "story" else "posts")
+    stem = f"{_as_utc(item.taken_at):%Y%m%d}_{_safe_name(item.id)}"
+    files = []
+    for n, url in enumerate(item.urls):
+        ext = os.path.splitext(urlsplit(url).path)[1] or (".mp4" if item.media_type == "video" else ".jpg")
+        files.append((url, folder / (f"{stem}_{n}{ext}" if len(item.urls) > 1 else f"{stem}{ext}")))
+    return files
+
+
+def _download(url: str, dest: Path, proxy: Optional[str]) -> int:
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    tmp = dest.with_suffix(dest.suffix + ".part")
+    size = 0
+    proxies = {"http": proxy, "https": proxy} if proxy else None
+    try:
+        with MEDIA_SECONDS.time(stage="archive"):
+            with _http().get(url, stream=True, timeout=ARCHIVE_DOWNLOAD_TIMEOUT, proxies=proxies) as resp:
+                resp.raise_for_status()
+                declared = int(resp.headers.get("Content-Length") or 0)
+                if declared > ARCHIVE_MAX_BYTES:
+                    raise ValueError(f"Media is larger than the {ARCHIVE_MAX_BYTES} bytes limit ({declared} bytes)")
+                with open(tmp, "wb") as fh:
+                    for chunk in resp.iter_content(chunk_size=256 * 1024):
+                        size += len(chunk)
+                        if size > ARCHIVE_MAX_BYTES:
+                            raise ValueError(f"Media is larger than the {ARCHIVE_MAX_BYTES} bytes limit")
+                        fh.write(chunk)
+        os.replace(tmp, dest)
+    finally:
+        # Gone already when the download completed; otherwise don't leave it behind
+        tmp.unlink(missing_ok=True)
+    MEDIA_BYTES.inc(size, stage="archive")
+    return size
+
+
+def _fetch_item(item: MediaItemDTO, target_dir: Path, proxy: Optional[str]) -> Dict[str, Any]:
+    files, size = [], 0
+    for url, dest in _targets(item, target_dir):
+        size += _download(url, dest, proxy)
+        files.append(str(dest.relative_to(target_dir)))
+    return {"kind": item.kind, "media_type": item.media_type, "taken_at": _as_utc(item.taken_at).isoformat(),
+            "files": files, "bytes": size, "archived_at": int(time.time())}
+
+
+def _update_index(target: str, manifest: Dict[str, Dict[str, Any]]) -> None:
+    with _index_lock:
+        path = ARCHIVE_DIR / "index.json"
+        index = _load_manifest(path)
+        index[target] = {
+            "items": len(manifest),
+            "bytes": sum(e.get("bytes", 0) for e in manifest.values()),
+            "latest_taken_at": max((e["taken_at"] for e in manifest.values()), default=None),
+            "last_run": int(time.time()),
+        }
+        _write_json(path, index)
+
+
+def archive_target(client: InstagramSessionAdapter, target: str, include: List[str],
+                   since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   max_posts: int = ARCHIVE_MAX_POSTS) -> Dict[str, Any]:
+    """Download what is new for one target; returns counts for the response line."""
+    result: Dict[str, Any] = {"target": target}
+    lock_key = f"archive:lock:{target.lower()}"
+    if not get_store().add(lock_key, os.getpid(), ttl=ARCHIVE_LOCK_TTL):
+        return {**result, "status": "busy", "error": "An archive of this target is already running"}
+    try:
+        user_id = asyncio.run(client.user_id(target))
+        items = _collect(client, user_id, include, _as_utc(since), _as_utc(until), max_posts)
+
+        target_dir = ARCHIVE_DIR / _safe_name(target.lower(), fallback=_safe_name(str(user_id)))
+        target_dir.mkdir(parents=True, exist_ok=True)
+        manifest_path = target_dir / "manifest.json"
+        manifest = _load_manifest(manifest_path)
+        new = [i for i in items if i.id not in manifest and i.urls]
+        counts = {"found": len(items), "skipped": len(items) - len(new), "downloaded": 0, "failed": 0, "bytes": 0}
+
+        executor = ThreadPoolExecutor(max_workers=max(1, ARCHIVE_DOWNLOAD_WORKERS), thread_name_prefix="archive")
+        try:
+            futures = {executor.submit(_fetch_item, item, target_dir, client.proxy): item for item in new}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    entry = future.result()
+                except Exception as exc:
+                    counts["failed"] += 1
+                    logger.warning("Archive of %s %s failed: %s", target, item.id, exc)
+                    continue
+                manifest[item.id] = entry
+                counts["downloaded"] += 1
+                counts["bytes"] += entry["bytes"]
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+            # Whatever finished is recorded, so a rerun only fetches the rest
+            if counts["downloaded"]:
+                _write_json(manifest_path, manifest)
+                _update_index(target.lower(), manifest)
+        return {**result, "status": "ok", **counts}
+    except Exception as exc:
+        return {**result, "status": "error", "error": str(exc)}
+    finally:
+        get_store().delete(lock_key)
+
+
+def run_archive(client: InstagramSessionAdapter, targets: List[str], include: List[str],
+                since: Optional[datetime] = None, until: Optional[datetime] = None,
+                max_posts: int = ARCHIVE_MAX_POSTS) -> Iterator[Dict[str, Any]]:
+    """One result per target as it finishes, then a summary."""
+    totals = {"targets": len(targets), "downloaded": 0, "skipped": 0, "failed": 0, "bytes": 0}
+    for target in targets:
+        line = archive_target(client, target, include, since, until, max_posts)
+        for key in ("downloaded", "skipped", "failed", "bytes"):
+            totals[key] += line.get(key, 0)
+        yield line
+    yield {"summary": totals}
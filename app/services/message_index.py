@@ -0,0 +1,212 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .instagram_client import resume_session
+from .projections import MessageDTO
+from ..utils import session_manager
+
+# Local full-text index of DM messages, fed by every thread fetch and by
+# sync_account(). Searches never call Instagram. `messages` holds the rows and
+# `messages_fts` is an external-content FTS5 index over their text, kept in
+# step by triggers; re-indexing a thread only inserts messages not seen yet.
+MESSAGE_INDEX_DB = Path(os.getenv("MESSAGE_INDEX_DB") or session_manager.SESSIONS_DIR / ".messages.db")
+MESSAGE_INDEX_ENABLED = os.getenv("MESSAGE_INDEX_ENABLED", "true").lower() in ("1", "true", "yes")
+# A sync pages back through a changed thread until it reaches the newest
+# indexed message, reading at most this many messages of it
+MESSAGE_SYNC_MAX_MESSAGES = int(os.getenv("MESSAGE_SYNC_MAX_MESSAGES", "1000"))
+SYNC_PAGE = 20
+SEARCH_MAX_LIMIT = 100
+
+logger = logging.getLogger("pipegram.message_index")
+
+_local = threading.local()
+
+
+def _conn() -> sqlite3.Connection:
+    # One connection per thread and per process, as in SqliteStore
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        MESSAGE_INDEX_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(MESSAGE_INDEX_DB), timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS messages (
+                rowid INTEGER PRIMARY KEY,
+                account TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                thread_id TEXT NOT NULL,
+                user_id TEXT,
+                ts INTEGER,
+                text TEXT NOT NULL,
+                UNIQUE (account, message_id)
+            );
+            CREATE INDEX IF NOT EXISTS messages_thread ON messages (account, thread_id, ts);
+            CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+                text, content='messages', content_rowid='rowid',
+                tokenize='unicode61 remove_diacritics 2'
+            );
+            CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+                INSERT INTO messages_fts (rowid, text) VALUES (new.rowid, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+                INSERT INTO messages_fts (messages_fts, rowid, text) VALUES ('delete', old.rowid, old.text);
+            END;
+            CREATE TABLE IF NOT EXISTS threads (
+                account TEXT NOT NULL,
+                thread_id TEXT NOT NULL,
+                last_ts INTEGER,
+                synced_at INTEGER NOT NULL,
+                PRIMARY KEY (account, thread_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def _epoch(value: Any) -> Optional[int]:
+    if isinstance(value, datetime):
+        return int(value.timestamp())
+    return int(value) if value is not None else None
+
+
+def index_thread(account: str, thread_id: str, messages: Iterable[MessageDTO]) -> int:
+    """Add the thread's messages that are not indexed yet; returns how many were new."""
+    account = account.lower()
+    rows = [(account, str(m.id), thread_id, str(m.user_id) if m.user_id else None, _epoch(m.timestamp), m.text)
+            for m in messages if m.text]
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        added = conn.executemany(
+            "INSERT OR IGNORE INTO messages (account, message_id, thread_id, user_id, ts, text) "
+            "VALUES (?, ?, ?, ?, ?, ?)", rows).rowcount
+        conn.execute(
+            "INSERT INTO threads (account, thread_id, last_ts, synced_at) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (account, thread_id) DO UPDATE SET "
+            "last_ts = MAX(COALESCE(threads.last_ts, 0), COALESCE(excluded.last_ts, 0)), synced_at = excluded.synced_at",
+            (account, thread_id, max((r[4] for r in rows if r[4] is not None), default=None), int(time.time())))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return added
+
+
+def record_thread(account: str, thread_id: str, messages: Iterable[MessageDTO]) -> None:
+    # Called from /dm/thread: indexing must never fail the request
+    if not MESSAGE_INDEX_ENABLED:
+        return
+    try:
+        index_thread(account, thread_id, messages)
+    except Exception as exc:
+        logger.warning("Could not index thread %s: %s", thread_id, exc)
+
+
+def _match_expression(query: str) -> str:
+    # Free text -> FTS5 query: every term must match, each quoted so order
+    # numbers like "#A-1234" are not parsed as syntax; "term*" keeps prefix search
+    terms = []
+    for term in query.split():
+        prefix = term.endswith("*")
+        term = term.rstrip("*").replace('"', '""')
+        if term:
+            terms.append(f'"{term}"' + ("*" if prefix else ""))
+    return " AND ".join(terms)
+
+
+def search(account: str, query: str, thread_id: Optional[str] = None, limit: int = 20,
+           offset: int = 0) -> Dict[str, Any]:
+    """Best matches first (bm25), with a highlighted snippet per message."""
+    expression = _match_expression(query)
+    if not expression:
+        raise ValueError("Search query is empty")
+    limit = max(1, min(limit, SEARCH_MAX_LIMIT))
+    where = "messages_fts MATCH ? AND m.account = ?"
+    params: List[Any] = [expression, account.lower()]
+    if thread_id:
+        where += " AND m.thread_id = ?"
+        params.append(thread_id)
+    conn = _conn()
+    # CROSS JOIN pins the FTS index as the outer loop; otherwise the planner walks
+    # every message of the account and runs the MATCH once per row
+    rows = conn.execute(
+        "SELECT m.message_id, m.thread_id, m.user_id, m.ts, m.text, "
+        "snippet(messages_fts, 0, '[', ']', '…', 16), bm25(messages_fts) "
+        f"FROM messages_fts CROSS JOIN messages m ON m.rowid = messages_fts.rowid WHERE {where} "
+        "ORDER BY bm25(messages_fts) LIMIT ? OFFSET ?",
+        (*params, limit + 1, offset)).fetchall()
+    total = conn.execute(
+        f"SELECT COUNT(*) FROM messages_fts CROSS JOIN messages m ON m.rowid = messages_fts.rowid WHERE {where}",
+        params).fetchone()[0]
+    has_more = len(rows) > limit
+    results = [{
+        "id": r[0], "thread_id": r[1], "user_id": r[2], "timestamp": r[3], "text": r[4],
+        "snippet": r[5], "score": round(-r[6], 4),
+    } for r in rows[:limit]]
+    return {"query": query, "total": total, "offset": offset, "limit": limit,
+            "next_offset": offset + limit if has_more else None, "results": results}
+
+
+def stats(account: str) -> Dict[str, Any]:
+    conn = _conn()
+    messages = conn.execute("SELECT COUNT(*) FROM messages WHERE account = ?", (account.lower(),)).fetchone()[0]
+    threads, synced_at = conn.execute(
+        "SELECT COUNT(*), MAX(synced_at) FROM threads WHERE account = ?", (account.lower(),)).fetchone()
+    return {"messages": messages, "threads": threads, "synced_at": synced_at}
+
+
+async def _messages_since(client: Any, thread_id: str, indexed: Optional[int]) -> Tuple[List[MessageDTO], bool]:
+    """The thread's latest messages, back to the indexed timestamp; second value is
+    True when MESSAGE_SYNC_MAX_MESSAGES was reached first. Pages older with the
+    thread cursor, so each message is fetched once."""
+    messages: List[MessageDTO] = []
+    cursor = ""
+    while True:
+        page, cursor = await client.thread_messages_page(
+            thread_id, cursor, min(SYNC_PAGE, MESSAGE_SYNC_MAX_MESSAGES - len(messages)))
+        messages.extend(page)
+        stamps = [ts for ts in (_epoch(m.timestamp) for m in page) if ts is not None]
+        if indexed is None or not cursor or not page or (stamps and min(stamps) <= indexed):
+            return messages, False
+        if len(messages) >= MESSAGE_SYNC_MAX_MESSAGES:
+            return messages, True
+
+
+async def sync_account(username: str, max_threads: Optional[int] = None) -> Dict[str, Any]:
+    """Fetch the threads whose last message is newer than what is indexed."""
+    client = await resume_session(username)
+    threads = await client.inbox()
+    if max_threads:
+        threads = threads[:max_threads]
+    conn = _conn()
+    known = dict(conn.execute("SELECT thread_id, last_ts FROM threads WHERE account = ?", (username.lower(),)))
+    counts = {"threads": len(threads), "fetched": 0, "unchanged": 0, "failed": 0, "truncated": 0, "messages": 0}
+    for thread in threads:
+        last_ts = _epoch(thread.last_message_timestamp)
+        indexed = known.get(thread.thread_id)
+        if indexed is not None and last_ts is not None and last_ts <= indexed:
+            counts["unchanged"] += 1
+            continue
+        try:
+            messages, truncated = await _messages_since(client, thread.thread_id, indexed)
+        except Exception as exc:
+            counts["failed"] += 1
+            logger.warning("Could not sync thread %s: %s", thread.thread_id, exc)
+            continue
+        if truncated:
+            counts["truncated"] += 1
+            logger.warning("Thread %s has more than %d new messages; older ones are not indexed",
+                           thread.thread_id, MESSAGE_SYNC_MAX_MESSAGES)
+        counts["fetched"] += 1
+        counts["messages"] += index_thread(username, thread.thread_id, messages)
+    return counts
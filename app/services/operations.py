@@ -0,0 +1,415 @@
+import asyncio
+import logging
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+from . import webhooks
+from .instagram_client import resume_session
+from ..errors import CircuitOpenError
+from ..utils import lifecycle, session_manager
+from ..utils.json_provider import dumps, loads
+from ..utils.log import account_context
+
+# Journal of the operations that change something on Instagram (publish, send,
+# profile edits). Each one is recorded as running before the adapter call and
+# as done/failed after it. While the worker drains, an operation that has not
+# started yet is stored as queued instead, with a copy of its media, and the
+# next worker to start runs it. A row left running by a killed worker becomes
+# interrupted: Instagram may or may not have received it, so it is never
+# replayed blindly. Webhook events not delivered by the end of the drain
+# (queued, waiting for a retry or still being sent) are queued here too.
+OPERATIONS_DB = Path(os.getenv("OPERATIONS_DB") or session_manager.SESSIONS_DIR / ".operations.db")
+OPERATIONS_MEDIA_DIR = Path(os.getenv("OPERATIONS_MEDIA_DIR") or session_manager.SESSIONS_DIR / ".operations-media")
+# Seconds between runs of queued operations (0 disables the resumer thread)
+OPERATIONS_RESUME_INTERVAL = float(os.getenv("OPERATIONS_RESUME_INTERVAL", "5"))
+# Longer than any request may run (gunicorn timeout), so such a row has no live owner
+OPERATIONS_STALE_AFTER = float(os.getenv("OPERATIONS_STALE_AFTER", "600"))
+OPERATIONS_RETENTION = float(os.getenv("OPERATIONS_RETENTION", str(7 * 86400)))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+INTERRUPTED = "interrupted"
+STATES = (QUEUED, RUNNING, DONE, FAILED, INTERRUPTED)
+
+WEBHOOK_EVENT = "webhook.event"
+
+logger = logging.getLogger("pipegram.operations")
+
+_local = threading.local()
+_active = 0
+_active_cond = threading.Condition()
+_thread: Optional[threading.Thread] = None
+_thread_pid: Optional[int] = None
+_last_prune = 0.0
+
+
+def _conn() -> sqlite3.Connection:
+    # One connection per thread and per process, as in SqliteStore
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        OPERATIONS_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(OPERATIONS_DB), timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS operations (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                account TEXT,
+                params TEXT NOT NULL,
+                media TEXT,
+                state TEXT NOT NULL,
+                owner TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                not_before REAL NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS operations_state ON operations (state, not_before);
+            """
+        )
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def _owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+# -- handlers -----------------------------------------------------------------
+
+async def _post_feed(client: Any, params: Dict[str, Any], media: Optional[str]) -> Any:
+    result = await client.publish_photo(media, caption=params.get("caption"))
+    webhooks.emit(webhooks.POST_PUBLISHED, client.username, {"kind": "feed", "media": result})
+    return result
+
+
+async def _post_story(client: Any, params: Dict[str, Any], media: Optional[str]) -> Any:
+    result = await client.publish_story_photo(media)
+    webhooks.emit(webhooks.POST_PUBLISHED, client.username, {"kind": "story", "media": result})
+    return result
+
+
+async def _dm_text(client: Any, params: Dict[str, Any], media: Optional[str]) -> Any:
+    await client.send_text_dm(params["to"], params["message"])
+
+
+async def _dm_photo(client: Any, params: Dict[str, Any], media: Optional[str]) -> Any:
+    await client.send_photo_dm(params["to"], media)
+
+
+async def _profile_picture(client: Any, params: Dict[str, Any], media: Optional[str]) -> Any:
+    await client.change_profile_picture(media)
+
+
+async def _profile_bio(client: Any, params: Dict[str, Any], media: Optional[str]) -> Any:
+    await client.edit_bio(params["bio"])
+
+
+HANDLERS: Dict[str, Callable[[Any, Dict[str, Any], Optional[str]], Awaitable[Any]]] = {
+    "post.feed": _post_feed,
+    "post.story": _post_story,
+    "dm.text": _dm_text,
+    "dm.photo": _dm_photo,
+    "profile.picture": _profile_picture,
+    "profile.bio": _profile_bio,
+}
+
+
+# -- journal ------------------------------------------------------------------
+
+def _insert(op_id: str, kind: str, account: Optional[str], params: Dict[str, Any], media: Optional[str],
+            state: str) -> None:
+    now = time.time()
+    _conn().execute(
+        "INSERT INTO operations (id, kind, account, params, media, state, owner, created_at, updated_at) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        (op_id, kind, account, dumps(params), media, state, _owner() if state == RUNNING else None, now, now))
+
+
+def _update(op_id: str, state: str, **fields: Any) -> None:
+    fields = {**fields, "state": state, "updated_at": time.time()}
+    _conn().execute(f"UPDATE operations SET {', '.join(f'{k} = ?' for k in fields)} WHERE id = ?",
+                    (*fields.values(), op_id))
+
+
+def _keep_media(op_id: str, media: str) -> str:
+    # Staged files live in a temp dir that does not survive the restart
+    OPERATIONS_MEDIA_DIR.mkdir(parents=True, exist_ok=True)
+    dest = OPERATIONS_MEDIA_DIR / (op_id + Path(media).suffix)
+    try:
+        os.link(media, dest)
+    except OSError:
+        shutil.copyfile(media, dest)
+    return str(dest)
+
+
+def _remove_media(media: Optional[str]) -> None:
+    if media and Path(media).parent == OPERATIONS_MEDIA_DIR:
+        try:
+            os.remove(media)
+        except OSError:
+            pass
+
+
+def enqueue(kind: str, account: Optional[str], params: Dict[str, Any], media: Optional[str] = None) -> str:
+    op_id = uuid.uuid4().hex
+    _insert(op_id, kind, account, params, _keep_media(op_id, media) if media else None, QUEUED)
+    return op_id
+
+
+class _Tracked:
+    # Counts operations running in this process, so a drain can wait for them
+    def __enter__(self) -> None:
+        global _active
+        with _active_cond:
+            _active += 1
+
+    def __exit__(self, *exc: object) -> None:
+        global _active
+        with _active_cond:
+            _active -= 1
+            _active_cond.notify_all()
+
+
+async def perform(kind: str, client: Any, params: Dict[str, Any], media: Optional[str] = None) -> Dict[str, Any]:
+    """Run one operation under the journal: {"id", "status": "done", "result"}.
+    While the worker drains it is queued instead: {"id", "status": "queued"}."""
+    if lifecycle.draining():
+        return {"id": enqueue(kind, client.username, params, media), "status": QUEUED}
+    op_id: Optional[str] = uuid.uuid4().hex
+    try:
+        _insert(op_id, kind, client.username, params, None, RUNNING)
+    except sqlite3.Error as exc:
+        # The journal must not stop the operation itself
+        logger.warning("Could not journal %s: %s", kind, exc)
+        op_id = None
+    with _Tracked():
+        try:
+            result = await HANDLERS[kind](client, params, media)
+        except Exception as exc:
+            _finish(op_id, FAILED, error=str(exc))
+            raise
+    _finish(op_id, DONE, result=dumps(result))
+    return {"id": op_id, "status": DONE, "result": result}
+
+
+def _finish(op_id: Optional[str], state: str, **fields: Any) -> None:
+    if op_id is None:
+        return
+    try:
+        _update(op_id, state, **fields)
+    except sqlite3.Error as exc:
+        logger.warning("Could not journal the end of operation %s: %s", op_id, exc)
+
+
+def queued_body(op: Dict[str, Any]) -> Dict[str, Any]:
+    return {"message": "The worker is shutting down; the operation was queued and runs when a worker starts",
+            "operation": op["id"], "status": QUEUED}
+
+
+def _public(row: sqlite3.Row) -> Dict[str, Any]:
+    data = dict(row)
+    data["params"] = loads(data["params"])
+    if data["kind"] == WEBHOOK_EVENT:
+        data["params"] = {"subscription": data["params"]["subscription"], "event": data["params"]["event"]["type"]}
+    data["result"] = loads(data["result"]) if data["result"] else None
+    data.pop("media", None)
+    return data
+
+
+def list_operations(state: Optional[str] = None, account: Optional[str] = None, limit: int = 50,
+                    accounts: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+    """Counts per state and the latest operations. accounts, when given, limits
+    both to those accounts (what a scoped API key may see)."""
+    conn = _conn()
+    scope, scope_params = "", []
+    if accounts is not None:
+        scope_params = sorted(a.lower() for a in accounts)
+        scope = f"lower(account) IN ({', '.join('?' * len(scope_params))})"
+    counts = dict(conn.execute("SELECT state, COUNT(*) FROM operations" + (f" WHERE {scope}" if scope else "") +
+                               " GROUP BY state", scope_params).fetchall())
+    where, params = ([scope], list(scope_params)) if scope else ([], [])
+    if state:
+        where.append("state = ?")
+        params.append(state)
+    if account:
+        where.append("account = ?")
+        params.append(account)
+    conn.row_factory = sqlite3.Row
+    try:
+        rows = conn.execute(
+            "SELECT * FROM operations" + (f" WHERE {' AND '.join(where)}" if where else "") +
+            " ORDER BY created_at DESC LIMIT ?", (*params, limit)).fetchall()
+    finally:
+        conn.row_factory = None
+    return {"counts": {s: counts.get(s, 0) for s in STATES}, "operations": [_public(r) for r in rows]}
+
+
+def queued_count() -> int:
+    return _conn().execute("SELECT COUNT(*) FROM operations WHERE state = ?", (QUEUED,)).fetchone()[0]
+
+
+# -- resume -------------------------------------------------------------------
+
+def _recover() -> int:
+    now = time.time()
+    return _conn().execute(
+        "UPDATE operations SET state = ?, error = ?, updated_at = ? WHERE state = ? AND updated_at < ?",
+        (INTERRUPTED, "Worker stopped while the operation was running", now, RUNNING,
+         now - OPERATIONS_STALE_AFTER)).rowcount
+
+
+def _prune() -> None:
+    global _last_prune
+    now = time.time()
+    if now - _last_prune < 3600:
+        return
+    _last_prune = now
+    conn = _conn()
+    for (media,) in conn.execute("SELECT media FROM operations WHERE state != ? AND state != ? AND media IS NOT NULL",
+                                 (QUEUED, RUNNING)).fetchall():
+        _remove_media(media)
+    conn.execute("DELETE FROM operations WHERE state IN (?, ?, ?) AND updated_at < ?",
+                 (DONE, FAILED, INTERRUPTED, now - OPERATIONS_RETENTION))
+
+
+def _claim() -> Optional[Dict[str, Any]]:
+    # BEGIN IMMEDIATE serialises claims, so each queued row runs in exactly one worker
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT id, kind, account, params, media, attempts FROM operations "
+            "WHERE state = ? AND not_before <= ? ORDER BY created_at LIMIT 1", (QUEUED, time.time())).fetchone()
+        if row is not None:
+            conn.execute("UPDATE operations SET state = ?, owner = ?, attempts = attempts + 1, updated_at = ? "
+                         "WHERE id = ?", (RUNNING, _owner(), time.time(), row[0]))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    if row is None:
+        return None
+    return dict(zip(("id", "kind", "account", "params", "media", "attempts"), row))
+
+
+async def _resume(op: Dict[str, Any]) -> Any:
+    params = loads(op["params"])
+    if op["kind"] == WEBHOOK_EVENT:
+        sub = webhooks.get_subscription(params["subscription"])
+        if sub is not None:
+            webhooks.dispatcher.submit(sub, params["event"])
+        return None
+    client = await resume_session(op["account"])
+    return await HANDLERS[op["kind"]](client, params, op["media"])
+
+
+def run_claimed(op: Dict[str, Any]) -> None:
+    with _Tracked():
+        try:
+            with account_context(op["account"] or "-"):
+                result = asyncio.run(_resume(op))
+        except CircuitOpenError as exc:
+            # Nothing reached Instagram: try again once the circuit lets calls through
+            _update(op["id"], QUEUED, owner=None, not_before=time.time() + exc.retry_after, error=str(exc))
+            return
+        except Exception as exc:
+            logger.warning("Queued %s %s failed: %s", op["kind"], op["id"], exc)
+            _update(op["id"], FAILED, error=str(exc))
+            _remove_media(op["media"])
+            return
+    _update(op["id"], DONE, result=dumps(result), error=None)
+    _remove_media(op["media"])
+    logger.info("Resumed %s %s", op["kind"], op["id"])
+
+
+def resume_once() -> int:
+    """Run every queued operation that is due; returns how many ran."""
+    recovered = _recover()
+    if recovered:
+        logger.warning("%d operation(s) were interrupted by a worker stop", recovered)
+    ran = 0
+    while not lifecycle.draining():
+        op = _claim()
+        if op is None:
+            break
+        run_claimed(op)
+        ran += 1
+    _prune()
+    return ran
+
+
+def _run() -> None:
+    while not lifecycle.draining():
+        try:
+            resume_once()
+        except Exception:
+            logger.exception("Resuming queued operations failed")
+        time.sleep(OPERATIONS_RESUME_INTERVAL)
+
+
+def start() -> None:
+    global _thread, _thread_pid
+    if OPERATIONS_RESUME_INTERVAL <= 0:
+        return
+    if _thread is not None and _thread.is_alive() and _thread_pid == os.getpid():
+        return
+    _thread = threading.Thread(target=_run, name="operations-resumer", daemon=True)
+    _thread_pid = os.getpid()
+    _thread.start()
+
+
+# -- drain --------------------------------------------------------------------
+
+def _drain_operations(deadline: float) -> None:
+    with _active_cond:
+        while _active and time.monotonic() < deadline:
+            _active_cond.wait(deadline - time.monotonic())
+        left = _active
+    if left:
+        # Past the deadline: whatever is still running may or may not reach Instagram
+        _conn().execute("UPDATE operations SET state = ?, error = ?, updated_at = ? WHERE state = ? AND owner = ?",
+                        (INTERRUPTED, "Worker stopped while the operation was running", time.time(), RUNNING,
+                         _owner()))
+        logger.warning("%d operation(s) still running at the drain deadline", left)
+
+
+def _persist_webhooks(deadline: float) -> None:
+    # Let sends in progress finish first; whatever is left (queued, waiting for a
+    # retry or still being sent at the deadline) is journaled for the next worker
+    webhooks.dispatcher.stop(max(0.0, deadline - time.monotonic()))
+    items = webhooks.dispatcher.take_pending()
+    if not items:
+        return
+    now = time.time()
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        conn.executemany(
+            "INSERT INTO operations (id, kind, account, params, state, created_at, updated_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(uuid.uuid4().hex, WEBHOOK_EVENT, event.get("username"),
+              dumps({"subscription": sub["id"], "event": event}), QUEUED, now, now) for sub, event in items])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    logger.info("Queued %d undelivered webhook event(s) for the next worker", len(items))
+
+
+lifecycle.on_drain("operations", _drain_operations)
+lifecycle.on_drain("webhooks", _persist_webhooks)
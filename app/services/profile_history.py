@@ -0,0 +1,249 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from .instagram_client import resume_session
+from ..utils import session_manager
+from ..utils.log import account_context
+
+# Time series of follower/following/media counts per profile. Rows are
+# clustered by (pk, ts) so a window of one profile is a contiguous range read;
+# usernames live in a separate table because they can change.
+SNAPSHOT_DB = Path(os.getenv("SNAPSHOT_DB") or session_manager.SESSIONS_DIR / ".snapshots.db")
+# Collector: every managed account plus SNAPSHOT_TARGETS (looked up via SNAPSHOT_ACCOUNT)
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", "3600"))
+SNAPSHOT_TARGETS = [t.strip() for t in os.getenv("SNAPSHOT_TARGETS", "").split(",") if t.strip()]
+SNAPSHOT_ACCOUNT = os.getenv("SNAPSHOT_ACCOUNT")
+SNAPSHOT_PARALLEL = int(os.getenv("SNAPSHOT_PARALLEL", "4"))
+# A profile seen by /profile more often than this is not recorded again
+SNAPSHOT_MIN_SPACING = float(os.getenv("SNAPSHOT_MIN_SPACING", "300"))
+
+METRICS = ("follower_count", "following_count", "media_count")
+BUCKETS = {"hour": 3600, "day": 86400, "week": 7 * 86400}
+
+logger = logging.getLogger("pipegram.snapshots")
+
+_local = threading.local()
+_thread: Optional[threading.Thread] = None
+_thread_pid: Optional[int] = None
+
+
+def _conn() -> sqlite3.Connection:
+    # One connection per thread and per process, as in SqliteStore
+    conn = getattr(_local, "conn", None)
+    if conn is None or getattr(_local, "pid", None) != os.getpid():
+        SNAPSHOT_DB.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(SNAPSHOT_DB), timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS profiles (
+                pk INTEGER PRIMARY KEY,
+                username TEXT NOT NULL,
+                updated_at INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS profiles_username ON profiles (username);
+            CREATE TABLE IF NOT EXISTS snapshots (
+                pk INTEGER NOT NULL,
+                ts INTEGER NOT NULL,
+                follower_count INTEGER,
+                following_count INTEGER,
+                media_count INTEGER,
+                PRIMARY KEY (pk, ts)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS collector_lease (
+                name TEXT PRIMARY KEY,
+                owner INTEGER NOT NULL,
+                expires_at REAL NOT NULL
+            );
+            """
+        )
+        _local.conn = conn
+        _local.pid = os.getpid()
+    return conn
+
+
+def record_many(profiles: Iterable[Dict[str, Any]], ts: Optional[int] = None,
+                min_spacing: float = 0) -> int:
+    """Store one snapshot per profile (user_info() dicts) in a single transaction."""
+    ts = int(ts or time.time())
+    rows = [(int(p["pk"]), p["username"].lower(), *(p.get(m) for m in METRICS)) for p in profiles]
+    if not rows:
+        return 0
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if min_spacing:
+            recent = {pk for (pk,) in conn.execute(
+                f"SELECT DISTINCT pk FROM snapshots WHERE ts > ? AND pk IN ({','.join('?' * len(rows))})",
+                (ts - min_spacing, *(r[0] for r in rows)))}
+            rows = [r for r in rows if r[0] not in recent]
+        conn.executemany(
+            "INSERT OR REPLACE INTO profiles (pk, username, updated_at) VALUES (?, ?, ?)",
+            [(r[0], r[1], ts) for r in rows])
+        conn.executemany(
+            "INSERT OR REPLACE INTO snapshots (pk, ts, follower_count, following_count, media_count) "
+            "VALUES (?, ?, ?, ?, ?)",
+            [(r[0], ts, *r[2:]) for r in rows])
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return len(rows)
+
+
+def record(profile: Dict[str, Any]) -> None:
+    # Opportunistic: called from /profile/<target>, never fails the request
+    try:
+        record_many([profile], min_spacing=SNAPSHOT_MIN_SPACING)
+    except Exception as exc:
+        logger.warning("Could not record snapshot of %s: %s", profile.get("username"), exc)
+
+
+def resolve_pk(username: str) -> Optional[int]:
+    row = _conn().execute(
+        "SELECT pk FROM profiles WHERE username = ? ORDER BY updated_at DESC LIMIT 1", (username.lower(),)
+    ).fetchone()
+    return row[0] if row else None
+
+
+def history(username: str, since: Optional[int] = None, until: Optional[int] = None,
+            bucket: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Snapshots of one profile in [since, until) with deltas and min/max/avg per metric.
+    With `bucket`, points are the last snapshot of each hour/day/week."""
+    pk = resolve_pk(username)
+    if pk is None:
+        return None
+    since = int(since or 0)
+    until = int(until or time.time() + 1)
+    conn = _conn()
+    if bucket:
+        # SQLite returns the bare columns of the row holding MAX(ts) in each group
+        size = BUCKETS[bucket]
+        rows = conn.execute(
+            "SELECT MAX(ts), follower_count, following_count, media_count FROM snapshots "
+            "WHERE pk = ? AND ts >= ? AND ts < ? GROUP BY ts / ? ORDER BY 1",
+            (pk, since, until, size)).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT ts, follower_count, following_count, media_count FROM snapshots "
+            "WHERE pk = ? AND ts >= ? AND ts < ? ORDER BY ts",
+            (pk, since, until)).fetchall()
+    aggregates = conn.execute(
+        "SELECT COUNT(*), " + ", ".join(f"MIN({m}), MAX({m}), AVG({m})" for m in METRICS) +
+        " FROM snapshots WHERE pk = ? AND ts >= ? AND ts < ?", (pk, since, until)).fetchone()
+
+    points = [dict(zip(("ts",) + METRICS, row)) for row in rows]
+    result: Dict[str, Any] = {"username": username.lower(), "pk": str(pk), "snapshots": aggregates[0],
+                              "points": points, "delta": None, "per_day": None, "aggregates": {}}
+    if points:
+        # Deltas span the first and last snapshot of the window, whatever the bucketing
+        first, last = (
+            dict(zip(("ts",) + METRICS, conn.execute(
+                "SELECT ts, follower_count, following_count, media_count FROM snapshots "
+                f"WHERE pk = ? AND ts >= ? AND ts < ? ORDER BY ts {order} LIMIT 1", (pk, since, until)).fetchone()))
+            for order in ("ASC", "DESC"))
+        days = (last["ts"] - first["ts"]) / 86400
+        result["delta"] = {m: _diff(last[m], first[m]) for m in METRICS}
+        result["delta"]["seconds"] = last["ts"] - first["ts"]
+        result["per_day"] = {m: round(result["delta"][m] / days, 2) if days and result["delta"][m] is not None
+                             else None for m in METRICS}
+        for i, m in enumerate(METRICS):
+            low, high, avg = aggregates[1 + 3 * i: 4 + 3 * i]
+            result["aggregates"][m] = {"min": low, "max": high, "avg": round(avg, 2) if avg is not None else None}
+    return result
+
+
+def _diff(a: Optional[int], b: Optional[int]) -> Optional[int]:
+    return a - b if a is not None and b is not None else None
+
+
+def _fetch(username: str, targets: List[str]) -> Tuple[List[Dict[str, Any]], int]:
+    async def run() -> Tuple[List[Dict[str, Any]], int]:
+        try:
+            client = await resume_session(username)
+        except Exception as exc:
+            logger.warning("Snapshots via %s skipped: %s", username, exc)
+            return [], len(targets)
+        profiles, failed = [], 0
+        for target in targets:
+            try:
+                profiles.append(await client.user_info(target))
+            except Exception as exc:
+                failed += 1
+                logger.warning("Snapshot of %s failed: %s", target, exc)
+        return profiles, failed
+    with account_context(username):
+        return asyncio.run(run())
+
+
+def collect_once() -> Dict[str, int]:
+    """Snapshot every managed account (through its own session) and SNAPSHOT_TARGETS.
+    Lookups run in parallel across sessions and are written in one transaction."""
+    managed = session_manager.list_sessions()
+    jobs: Dict[str, List[str]] = {u: [u] for u in managed}
+    if SNAPSHOT_TARGETS:
+        account = SNAPSHOT_ACCOUNT or (managed[0] if managed else None)
+        if account:
+            jobs.setdefault(account, []).extend(t for t in SNAPSHOT_TARGETS if t not in jobs.get(account, []))
+    if not jobs:
+        return {"recorded": 0, "failed": 0}
+    profiles: List[Dict[str, Any]] = []
+    failed = 0
+    with ThreadPoolExecutor(max_workers=max(1, SNAPSHOT_PARALLEL), thread_name_prefix="snapshots") as executor:
+        for fetched, errors in executor.map(lambda job: _fetch(*job), jobs.items()):
+            profiles.extend(fetched)
+            failed += errors
+    recorded = record_many(profiles)
+    logger.info("Recorded %d profile snapshots (%d failed)", recorded, failed)
+    return {"recorded": recorded, "failed": failed}
+
+
+def _take_turn() -> bool:
+    """Claim the collector lease for SNAPSHOT_INTERVAL. The lease lives in the snapshot
+    database itself, so exactly one of the processes writing to it collects per
+    interval whatever STATE_BACKEND is."""
+    now = time.time()
+    conn = _conn()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute("SELECT expires_at FROM collector_lease WHERE name = 'snapshots'").fetchone()
+        taken = row is None or row[0] <= now
+        if taken:
+            conn.execute(
+                "INSERT INTO collector_lease (name, owner, expires_at) VALUES ('snapshots', ?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at",
+                (os.getpid(), now + SNAPSHOT_INTERVAL))
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return taken
+
+
+def _run() -> None:
+    while True:
+        try:
+            if _take_turn():
+                collect_once()
+        except Exception:
+            logger.exception("Snapshot collection failed")
+        time.sleep(SNAPSHOT_INTERVAL)
+
+
+def start() -> None:
+    global _thread, _thread_pid
+    if SNAPSHOT_INTERVAL <= 0:
+        return
+    if _thread is not None and _thread.is_alive() and _thread_pid == os.getpid():
+        return
+    _thread = threading.Thread(target=_run, name="snapshot-collector", daemon=True)
+    _thread_pid = os.getpid()
+    _thread.start()
@@ -0,0 +1,156 @@
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+# Compact response objects projected from instagrapi's pydantic models in a
+# single pass. The JSON provider serializes them through to_dict().
+
+
+def _url(value: Any) -> str:
+    return str(value) if value else ""
+
+
+class _DTO:
+    __slots__ = ()
+
+    def to_dict(self, fields: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+        names = self.__slots__ if not fields else [n for n in self.__slots__ if n in fields]
+        return {name: getattr(self, name) for name in names}
+
+
+class UserDTO(_DTO):
+    __slots__ = ("username", "full_name", "profile_pic_url")
+
+    def __init__(self, username: str, full_name: str, profile_pic_url: str) -> None:
+        self.username = username
+        self.full_name = full_name
+        self.profile_pic_url = profile_pic_url
+
+    @classmethod
+    def from_model(cls, user: Any) -> "UserDTO":
+        return cls(user.username or "", user.full_name or "", _url(user.profile_pic_url))
+
+
+class RelationDTO(_DTO):
+    __slots__ = ("pk", "username", "full_name", "is_private", "profile_pic_url")
+
+    def __init__(self, pk: str, username: str, full_name: str, is_private: Optional[bool], profile_pic_url: str) -> None:
+        self.pk = pk
+        self.username = username
+        self.full_name = full_name
+        self.is_private = is_private
+        self.profile_pic_url = profile_pic_url
+
+    @classmethod
+    def from_model(cls, user: Any) -> "RelationDTO":
+        return cls(str(user.pk), user.username or "", user.full_name or "", user.is_private, _url(user.profile_pic_url))
+
+
+class ThreadDTO(_DTO):
+    __slots__ = ("thread_id", "thread_title", "users", "last_message", "last_message_timestamp")
+
+    def __init__(self, thread_id: str, thread_title: Optional[str], users: Optional[List[UserDTO]],
+                 last_message: Optional[str], last_message_timestamp: Any) -> None:
+        self.thread_id = thread_id
+        self.thread_title = thread_title
+        self.users = users
+        self.last_message = last_message
+        self.last_message_timestamp = last_message_timestamp
+
+    @classmethod
+    def from_model(cls, thread: Any, fields: Optional[frozenset] = None) -> "ThreadDTO":
+        want_users = not fields or "users" in fields
+        want_title = not fields or "thread_title" in fields
+        # Total over what instagrapi may leave empty (no users, no items), so one odd
+        # thread can't fail the whole inbox
+        users = [UserDTO.from_model(u) for u in thread.users or ()] if want_users or want_title else None
+
+        last_message = last_timestamp = None
+        messages = thread.messages or ()
+        if messages:
+            # instagrapi lists items newest first; pick the newest whatever the order
+            last = max((m for m in messages if m.timestamp), key=lambda m: m.timestamp, default=messages[0])
+            last_message, last_timestamp = last.text, last.timestamp
+
+        title = None
+        if want_title:
+            title = thread.thread_title
+            if not title:
+                usernames = [u.username for u in users if u.username]
+                title = f"Conversation with {', '.join(usernames)}" if usernames else "Direct Message"
+        return cls(str(thread.id), title, users if want_users else None, last_message, last_timestamp)
+
+
+class MessageDTO(_DTO):
+    __slots__ = ("id", "text", "timestamp", "user_id", "item_type", "media")
+
+    def __init__(self, id: str, text: Optional[str], timestamp: Any, user_id: Optional[str],
+                 item_type: Optional[str], media: Optional[Dict[str, Any]]) -> None:
+        self.id = id
+        self.text = text
+        self.timestamp = timestamp
+        self.user_id = user_id
+        self.item_type = item_type
+        self.media = media
+
+    @classmethod
+    def from_model(cls, msg: Any) -> "MessageDTO":
+        media = msg.media
+        if media is not None:
+            # Only what a client needs to render/download it, not the whole pydantic tree
+            media = {
+                "id": media.id,
+                "media_type": media.media_type,
+                "thumbnail_url": _url(media.thumbnail_url),
+                "video_url": _url(media.video_url),
+            }
+        return cls(msg.id, msg.text, msg.timestamp, msg.user_id, msg.item_type, media)
+
+
+class StoryDTO(_DTO):
+    __slots__ = ("id", "username", "media_type", "taken_at", "media_url")
+
+    def __init__(self, id: str, username: str, media_type: str, taken_at: Any, media_url: str) -> None:
+        self.id = id
+        self.username = username
+        self.media_type = media_type
+        self.taken_at = taken_at
+        self.media_url = media_url
+
+    @classmethod
+    def from_model(cls, story: Any, username: str) -> "StoryDTO":
+        return cls(str(story.pk), username, "photo" if story.media_type == 1 else "video",
+                   story.taken_at, _url(story.thumbnail_url))
+
+
+class MediaItemDTO(_DTO):
+    __slots__ = ("id", "kind", "media_type", "taken_at", "urls")
+
+    def __init__(self, id: str, kind: str, media_type: str, taken_at: Any, urls: List[str]) -> None:
+        self.id = id
+        self.kind = kind
+        self.media_type = media_type
+        self.taken_at = taken_at
+        self.urls = urls
+
+    @classmethod
+    def from_model(cls, media: Any, kind: str) -> "MediaItemDTO":
+        # Full-resolution sources: video_url for videos, the best image candidate
+        # (thumbnail_url) for photos, one per slide for albums
+        parts = getattr(media, "resources", None) or [media]
+        urls = [_url(p.video_url or p.thumbnail_url) for p in parts if p.video_url or p.thumbnail_url]
+        media_type = {1: "photo", 2: "video", 8: "album"}.get(media.media_type, str(media.media_type))
+        return cls(str(media.pk), kind, media_type, media.taken_at, urls)
+
+
+def parse_fields(raw: Optional[str]) -> Optional[frozenset]:
+    """`?fields=a,b` -> frozenset({"a", "b"}); None means every field."""
+    if not raw:
+        return None
+    fields = frozenset(f.strip() for f in raw.split(",") if f.strip())
+    return fields or None
+
+
+def select(items: Iterable[_DTO], fields: Optional[frozenset]) -> List[Any]:
+    # Without a selection the DTOs go straight to the JSON encoder
+    if not fields:
+        return list(items)
+    return [item.to_dict(fields) for item in items]
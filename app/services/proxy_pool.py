@@ -0,0 +1,159 @@
+import os
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional
+
+from ..utils.state_store import get_store
+
+PROXY_POOL = os.getenv("PROXY_POOL", "")
+PROXY_POOL_FILE = os.getenv("PROXY_POOL_FILE")
+PROXY_PROBE_URL = os.getenv("PROXY_PROBE_URL", "https://i.instagram.com/")
+PROXY_PROBE_INTERVAL = float(os.getenv("PROXY_PROBE_INTERVAL", "60"))
+PROXY_PROBE_TIMEOUT = float(os.getenv("PROXY_PROBE_TIMEOUT", "10"))
+PROXY_FAILOVER_ERRORS = int(os.getenv("PROXY_FAILOVER_ERRORS", "3"))
+
+# Smoothing factor for latency/error moving averages
+_ALPHA = 0.2
+
+# Exception class names that point at the proxy/network rather than at Instagram
+PROXY_ERROR_NAMES = {
+    "ConnectionError", "ProxyError", "ConnectTimeout", "ReadTimeout", "Timeout", "SSLError",
+    "ClientConnectionError", "ClientRequestTimeout", "ClientIncompleteReadError", "ProxyAddressIsBlocked",
+}
+
+
+def is_proxy_error(exc: BaseException) -> bool:
+    return any(cls.__name__ in PROXY_ERROR_NAMES for cls in type(exc).__mro__)
+
+
+class ProxyStats:
+    __slots__ = ("proxy", "latency", "error_rate", "consecutive_errors", "requests", "errors", "last_probe")
+
+    def __init__(self, proxy: str) -> None:
+        self.proxy = proxy
+        self.latency = 1.0
+        self.error_rate = 0.0
+        self.consecutive_errors = 0
+        self.requests = 0
+        self.errors = 0
+        self.last_probe: Optional[float] = None
+
+    @property
+    def healthy(self) -> bool:
+        return self.consecutive_errors < PROXY_FAILOVER_ERRORS
+
+    @property
+    def score(self) -> float:
+        # Lower is better: slow proxies and flaky proxies are both penalised
+        return self.latency * (1 + 4 * self.error_rate)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "proxy": self.proxy,
+            "healthy": self.healthy,
+            "latency_ms": round(self.latency * 1000, 1),
+            "error_rate": round(self.error_rate, 3),
+            "consecutive_errors": self.consecutive_errors,
+            "requests": self.requests,
+            "errors": self.errors,
+            "last_probe": self.last_probe,
+        }
+
+
+class ProxyPool:
+    def __init__(self, proxies: List[str]) -> None:
+        self._stats: Dict[str, ProxyStats] = {p: ProxyStats(p) for p in dict.fromkeys(proxies)}
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self._stats)
+
+    def __contains__(self, proxy: Optional[str]) -> bool:
+        return proxy in self._stats
+
+    def is_healthy(self, proxy: str) -> bool:
+        stats = self._stats.get(proxy)
+        return stats is None or stats.healthy
+
+    def report(self, proxy: Optional[str], latency: float, ok: bool) -> None:
+        stats = self._stats.get(proxy)
+        if stats is None:
+            return
+        with self._lock:
+            stats.requests += 1
+            stats.latency += _ALPHA * (latency - stats.latency)
+            stats.error_rate += _ALPHA * ((0.0 if ok else 1.0) - stats.error_rate)
+            if ok:
+                stats.consecutive_errors = 0
+            else:
+                stats.errors += 1
+                stats.consecutive_errors += 1
+
+    def assign(self, username: str, current: Optional[str] = None) -> Optional[str]:
+        """Sticky assignment: keep the account on its proxy while it is healthy."""
+        if not self.enabled:
+            return current
+        if current in self._stats and self.is_healthy(current):
+            return current
+        store = get_store()
+        assigned = store.get(f"proxy:assign:{username}")
+        if assigned in self._stats and self.is_healthy(assigned):
+            return assigned
+        with self._lock:
+            candidates = [s for s in self._stats.values() if s.healthy] or list(self._stats.values())
+            best = min(s.score for s in candidates)
+            # Among proxies close to the best score, spread accounts by a stable hash
+            near = sorted(s.proxy for s in candidates if s.score <= best * 1.5)
+            choice = near[zlib.crc32(username.encode("utf-8")) % len(near)]
+        store.set(f"proxy:assign:{username}", choice)
+        return choice
+
+    def probe(self, proxy: str) -> bool:
+        import requests
+        started = time.perf_counter()
+        try:
+            resp = requests.get(PROXY_PROBE_URL, proxies={"http": proxy, "https": proxy},
+                                timeout=PROXY_PROBE_TIMEOUT, allow_redirects=False)
+            ok = resp.status_code < 500
+        except requests.RequestException:
+            ok = False
+        self.report(proxy, time.perf_counter() - started, ok)
+        self._stats[proxy].last_probe = time.time()
+        return ok
+
+    def probe_all(self) -> None:
+        for proxy in list(self._stats):
+            self.probe(proxy)
+
+    def _run(self) -> None:
+        while True:
+            self.probe_all()
+            time.sleep(PROXY_PROBE_INTERVAL)
+
+    def start(self) -> None:
+        if not self.enabled or PROXY_PROBE_INTERVAL <= 0:
+            return
+        if self._thread is not None and self._thread.is_alive() and self._thread_pid == os.getpid():
+            return
+        self._thread = threading.Thread(target=self._run, name="proxy-pool-probe", daemon=True)
+        self._thread_pid = os.getpid()
+        self._thread.start()
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [s.as_dict() for s in self._stats.values()]
+
+
+def _configured_proxies() -> List[str]:
+    raw = PROXY_POOL
+    if PROXY_POOL_FILE and os.path.exists(PROXY_POOL_FILE):
+        with open(PROXY_POOL_FILE, encoding="utf-8") as fh:
+            raw = fh.read()
+    return [p.strip() for p in raw.replace("\n", ",").split(",") if p.strip() and not p.strip().startswith("#")]
+
+
+pool = ProxyPool(_configured_proxies())
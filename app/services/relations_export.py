@@ -0,0 +1,106 @@
+import asyncio
+import csv
+import io
+import logging
+import os
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from .projections import RelationDTO
+from .session_adapter import InstagramSessionAdapter
+from ..utils.json_provider import dumps_bytes
+from ..utils.state_store import get_store
+
+# Followers/following are fetched one page at a time and written out as they
+# arrive, so memory stays at ~2 pages (current + read-ahead) whatever the size.
+EXPORT_PAGE_SIZE = int(os.getenv("EXPORT_PAGE_SIZE", "200"))
+# Pause between upstream pages; large exports are what gets accounts rate limited
+EXPORT_PAGE_DELAY = float(os.getenv("EXPORT_PAGE_DELAY", "0"))
+EXPORT_CHECKPOINT_TTL = int(os.getenv("EXPORT_CHECKPOINT_TTL", str(7 * 24 * 3600)))
+
+logger = logging.getLogger("pipegram.export")
+
+Page = Tuple[List[RelationDTO], str]
+
+
+def _checkpoint_key(username: str, kind: str, target: str, name: str) -> str:
+    return f"export:checkpoint:{username.lower()}:{kind}:{target.lower()}:{name}"
+
+
+def load_checkpoint(username: str, kind: str, target: str, name: str) -> Optional[Dict[str, Any]]:
+    return get_store().get(_checkpoint_key(username, kind, target, name))
+
+
+def _save_checkpoint(username: str, kind: str, target: str, name: str, cursor: str, exported: int) -> None:
+    get_store().set(_checkpoint_key(username, kind, target, name), {
+        "cursor": cursor, "exported": exported, "done": not cursor, "updated_at": int(time.time()),
+    }, ttl=EXPORT_CHECKPOINT_TTL)
+
+
+def iter_pages(client: InstagramSessionAdapter, kind: str, user_id: str, cursor: str = "",
+               limit: Optional[int] = None) -> Iterator[Tuple[List[RelationDTO], str]]:
+    """Yield (users, next_cursor) per upstream page, fetching the next page while the
+    current one is being written. `limit` stops at the page that reaches it, so the
+    returned cursor always resumes exactly where the export ended."""
+    def fetch(page_cursor: str) -> Page:
+        return asyncio.run(client.relations_page(kind, user_id, page_cursor, EXPORT_PAGE_SIZE))
+
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+    try:
+        pending: Optional[Future] = executor.submit(fetch, cursor)
+        exported = 0
+        while pending is not None:
+            users, next_cursor = pending.result()
+            exported += len(users)
+            pending = None
+            if next_cursor and (not limit or exported < limit):
+                if EXPORT_PAGE_DELAY:
+                    time.sleep(EXPORT_PAGE_DELAY)
+                pending = executor.submit(fetch, next_cursor)
+            yield users, next_cursor
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def export(client: InstagramSessionAdapter, kind: str, target: str, user_id: str, fmt: str = "ndjson",
+           cursor: str = "", limit: Optional[int] = None, checkpoint: Optional[str] = None,
+           resumed: int = 0) -> Iterator[bytes]:
+    """Encoded export body. NDJSON ends with a {"summary": ...} line holding the cursor
+    to resume from; on an upstream error it ends with {"error", "cursor"} instead.
+    CSV has no room for either: an upstream error is re-raised, so the server aborts
+    the response instead of ending it like a complete file, and the cursor is only
+    in the checkpoint. `resumed` is how many users earlier runs of the same
+    checkpoint exported."""
+    exported = 0
+    position = cursor
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        if not cursor:
+            writer.writerow(RelationDTO.__slots__)
+    try:
+        for users, next_cursor in iter_pages(client, kind, user_id, cursor, limit):
+            if fmt == "csv":
+                writer.writerows([getattr(u, f) for f in RelationDTO.__slots__] for u in users)
+                chunk = buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+            else:
+                chunk = b"".join(dumps_bytes(u) + b"\n" for u in users)
+            yield chunk
+            # Resumed, so the server has written the page: only now may the
+            # checkpoint move past it
+            exported += len(users)
+            position = next_cursor
+            if checkpoint:
+                _save_checkpoint(client.username, kind, target, checkpoint, next_cursor, resumed + exported)
+    except Exception as exc:
+        logger.warning("Export of %s %s stopped at cursor %r: %s", target, kind, position, exc)
+        if fmt == "csv":
+            raise
+        yield dumps_bytes({"error": str(exc), "cursor": position, "exported": exported}) + b"\n"
+        return
+    if fmt == "ndjson":
+        yield dumps_bytes({"summary": {"kind": kind, "target": target, "exported": exported,
+                                       "cursor": position, "done": not position}}) + b"\n"
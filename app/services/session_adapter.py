@@ -1,19 +1,105 @@
-from typing import Any, Dict, List, Optional
-import tempfile
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
 import os
-from instagrapi import Client
-
+import threading
+import time
+from .proxy_pool import pool as proxy_pool, is_proxy_error
+from . import circuit_breaker, session_status
+from .projections import MediaItemDTO, MessageDTO, RelationDTO, StoryDTO, ThreadDTO
+from ..errors import CircuitOpenError
+from ..utils import session_manager
+from ..utils.metrics import INSTAGRAM_CALL_SECONDS, INSTAGRAM_ERRORS, INSTAGRAM_IN_FLIGHT, instrument_methods
+from ..utils.tracing import http_response_hook, span, trace_methods
+
+if TYPE_CHECKING:
+    from instagrapi import Client
+
+
+def _default_client_class() -> Callable[[], "Client"]:
+    # instagrapi (and its pydantic models) is most of the app's import time,
+    # so it is only loaded once a client is actually needed
+    from instagrapi import Client
+    return Client
+
+@trace_methods("adapter")
+@instrument_methods
 class InstagramSessionAdapter:
+    # Swappable for tests/benchmarks (see bench/fake_instagrapi.py)
+    client_factory: Optional[Callable[[], "Client"]] = None
+
     def __init__(self, username: str, proxy: Optional[str] = None) -> None:
         self.username = username
         self.proxy = proxy
-        self.client: Optional[Client] = None
+        self.client: Optional["Client"] = None
+        # The warm adapter of an account is shared by concurrent requests, and an
+        # instagrapi Client is not thread-safe: one call at a time per adapter
+        # (waiting for it is not counted in the call timings)
+        self._lock = threading.RLock()
+
+    def _new_client(self) -> "Client":
+        client = (self.client_factory or _default_client_class())()
+        if self.proxy:
+            client.set_proxy(self.proxy)
+        # Upstream HTTP exchanges show up as spans under the instagrapi call
+        for session in (client.private, client.public):
+            session.hooks["response"].append(http_response_hook)
+        return client
+
+    def _call(self, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        # Every instagrapi call goes through here so proxy health is tracked per call
+        call = getattr(fn, "__name__", "call")
+        # Fails fast (CircuitOpenError) while this account, its proxy or Instagram is failing
+        proxy = self.proxy
+        try:
+            circuit_breaker.before_call(self.username, proxy)
+        except CircuitOpenError as exc:
+            # A tripped proxy is a reason to move the account, not to stop it
+            if exc.scope != "proxy":
+                raise
+            self._failover_proxy()
+            if self.proxy == proxy:
+                raise
+            proxy = self.proxy
+            circuit_breaker.before_call(self.username, proxy)
+        with self._lock:
+            started = time.perf_counter()
+            INSTAGRAM_IN_FLIGHT.inc()
+            try:
+                with span(f"instagrapi.{call}", proxy=bool(self.proxy)):
+                    result = fn(*args, **kwargs)
+            except Exception as exc:
+                circuit_breaker.after_call(self.username, proxy, exc)
+                INSTAGRAM_ERRORS.inc(call=call, exception=type(exc).__name__)
+                if is_proxy_error(exc):
+                    proxy_pool.report(self.proxy, time.perf_counter() - started, ok=False)
+                    self._failover_proxy()
+                else:
+                    session_status.record_failure(self.username, exc)
+                raise
+            finally:
+                INSTAGRAM_IN_FLIGHT.dec()
+                INSTAGRAM_CALL_SECONDS.observe(time.perf_counter() - started, call=call)
+        circuit_breaker.after_call(self.username, proxy)
+        proxy_pool.report(self.proxy, time.perf_counter() - started, ok=True)
+        return result
+
+    def _failover_proxy(self) -> None:
+        if self.proxy not in proxy_pool or proxy_pool.is_healthy(self.proxy):
+            return
+        new_proxy = proxy_pool.assign(self.username, current=self.proxy)
+        if not new_proxy or new_proxy == self.proxy:
+            return
+        with self._lock:
+            self.proxy = new_proxy
+            if self.client is not None:
+                self.client.set_proxy(new_proxy)
+        # Record the active proxy in the stored session
+        saved = session_manager.load_session(self.username)
+        if saved:
+            session_manager.save_session(self.username, {**saved, "proxy": new_proxy})
 
     async def login(self, username: str, password: str) -> None:
-        self.client = Client()
-        if self.proxy:
-            self.client.set_proxy(self.proxy)
-        self.client.login(username, password)
+        self.client = self._new_client()
+        self._call(self.client.login, username, password)
 
     async def serialize(self) -> Dict[str, Any]:
         settings = self.client.get_settings()  # serializable dict
@@ -29,118 +115,67 @@ class InstagramSessionAdapter:
         if not settings:
             raise ValueError("Settings missing in session")
 
-        self.client = Client()
-        if self.proxy:
-            self.client.set_proxy(self.proxy)
+        self.client = self._new_client()
 
         # FIX: for dict => set_settings (not load_settings)
         self.client.set_settings(settings)
 
+    async def validate(self) -> None:
+        # Cheapest authenticated call: fails with LoginRequired/ChallengeRequired on a dead session
+        self._call(self.client.account_info)
+
     async def current_user(self) -> Dict[str, Any]:
-        user = self.client.account_info()
+        user = self._call(self.client.account_info)
         return {
             "username": user.username,
             "full_name": user.full_name,
             "profile_pic_url": str(user.profile_pic_url) if user.profile_pic_url else '',
         }
 
-    async def publish_photo(self, file_bytes: bytes, caption: Optional[str] = None) -> Dict[str, Any]:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(file_bytes)
-            tmp_path = tmp.name
-        try:
-            media = self.client.photo_upload(tmp_path, caption=caption or "")
-            return {"id": media.id, "caption": caption or ""}
-        finally:
-            try: os.remove(tmp_path)
-            except OSError: pass
-
-    async def publish_story_photo(self, file_bytes: bytes) -> Dict[str, Any]:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(file_bytes)
-            tmp_path = tmp.name
-        try:
-            story = self.client.photo_upload_to_story(tmp_path)
-            return {"id": story.id}
-        finally:
-            try: os.remove(tmp_path)
-            except OSError: pass
+    # Media methods take the path of a file staged by services.media.ingest()
+    async def publish_photo(self, path: str, caption: Optional[str] = None) -> Dict[str, Any]:
+        media = self._call(self.client.photo_upload, path, caption=caption or "")
+        return {"id": media.id, "caption": caption or ""}
+
+    async def publish_story_photo(self, path: str) -> Dict[str, Any]:
+        story = self._call(self.client.photo_upload_to_story, path)
+        return {"id": story.id}
 
     async def send_text_dm(self, to_username: str, message: str) -> None:
-        user_id = self.client.user_id_from_username(to_username)
+        user_id = self._call(self.client.user_id_from_username, to_username)
         # Official instagrapi doc: direct_send(text, user_ids=[...])
-        self.client.direct_send(text=message, user_ids=[user_id])
-
-    async def send_photo_dm_from_bytes(self, to_username: str, image_bytes: bytes) -> None:
-        user_id = self.client.user_id_from_username(to_username)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(image_bytes)
-            tmp_path = tmp.name
-        try:
-            # Official doc: direct_send_photo(path, user_ids=[...])
-            self.client.direct_send_photo(path=tmp_path, user_ids=[user_id])
-        finally:
-            try: os.remove(tmp_path)
-            except OSError: pass
-
-    async def inbox(self) -> list:
-        threads = self.client.direct_threads()
-        simplified = []
-        for thread in threads:
-            try:
-                users = [{
-                    "username": getattr(u, 'username', ''),
-                    "full_name": getattr(u, 'full_name', ''),
-                    "profile_pic_url": str(getattr(u, 'profile_pic_url', '')) if getattr(u, 'profile_pic_url', '') else '',
-                } for u in getattr(thread, 'users', [])]
-                
-                last_message = None
-                last_message_timestamp = None
-                if hasattr(thread, 'messages') and thread.messages:
-                    last_msg = thread.messages[-1]
-                    last_message = getattr(last_msg, 'text', '')
-                    last_message_timestamp = getattr(last_msg, 'timestamp', '')
-                
-                # Tenta obter o título do thread de forma segura
-                thread_title = None
-                try:
-                    if hasattr(thread, 'title') and thread.title:
-                        thread_title = thread.title
-                    elif hasattr(thread, 'name') and thread.name:
-                        thread_title = thread.name
-                    else:
-                        # Cria um título baseado nos usuários
-                        usernames = [u.get('username') for u in users if u.get('username')]
-                        thread_title = f"Conversation with {', '.join(usernames)}" if usernames else "Direct Message"
-                except Exception:
-                    thread_title = "Direct Message"
-                
-                simplified.append({
-                    "thread_id": str(getattr(thread, 'id', 'unknown')),
-                    "thread_title": thread_title,
-                    "users": users,
-                    "last_message": last_message,
-                    "last_message_timestamp": last_message_timestamp,
-                })
-            except Exception as e:
-                # Se houver erro ao processar um thread específico, continua com os outros
-                print(f"Error processing thread {getattr(thread, 'id', 'unknown')}: {e}")
-                continue
-        return simplified
-
-    async def thread_messages(self, thread_id: str) -> Dict[str, Any]:
-        thread = self.client.direct_thread(thread_id)
-        messages = [{
-            "id": msg.id,
-            "text": msg.text,
-            "timestamp": msg.timestamp,
-            "user_id": msg.user_id,
-            "media": getattr(msg, "media", None),
-        } for msg in thread.messages]
-        return {"thread_id": thread_id, "messages": messages}
+        self._call(self.client.direct_send, text=message, user_ids=[user_id])
+
+    async def send_photo_dm(self, to_username: str, path: str) -> None:
+        user_id = self._call(self.client.user_id_from_username, to_username)
+        # Official doc: direct_send_photo(path, user_ids=[...])
+        self._call(self.client.direct_send_photo, path=path, user_ids=[user_id])
+
+    async def inbox(self, fields: Optional[frozenset] = None) -> List[ThreadDTO]:
+        threads = self._call(self.client.direct_threads)
+        return [ThreadDTO.from_model(thread, fields) for thread in threads]
+
+    async def thread_messages(self, thread_id: str, amount: int = 20) -> Dict[str, Any]:
+        thread = self._call(self.client.direct_thread, thread_id, amount)
+        return {"thread_id": thread_id, "messages": [MessageDTO.from_model(msg) for msg in thread.messages]}
+
+    async def thread_messages_page(self, thread_id: str, cursor: str = "",
+                                   amount: int = 20) -> Tuple[List[MessageDTO], str]:
+        # Newest first; an empty cursor in the result means the end. direct_thread()
+        # follows the thread cursor internally but never returns it, so this is the
+        # same request made one page at a time
+        from instagrapi.extractors import extract_direct_message
+        params = {"visual_message_return_type": "unseen", "direction": "older", "seq_id": "40065",
+                  "limit": str(amount)}
+        if cursor:
+            params["cursor"] = cursor
+        result = self._call(self.client.private_request, f"direct_v2/threads/{thread_id}/", params=params)
+        thread = result["thread"]
+        messages = [MessageDTO.from_model(extract_direct_message(item)) for item in thread["items"]]
+        return messages, thread.get("oldest_cursor") or ""
 
     async def user_info(self, target_username: str) -> Dict[str, Any]:
-        user = self.client.user_info_by_username(target_username)
+        user = self._call(self.client.user_info_by_username, target_username)
         return {
             "pk": user.pk,
             "username": user.username,
@@ -153,29 +188,31 @@ class InstagramSessionAdapter:
             "profile_pic_url": str(user.profile_pic_url) if user.profile_pic_url else '',
         }
 
-    async def user_stories(self, target_username: str) -> List[Dict[str, Any]]:
-        user_id = self.client.user_id_from_username(target_username)
-        stories = self.client.user_stories(user_id)
-        result = []
-        for story in stories:
-            media_type = "photo" if story.media_type == 1 else "video"
-            result.append({
-                "username": target_username,
-                "media_type": media_type,
-                "taken_at": story.taken_at,
-                "media_url": str(story.thumbnail_url) if story.thumbnail_url else '',
-            })
-        return result
+    async def user_stories(self, target_username: str) -> List[StoryDTO]:
+        user_id = self._call(self.client.user_id_from_username, target_username)
+        stories = self._call(self.client.user_stories, user_id)
+        return [StoryDTO.from_model(story, target_username) for story in stories]
 
-    async def change_profile_picture(self, file_bytes: bytes) -> None:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".jpg") as tmp:
-            tmp.write(file_bytes)
-            tmp_path = tmp.name
-        try:
-            self.client.account_change_picture(tmp_path)
-        finally:
-            try: os.remove(tmp_path)
-            except OSError: pass
+    async def user_id(self, target_username: str) -> str:
+        return str(self._call(self.client.user_id_from_username, target_username))
+
+    async def relations_page(self, kind: str, user_id: str, cursor: str = "",
+                             page_size: int = 200) -> Tuple[List[RelationDTO], str]:
+        # One page of followers/following; an empty cursor in the result means the end
+        fetch = self.client.user_followers_v1_chunk if kind == "followers" else self.client.user_following_v1_chunk
+        users, next_cursor = self._call(fetch, user_id, max_amount=page_size, max_id=cursor)
+        return [RelationDTO.from_model(u) for u in users], next_cursor or ""
+
+    async def story_items(self, user_id: str) -> List[MediaItemDTO]:
+        return [MediaItemDTO.from_model(s, "story") for s in self._call(self.client.user_stories, user_id)]
+
+    async def post_items_page(self, user_id: str, cursor: str = "", amount: int = 50) -> Tuple[List[MediaItemDTO], str]:
+        # Newest first; an empty cursor in the result means the end
+        medias, next_cursor = self._call(self.client.user_medias_paginated, user_id, amount, end_cursor=cursor)
+        return [MediaItemDTO.from_model(m, "post") for m in medias], next_cursor or ""
+
+    async def change_profile_picture(self, path: str) -> None:
+        self._call(self.client.account_change_picture, path)
 
     async def edit_bio(self, bio: str) -> None:
-        self.client.account_edit(biography=bio)
+        self._call(self.client.account_edit, biography=bio)
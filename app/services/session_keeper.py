@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from . import session_status
+from .instagram_client import persist_session, resume_session
+from ..utils import session_manager
+from ..utils.log import account_context
+from ..utils.state_store import get_store
+
+# Walk stored sessions in the background, check them cheaply and refresh
+# their cookies, so user requests don't discover stale sessions the slow way.
+SESSION_KEEPER_INTERVAL = float(os.getenv("SESSION_KEEPER_INTERVAL", "1800"))
+SESSION_KEEPER_SPACING = float(os.getenv("SESSION_KEEPER_SPACING", "2"))
+
+logger = logging.getLogger("pipegram.session_keeper")
+
+_thread: Optional[threading.Thread] = None
+_thread_pid: Optional[int] = None
+
+
+async def check_session(username: str) -> Dict[str, Any]:
+    try:
+        client = await resume_session(username)
+        await client.validate()
+        await persist_session(client)
+    except Exception as exc:
+        status = session_status.classify_error(exc)
+        return session_status.set_status(username, status, f"{type(exc).__name__}: {exc}")
+    return session_status.set_status(username, session_status.ACTIVE)
+
+
+def run_once() -> int:
+    checked = 0
+    for username in session_manager.list_sessions():
+        record = session_status.get_status(username)
+        # Skip sessions that were checked (or failed) recently, e.g. by another worker
+        if record and time.time() - record.get("checked_at", 0) < SESSION_KEEPER_INTERVAL / 2:
+            continue
+        with account_context(username):
+            asyncio.run(check_session(username))
+        checked += 1
+        time.sleep(SESSION_KEEPER_SPACING)
+    return checked
+
+
+def _run() -> None:
+    while True:
+        # Only one worker walks the sessions per interval
+        if get_store().add("session_keeper:lock", os.getpid(), ttl=SESSION_KEEPER_INTERVAL):
+            try:
+                run_once()
+            except Exception:
+                logger.exception("Session keeper run failed")
+        time.sleep(SESSION_KEEPER_INTERVAL)
+
+
+def start() -> None:
+    global _thread, _thread_pid
+    if SESSION_KEEPER_INTERVAL <= 0:
+        return
+    if _thread is not None and _thread.is_alive() and _thread_pid == os.getpid():
+        return
+    _thread = threading.Thread(target=_run, name="session-keeper", daemon=True)
+    _thread_pid = os.getpid()
+    _thread.start()
@@ -0,0 +1,61 @@
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from ..utils.state_store import get_store
+
+ACTIVE = "active"
+EXPIRED = "expired"
+CHALLENGE = "challenge"
+ERROR = "error"
+UNKNOWN = "unknown"
+
+# Matched by class name so this module does not need to import instagrapi
+_EXPIRED_ERRORS = {"LoginRequired", "ClientLoginRequired", "ClientUnauthorizedError", "BadPassword"}
+_CHALLENGE_ERRORS = {"ChallengeError", "ChallengeRequired", "FeedbackRequired"}
+
+
+# Called as listener(username, previous_status, record) after every status update
+_listeners: List[Callable[[str, Optional[str], Dict[str, Any]], None]] = []
+
+
+def add_listener(listener: Callable[[str, Optional[str], Dict[str, Any]], None]) -> None:
+    _listeners.append(listener)
+
+
+def classify_error(exc: BaseException) -> str:
+    names = {cls.__name__ for cls in type(exc).__mro__}
+    if names & _CHALLENGE_ERRORS:
+        return CHALLENGE
+    if names & _EXPIRED_ERRORS:
+        return EXPIRED
+    return ERROR
+
+
+def _key(username: str) -> str:
+    return f"session_status:{username}"
+
+
+def get_status(username: str) -> Optional[Dict[str, Any]]:
+    return get_store().get(_key(username))
+
+
+def set_status(username: str, status: str, detail: Optional[str] = None) -> Dict[str, Any]:
+    record = {"status": status, "checked_at": time.time(), "detail": detail}
+    store = get_store()
+    previous = store.get(_key(username)) if _listeners else None
+    store.set(_key(username), record)
+    for listener in _listeners:
+        listener(username, previous and previous.get("status"), record)
+    return record
+
+
+def clear_status(username: str) -> None:
+    get_store().delete(_key(username))
+
+
+def record_failure(username: str, exc: BaseException) -> None:
+    # Only errors that say something about the session itself are recorded;
+    # network/proxy hiccups must not mark a good session as broken.
+    status = classify_error(exc)
+    if status != ERROR:
+        set_status(username, status, f"{type(exc).__name__}: {exc}")
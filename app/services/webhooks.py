@@ -0,0 +1,429 @@
+import asyncio
+import hashlib
+import heapq
+import hmac
+import ipaddress
+import logging
+import os
+import queue
+import random
+import secrets
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple, Union
+from urllib.parse import urlsplit
+
+from . import session_status
+from ..utils.json_provider import dumps_bytes
+from ..utils.log import account_context
+from ..utils.metrics import WEBHOOK_DELIVERIES, WEBHOOK_DROPPED, WEBHOOK_QUEUE_DEPTH
+from ..utils.state_store import get_store
+
+# Callers register URLs per account and event type; events are queued
+# (bounded: a full queue drops events instead of slowing requests down),
+# batched per subscription, signed and POSTed by a small worker pool with
+# retries and exponential backoff.
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "4"))
+WEBHOOK_QUEUE_SIZE = int(os.getenv("WEBHOOK_QUEUE_SIZE", "10000"))
+WEBHOOK_BATCH_SIZE = int(os.getenv("WEBHOOK_BATCH_SIZE", "50"))
+WEBHOOK_BATCH_WAIT = float(os.getenv("WEBHOOK_BATCH_WAIT", "0.5"))
+WEBHOOK_TIMEOUT = float(os.getenv("WEBHOOK_TIMEOUT", "10"))
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "6"))
+WEBHOOK_RETRY_BASE = float(os.getenv("WEBHOOK_RETRY_BASE", "1"))
+# Inbox polling for dm.received, only for accounts somebody subscribed to (0 disables)
+WEBHOOK_INBOX_POLL_INTERVAL = float(os.getenv("WEBHOOK_INBOX_POLL_INTERVAL", "60"))
+# URLs resolving to loopback, private, link-local (cloud metadata) or other
+# non-public addresses are refused, at registration and again before every
+# delivery. Hosts and networks listed here (comma-separated, e.g.
+# "hooks.internal,10.1.0.0/16") are let through anyway.
+WEBHOOK_ALLOWED_HOSTS = os.getenv("WEBHOOK_ALLOWED_HOSTS", "")
+
+DM_RECEIVED = "dm.received"
+POST_PUBLISHED = "post.published"
+SESSION_EXPIRED = "session.expired"
+TEST = "webhook.test"
+EVENTS = (DM_RECEIVED, POST_PUBLISHED, SESSION_EXPIRED)
+
+SIGNATURE_HEADER = "X-Pipegram-Signature"
+_SUBSCRIPTION_PREFIX = "webhook:sub:"
+_SUBSCRIPTIONS_TTL = 2.0
+
+logger = logging.getLogger("pipegram.webhooks")
+
+
+# -- subscriptions ------------------------------------------------------------
+
+_subs_cache: Tuple[float, List[Dict[str, Any]]] = (0.0, [])
+
+
+def create_subscription(url: str, username: Optional[str], events: List[str]) -> Dict[str, Any]:
+    global _subs_cache
+    sub = {
+        "id": uuid.uuid4().hex,
+        "url": url,
+        "username": username,
+        "events": sorted(set(events)),
+        "secret": secrets.token_hex(32),
+        "created_at": time.time(),
+    }
+    get_store().set(_SUBSCRIPTION_PREFIX + sub["id"], sub)
+    _subs_cache = (0.0, [])
+    return sub
+
+
+def get_subscription(sub_id: str) -> Optional[Dict[str, Any]]:
+    return get_store().get(_SUBSCRIPTION_PREFIX + sub_id)
+
+
+def delete_subscription(sub_id: str) -> bool:
+    global _subs_cache
+    _subs_cache = (0.0, [])
+    return get_store().delete(_SUBSCRIPTION_PREFIX + sub_id)
+
+
+def list_subscriptions(username: Optional[str] = None) -> List[Dict[str, Any]]:
+    global _subs_cache
+    fetched_at, subs = _subs_cache
+    if time.monotonic() - fetched_at > _SUBSCRIPTIONS_TTL:
+        store = get_store()
+        subs = [s for s in (store.get(k) for k in store.keys(_SUBSCRIPTION_PREFIX)) if s]
+        subs.sort(key=lambda s: s["created_at"])
+        _subs_cache = (time.monotonic(), subs)
+    if username is None:
+        return list(subs)
+    return [s for s in subs if s["username"] in (None, username)]
+
+
+def public_view(sub: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: v for k, v in sub.items() if k != "secret"}
+
+
+def _matching(event: str, username: Optional[str]) -> List[Dict[str, Any]]:
+    return [s for s in list_subscriptions(username) if event in s["events"]]
+
+
+def _allowed(host: str, address: Union[ipaddress.IPv4Address, ipaddress.IPv6Address]) -> bool:
+    for entry in (e.strip() for e in WEBHOOK_ALLOWED_HOSTS.split(",")):
+        if not entry:
+            continue
+        if entry.lower() == host.lower():
+            return True
+        try:
+            if address in ipaddress.ip_network(entry, strict=False):
+                return True
+        except ValueError:
+            continue
+    return False
+
+
+def check_url(url: str) -> None:
+    """Raise ValueError unless url is http(s) and every address its host resolves
+    to is public (or allowed by WEBHOOK_ALLOWED_HOSTS)."""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise ValueError("url must be an http(s) URL")
+    host = parts.hostname
+    try:
+        port = parts.port or (443 if parts.scheme == "https" else 80)
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError, UnicodeError) as exc:
+        raise ValueError(f"url host {host} does not resolve: {exc}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if not address.is_global and not _allowed(host, address):
+            raise ValueError(f"url host {host} resolves to a non-public address ({address})")
+
+
+def sign(secret: str, timestamp: str, body: bytes) -> str:
+    digest = hmac.new(secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+    return f"sha256={digest}"
+
+
+# -- delivery -----------------------------------------------------------------
+
+class Dispatcher:
+    def __init__(self) -> None:
+        self._queue: "queue.Queue[Tuple[Dict[str, Any], Dict[str, Any]]]" = queue.Queue(maxsize=WEBHOOK_QUEUE_SIZE)
+        self._retries: List[Tuple[float, int, int, Dict[str, Any], List[Dict[str, Any]]]] = []
+        self._retry_cond = threading.Condition()
+        self._seq = 0
+        self._threads: List[threading.Thread] = []
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        # Batches a delivery thread took off the queue or the retry heap and is sending
+        self._in_flight: Dict[int, Tuple[Dict[str, Any], List[Dict[str, Any]]]] = {}
+
+    def start(self) -> None:
+        if self._pid == os.getpid() and all(t.is_alive() for t in self._threads):
+            return
+        with self._lock:
+            if self._stopping.is_set() or (self._pid == os.getpid() and all(t.is_alive() for t in self._threads)):
+                return
+            self._pid = os.getpid()
+            self._threads = [threading.Thread(target=self._work, name=f"webhook-{i}", daemon=True)
+                             for i in range(max(WEBHOOK_WORKERS, 1))]
+            self._threads.append(threading.Thread(target=self._schedule_retries, name="webhook-retry", daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+    def submit(self, sub: Dict[str, Any], event: Dict[str, Any]) -> bool:
+        self.start()
+        try:
+            self._queue.put_nowait((sub, event))
+        except queue.Full:
+            WEBHOOK_DROPPED.inc(event=event["type"])
+            logger.warning("Webhook queue full, dropping %s for %s", event["type"], sub["id"])
+            return False
+        WEBHOOK_QUEUE_DEPTH.set(self._queue.qsize())
+        return True
+
+    def stop(self, timeout: float = 5.0) -> None:
+        """Stop the delivery threads for good, letting sends in progress finish within
+        timeout. Events still queued or waiting for a retry stay for take_pending()."""
+        with self._lock:
+            threads, self._threads, self._pid = self._threads, [], None
+            self._stopping.set()
+        for _ in threads:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        with self._retry_cond:
+            self._retry_cond.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0.0, deadline - time.monotonic()))
+        # Drop the wake-up markers no worker consumed
+        with self._queue.mutex:
+            kept = [item for item in self._queue.queue if item is not None]
+            self._queue.queue.clear()
+            self._queue.queue.extend(kept)
+
+    def queued(self) -> int:
+        return self._queue.qsize()
+
+    def pending(self) -> int:
+        with self._retry_cond:
+            retrying = {id(item[4]) for item in self._retries}
+            return (self._queue.qsize() + sum(len(item[4]) for item in self._retries) +
+                    sum(len(events) for token, (_, events) in self._in_flight.items() if token not in retrying))
+
+    def take_pending(self) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        """Empty the queue and the retry heap, e.g. to persist them when the worker stops.
+        Batches still being sent are included too: they may arrive twice (receivers
+        dedupe by event id) rather than not at all."""
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None:
+                items.append(item)
+        with self._retry_cond:
+            items.extend((sub, event) for _, _, _, sub, events in self._retries for event in events)
+            # A batch that just failed sits in both until its thread returns
+            retrying = {id(events) for *_, events in self._retries}
+            self._retries.clear()
+            items.extend((sub, event) for token, (sub, events) in self._in_flight.items()
+                         if token not in retrying for event in events)
+            self._in_flight.clear()
+        WEBHOOK_QUEUE_DEPTH.set(self._queue.qsize())
+        return items
+
+    def _drain(self) -> List[Tuple[Dict[str, Any], Dict[str, Any]]]:
+        # None is the wake-up marker put by stop()
+        first = self._queue.get()
+        if first is None:
+            return []
+        items = [first]
+        deadline = time.monotonic() + WEBHOOK_BATCH_WAIT
+        while len(items) < WEBHOOK_BATCH_SIZE and not self._stopping.is_set():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put_nowait(None)
+                break
+            items.append(item)
+        WEBHOOK_QUEUE_DEPTH.set(self._queue.qsize())
+        return items
+
+    def _work(self) -> None:
+        import requests
+
+        http = requests.Session()
+        while not self._stopping.is_set():
+            batches: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+            subs: Dict[str, Dict[str, Any]] = {}
+            for sub, event in self._drain():
+                subs[sub["id"]] = sub
+                batches[sub["id"]].append(event)
+            for sub_id, events in batches.items():
+                self._send(http, subs[sub_id], events, attempt=1)
+
+    def _send(self, http: Any, sub: Dict[str, Any], events: List[Dict[str, Any]], attempt: int) -> None:
+        token = id(events)
+        with self._retry_cond:
+            self._in_flight[token] = (sub, events)
+        try:
+            self._deliver(http, sub, events, attempt)
+        finally:
+            with self._retry_cond:
+                self._in_flight.pop(token, None)
+
+    def _deliver(self, http: Any, sub: Dict[str, Any], events: List[Dict[str, Any]], attempt: int) -> None:
+        body = dumps_bytes({"delivery_id": uuid.uuid4().hex, "attempt": attempt, "events": events})
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "User-Agent": "pipegram-webhooks",
+            "X-Pipegram-Timestamp": timestamp,
+            SIGNATURE_HEADER: sign(sub["secret"], timestamp, body),
+        }
+        try:
+            # The host may resolve elsewhere now than at registration
+            check_url(sub["url"])
+        except ValueError as exc:
+            WEBHOOK_DELIVERIES.inc(result="failed")
+            logger.warning("Webhook %s not delivered: %s", sub["id"], exc)
+            return
+        try:
+            # Redirects are not followed: they could point anywhere
+            resp = http.post(sub["url"], data=body, headers=headers, timeout=WEBHOOK_TIMEOUT, allow_redirects=False)
+            ok, retry, reason = resp.status_code < 300, resp.status_code >= 500 or resp.status_code == 429, f"HTTP {resp.status_code}"
+        except Exception as exc:
+            ok, retry, reason = False, True, f"{type(exc).__name__}: {exc}"
+        if ok:
+            WEBHOOK_DELIVERIES.inc(result="delivered")
+            return
+        if retry and attempt < WEBHOOK_MAX_ATTEMPTS:
+            WEBHOOK_DELIVERIES.inc(result="retried")
+            delay = WEBHOOK_RETRY_BASE * 2 ** (attempt - 1) * random.uniform(0.5, 1.5)
+            with self._retry_cond:
+                self._seq += 1
+                heapq.heappush(self._retries, (time.monotonic() + delay, self._seq, attempt + 1, sub, events))
+                self._retry_cond.notify()
+            return
+        WEBHOOK_DELIVERIES.inc(result="failed")
+        logger.warning("Webhook %s to %s failed after %d attempt(s): %s", sub["id"], sub["url"], attempt, reason)
+
+    def _schedule_retries(self) -> None:
+        import requests
+
+        http = requests.Session()
+        while True:
+            with self._retry_cond:
+                while not self._stopping.is_set() and (not self._retries or self._retries[0][0] > time.monotonic()):
+                    self._retry_cond.wait(self._retries[0][0] - time.monotonic() if self._retries else None)
+                if self._stopping.is_set():
+                    return
+                _, _, attempt, sub, events = heapq.heappop(self._retries)
+            # Re-read the subscription: it may have been deleted since
+            if get_subscription(sub["id"]) is not None:
+                self._send(http, sub, events, attempt)
+
+
+dispatcher = Dispatcher()
+
+
+def emit(event: str, username: Optional[str], data: Dict[str, Any]) -> int:
+    subs = _matching(event, username)
+    if not subs:
+        return 0
+    payload = {"id": uuid.uuid4().hex, "type": event, "username": username, "created_at": time.time(), "data": data}
+    return sum(dispatcher.submit(sub, payload) for sub in subs)
+
+
+def send_test(sub: Dict[str, Any]) -> bool:
+    payload = {"id": uuid.uuid4().hex, "type": TEST, "username": sub["username"], "created_at": time.time(), "data": {}}
+    return dispatcher.submit(sub, payload)
+
+
+# -- event sources ------------------------------------------------------------
+
+def _on_status_change(username: str, previous: Optional[str], record: Dict[str, Any]) -> None:
+    if record["status"] in (session_status.EXPIRED, session_status.CHALLENGE) and previous != record["status"]:
+        emit(SESSION_EXPIRED, username, {"status": record["status"], "detail": record["detail"]})
+
+
+session_status.add_listener(_on_status_change)
+
+
+def _seen_key(username: str) -> str:
+    return f"webhook:inbox_seen:{username}"
+
+
+def inbox_changes(username: str, threads: List[Any]) -> int:
+    """Emit dm.received for threads whose last message is newer than what we saw last time."""
+    if not _matching(DM_RECEIVED, username):
+        return 0
+    store = get_store()
+    seen = store.get(_seen_key(username))
+    current = {t.thread_id: t.last_message_timestamp.isoformat() for t in threads if t.last_message_timestamp}
+    store.set(_seen_key(username), current)
+    if seen is None:
+        return 0  # first look at this inbox: remember it, don't replay history
+    emitted = 0
+    for thread in threads:
+        stamp = current.get(thread.thread_id)
+        if stamp and stamp > seen.get(thread.thread_id, ""):
+            emit(DM_RECEIVED, username, {
+                "thread_id": thread.thread_id, "thread_title": thread.thread_title,
+                "text": thread.last_message, "timestamp": stamp,
+            })
+            emitted += 1
+    return emitted
+
+
+async def _poll_inbox(username: str) -> None:
+    from .instagram_client import resume_session
+
+    client = await resume_session(username)
+    inbox_changes(username, await client.inbox(frozenset({"thread_id", "thread_title"})))
+
+
+def _watched_accounts() -> List[str]:
+    from ..utils import session_manager
+
+    subs = [s for s in list_subscriptions() if DM_RECEIVED in s["events"]]
+    if any(s["username"] is None for s in subs):
+        return session_manager.list_sessions()
+    return sorted({s["username"] for s in subs})
+
+
+_watcher: Optional[threading.Thread] = None
+_watcher_pid: Optional[int] = None
+
+
+def _watch() -> None:
+    while True:
+        time.sleep(WEBHOOK_INBOX_POLL_INTERVAL)
+        # One worker polls per interval
+        if not get_store().add("webhooks:inbox_lock", os.getpid(), ttl=WEBHOOK_INBOX_POLL_INTERVAL * 0.9):
+            continue
+        for username in _watched_accounts():
+            try:
+                with account_context(username):
+                    asyncio.run(_poll_inbox(username))
+            except Exception as exc:
+                logger.warning("Inbox poll for %s failed: %s", username, exc)
+
+
+def start() -> None:
+    global _watcher, _watcher_pid
+    if WEBHOOK_INBOX_POLL_INTERVAL <= 0:
+        return
+    if _watcher is not None and _watcher.is_alive() and _watcher_pid == os.getpid():
+        return
+    _watcher = threading.Thread(target=_watch, name="webhook-inbox-watcher", daemon=True)
+    _watcher_pid = os.getpid()
+    _watcher.start()
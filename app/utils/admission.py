@@ -0,0 +1,148 @@
+import math
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from flask import Flask, g, request
+
+from ..errors import ServiceUnavailableError
+from . import lifecycle
+from .metrics import ADMISSION_REJECTIONS, REQUEST_QUEUE_SECONDS
+
+# Load shedding per worker process. A request is refused with 503 + Retry-After
+# before it reaches a route when the worker already serves
+# ADMISSION_MAX_IN_FLIGHT requests, or when it waited longer than
+# ADMISSION_MAX_QUEUE_MS in front of the worker. The wait is read from the
+# X-Request-Start / X-Queue-Start header stamped by the proxy or load balancer,
+# and only with TRUST_QUEUE_HEADER: clients reaching gunicorn directly could
+# otherwise send an old stamp and get any request refused. With gunicorn
+# threads, that header is the only place a backlog of requests stuck behind
+# slow instagrapi calls shows up. /readyz reports not ready while the worker is
+# at its in-flight limit or shed a request for it recently, so the load
+# balancer routes around it.
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# A worker runs at most GUNICORN_THREADS requests at once (default 8, as in
+# gunicorn.conf.py), so a higher limit never triggers; by default one thread is
+# kept free for probes and /metrics. With single-threaded workers there is no
+# spare thread to shed from and only the queue header can shed.
+_threads = int(os.getenv("GUNICORN_THREADS", "8"))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", str(_threads - 1 if _threads > 1 else 0)))
+ADMISSION_MAX_QUEUE_MS = float(os.getenv("ADMISSION_MAX_QUEUE_MS", "1000"))
+ADMISSION_RETRY_AFTER = int(os.getenv("ADMISSION_RETRY_AFTER", "2"))
+TRUST_QUEUE_HEADER = os.getenv("TRUST_QUEUE_HEADER", "false").lower() in ("1", "true", "yes")
+# Stamps further in the past or future than this are ignored (broken clock or forged)
+QUEUE_HEADER_MAX_SKEW = float(os.getenv("QUEUE_HEADER_MAX_SKEW", "60"))
+# A worker that shed a request for being at its limit this recently is reported as not ready
+READY_SHED_WINDOW = float(os.getenv("READY_SHED_WINDOW", "5"))
+
+QUEUE_HEADERS = ("X-Request-Start", "X-Queue-Start")
+# Probes and scrapes must keep answering when the worker is saturated
+EXEMPT_PATHS = {"/healthz", "/readyz", "/metrics"}
+EXEMPT_PREFIXES = ("/health/",)
+
+
+class AdmissionController:
+    __slots__ = ("limit", "in_flight", "admitted", "shed", "last_shed", "_lock")
+
+    def __init__(self, limit: int) -> None:
+        self.limit = limit
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed = 0
+        self.last_shed = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        with self._lock:
+            if self.limit > 0 and self.in_flight >= self.limit:
+                return False
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def reject(self, reason: str, saturated: bool = False) -> None:
+        # Only refusals for being at the limit say something about this worker;
+        # a stale queue stamp is about that one request
+        with self._lock:
+            self.shed += 1
+            if saturated:
+                self.last_shed = time.monotonic()
+        ADMISSION_REJECTIONS.inc(reason=reason)
+
+    def shedding(self) -> bool:
+        return bool(self.last_shed) and time.monotonic() - self.last_shed < READY_SHED_WINDOW
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"in_flight": self.in_flight, "limit": self.limit, "admitted": self.admitted,
+                "shed": self.shed, "shedding": self.shedding()}
+
+
+controller = AdmissionController(ADMISSION_MAX_IN_FLIGHT)
+
+
+def queue_seconds(value: Optional[str], now: Optional[float] = None) -> Optional[float]:
+    """Seconds since the front proxy stamped the request. Accepts "t=<value>" or a bare
+    epoch in seconds (nginx $msec), milliseconds or microseconds. None for stamps more
+    than QUEUE_HEADER_MAX_SKEW away from now."""
+    if not value:
+        return None
+    try:
+        stamp = float(value.strip().removeprefix("t="))
+    except ValueError:
+        return None
+    if stamp > 1e14:
+        stamp /= 1e6
+    elif stamp > 1e11:
+        stamp /= 1e3
+    waited = (now or time.time()) - stamp
+    if abs(waited) > QUEUE_HEADER_MAX_SKEW:
+        return None
+    return max(0.0, waited)
+
+
+def _request_queue_seconds() -> Optional[float]:
+    if not TRUST_QUEUE_HEADER:
+        return None
+    for header in QUEUE_HEADERS:
+        waited = queue_seconds(request.headers.get(header))
+        if waited is not None:
+            return waited
+    return None
+
+
+def _exempt(path: str) -> bool:
+    return path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES)
+
+
+def _refuse(reason: str, message: str, saturated: bool = False) -> None:
+    controller.reject(reason, saturated)
+    raise ServiceUnavailableError(message, retry_after=ADMISSION_RETRY_AFTER)
+
+
+def init_app(app: Flask) -> None:
+    @app.before_request
+    def _admit():
+        waited = _request_queue_seconds()
+        if waited is not None:
+            g.queue_seconds = waited
+            REQUEST_QUEUE_SECONDS.observe(waited)
+        if not ADMISSION_ENABLED or _exempt(request.path):
+            return
+        if lifecycle.draining():
+            _refuse("draining", "Server is restarting")
+        if waited is not None and ADMISSION_MAX_QUEUE_MS and waited * 1000 > ADMISSION_MAX_QUEUE_MS:
+            # Whoever sent it has probably given up already; answering fast drains the backlog
+            _refuse("queue", f"Server overloaded: request waited {math.ceil(waited * 1000)} ms in queue")
+        if not controller.acquire():
+            _refuse("in_flight", "Server overloaded: too many requests in progress", saturated=True)
+        g.admitted = True
+
+    @app.teardown_request
+    def _release(_exc):
+        if g.pop("admitted", False):
+            controller.release()
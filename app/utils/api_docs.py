@@ -0,0 +1,104 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from flask import Flask, Response
+
+from . import session_manager
+
+# Swagger UI / spec can be turned off in production; flasgger (and jsonschema,
+# which it pulls in) is then never imported.
+DOCS_ENABLED = os.getenv("DOCS_ENABLED", "true").lower() not in ("0", "false", "no", "off")
+# Built specs are cached here, keyed by a hash of the routes and their
+# docstrings, so only the first worker after a deploy parses the YAML. The
+# files are served as is, so only ones owned by this user are read back.
+APISPEC_CACHE_DIR = Path(os.getenv("APISPEC_CACHE_DIR") or session_manager.SESSIONS_DIR / ".apispec")
+
+logger = logging.getLogger("pipegram.docs")
+
+
+def _owned(path: Path) -> bool:
+    # A file planted by another user (in a shared APISPEC_CACHE_DIR) is rebuilt over
+    getuid = getattr(os, "getuid", None)
+    return getuid is None or path.stat().st_uid == getuid()
+
+
+class _SpecCache:
+    def __init__(self, app: Flask, swagger: Any) -> None:
+        self.app = app
+        self.swagger = swagger
+        self._bytes: Dict[str, bytes] = {}
+
+    def _digest(self) -> str:
+        import flasgger
+
+        h = hashlib.sha256()
+        h.update(flasgger.__version__.encode())
+        h.update(json.dumps(self.app.config.get("SWAGGER", {}), sort_keys=True, default=str).encode())
+        for rule in sorted(self.app.url_map.iter_rules(), key=lambda r: (r.rule, r.endpoint)):
+            view = self.app.view_functions.get(rule.endpoint)
+            h.update(f"{rule.rule}|{rule.endpoint}|{','.join(sorted(rule.methods or ()))}|".encode())
+            h.update((getattr(view, "__doc__", None) or "").encode())
+        return h.hexdigest()[:16]
+
+    def _path(self, endpoint: str) -> Path:
+        return APISPEC_CACHE_DIR / f"pipegram-{endpoint}-{self._digest()}.json"
+
+    def get(self, endpoint: str) -> bytes:
+        data = self._bytes.get(endpoint)
+        if data is not None and not self.app.debug:
+            return data
+        path = self._path(endpoint)
+        if not self.app.debug:
+            try:
+                data = path.read_bytes() if _owned(path) else None
+            except OSError:
+                data = None
+        if data is None:
+            from .json_provider import dumps_bytes
+            data = dumps_bytes(self.swagger.get_apispecs(endpoint))
+            self._write(path, data)
+        self._bytes[endpoint] = data
+        return data
+
+    def _write(self, path: Path, data: bytes) -> None:
+        try:
+            path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        except OSError as exc:
+            logger.warning("Could not cache API spec at %s: %s", path, exc)
+
+
+_cache: Optional[_SpecCache] = None
+
+
+def init_app(app: Flask) -> None:
+    global _cache
+    if not DOCS_ENABLED:
+        return
+    from flasgger import Swagger
+
+    swagger = Swagger(app)
+    cache = _cache = _SpecCache(app, swagger)
+    # Serve the spec from the cache instead of flasgger's per-process build
+    for spec in swagger.config["specs"]:
+        endpoint = spec["endpoint"]
+
+        def view(endpoint: str = endpoint) -> Response:
+            return Response(cache.get(endpoint), mimetype="application/json")
+
+        app.view_functions[f"flasgger.{endpoint}"] = view
+
+
+def warm() -> None:
+    """Build (or load) every spec now instead of on the first /apispec request."""
+    if _cache is None:
+        return
+    with _cache.app.test_request_context():
+        for spec in _cache.swagger.config["specs"]:
+            _cache.get(spec["endpoint"])
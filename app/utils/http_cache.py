@@ -0,0 +1,294 @@
+import functools
+import gzip
+import hashlib
+import inspect
+import itertools
+import os
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from typing import Any, Callable, FrozenSet, Iterable, Iterator, List, Optional, Tuple
+
+from flask import Flask, Response, g, request
+
+from .metrics import HTTP_COMPRESSION_CACHE, HTTP_NOT_MODIFIED, HTTP_RESPONSE_CACHE
+
+try:
+    import brotli
+except ImportError:  # br is only offered when the wheel is installed
+    brotli = None
+
+# Validators and compression for GET responses. Buffered JSON bodies get a weak
+# ETag from a hash of their content (weak, so the gzip and br variants share it)
+# and If-None-Match answers 304 without a body. Compressed variants are kept in
+# a byte-bounded LRU keyed by that hash, so a poller receiving unchanged data
+# costs one hash instead of a compression. Streamed JSON (large inbox/thread
+# arrays) is collected up to HTTP_ETAG_MAX_BYTES and then handled like a
+# buffered body; past that, and for NDJSON/CSV exports, it is compressed chunk
+# by chunk and gets no ETag.
+#
+# Read endpoints wrapped in @cached also keep their uncompressed JSON body per
+# API key and URL for HTTP_RESPONSE_CACHE_TTL seconds, so a dashboard polling
+# faster than that is answered from those bytes (or with a 304) without calling
+# Instagram or serializing again. A successful write naming an account drops
+# that account's entries in this worker; other workers see it after the TTL.
+HTTP_COMPRESSION = os.getenv("HTTP_COMPRESSION", "true").lower() in ("1", "true", "yes")
+HTTP_COMPRESS_MIN_BYTES = int(os.getenv("HTTP_COMPRESS_MIN_BYTES", "1024"))
+HTTP_GZIP_LEVEL = int(os.getenv("HTTP_GZIP_LEVEL", "6"))
+HTTP_BROTLI_QUALITY = int(os.getenv("HTTP_BROTLI_QUALITY", "5"))
+HTTP_COMPRESSED_CACHE_BYTES = int(os.getenv("HTTP_COMPRESSED_CACHE_BYTES", str(32 * 1024 * 1024)))
+HTTP_ETAG_MAX_BYTES = int(os.getenv("HTTP_ETAG_MAX_BYTES", str(8 * 1024 * 1024)))
+HTTP_RESPONSE_CACHE_TTL = float(os.getenv("HTTP_RESPONSE_CACHE_TTL", "5"))
+HTTP_RESPONSE_CACHE_BYTES = int(os.getenv("HTTP_RESPONSE_CACHE_BYTES", str(32 * 1024 * 1024)))
+
+COMPRESSIBLE = {"application/json", "application/x-ndjson", "text/csv"}
+
+
+class CompressedCache:
+    """LRU of (content hash, encoding) -> compressed bytes, bounded by total size."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: "OrderedDict[Tuple[str, str], bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            data = self._data.get(key)
+            if data is not None:
+                self._data.move_to_end(key)
+            return data
+
+    def put(self, key: Tuple[str, str], data: bytes) -> None:
+        if len(data) > self.max_bytes // 4:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self._data[key] = data
+            self.size += len(data)
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+
+cache = CompressedCache(HTTP_COMPRESSED_CACHE_BYTES)
+
+
+class ResponseCache:
+    """LRU of (caller, URL) -> (expires_at, body, accounts), bounded by total size."""
+
+    def __init__(self, max_bytes: int) -> None:
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._data: "OrderedDict[Tuple[str, str], Tuple[float, bytes, FrozenSet[str]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                self._pop(key)
+                return None
+            self._data.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: Tuple[str, str], body: bytes, accounts: FrozenSet[str], ttl: float) -> None:
+        if len(body) > self.max_bytes // 4:
+            return
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (time.monotonic() + ttl, body, accounts)
+            self.size += len(body)
+            while self.size > self.max_bytes:
+                _, (_, evicted, _) = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def invalidate(self, accounts: Iterable[str]) -> None:
+        accounts = set(accounts)
+        with self._lock:
+            for key in [k for k, entry in self._data.items() if entry[2] & accounts]:
+                self._pop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.size = 0
+
+    def _pop(self, key: Tuple[str, str]) -> None:
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+responses = ResponseCache(HTTP_RESPONSE_CACHE_BYTES)
+
+
+def _encodings() -> Tuple[str, ...]:
+    return ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def _negotiate() -> Optional[str]:
+    if not HTTP_COMPRESSION:
+        return None
+    return request.accept_encodings.best_match(_encodings())
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=HTTP_BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=HTTP_GZIP_LEVEL, mtime=0)
+
+
+def _compress_stream(chunks: Iterable[bytes], encoding: str) -> Iterator[bytes]:
+    # Each upstream chunk is flushed so long exports keep arriving progressively
+    chunks = (c.encode("utf-8") if isinstance(c, str) else c for c in chunks)
+    if encoding == "br":
+        compressor = brotli.Compressor(quality=HTTP_BROTLI_QUALITY)
+        for chunk in chunks:
+            out = compressor.process(chunk) + compressor.flush()
+            if out:
+                yield out
+        yield compressor.finish()
+        return
+    compressor = zlib.compressobj(HTTP_GZIP_LEVEL, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        out = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if out:
+            yield out
+    yield compressor.flush()
+
+
+def _vary(response: Response) -> None:
+    response.vary.add("Accept-Encoding")
+
+
+def _finish_streamed(response: Response) -> Response:
+    encoding = _negotiate()
+    if encoding:
+        response.response = _compress_stream(response.response, encoding)
+        response.headers["Content-Encoding"] = encoding
+        response.headers.pop("Content-Length", None)
+    _vary(response)
+    return response
+
+
+def _collect(response: Response) -> Response:
+    """Buffer a streamed JSON body if it ends within HTTP_ETAG_MAX_BYTES, so it gets
+    an ETag too; a longer one keeps streaming from where collecting stopped."""
+    source = iter(response.response)
+    chunks: List[bytes] = []
+    size = 0
+    for chunk in source:
+        chunk = chunk.encode("utf-8") if isinstance(chunk, str) else chunk
+        chunks.append(chunk)
+        size += len(chunk)
+        if size > HTTP_ETAG_MAX_BYTES:
+            response.response = itertools.chain(chunks, source)
+            return response
+    close = getattr(response.response, "close", None)
+    if close is not None:
+        close()
+    response.set_data(b"".join(chunks))
+    return response
+
+
+def _finish_buffered(response: Response) -> Response:
+    body = response.get_data()
+    cache_key = g.pop("response_cache_key", None)
+    if cache_key is not None:
+        responses.put(cache_key, body, g.pop("response_cache_accounts", frozenset()), HTTP_RESPONSE_CACHE_TTL)
+    digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+    response.set_etag(digest, weak=True)
+    # Account data: browsers may keep it but must revalidate, shared caches may not
+    response.headers.setdefault("Cache-Control", "private, no-cache")
+    _vary(response)
+    if request.if_none_match.contains_weak(digest):
+        HTTP_NOT_MODIFIED.inc()
+        response.status_code = 304
+        response.set_data(b"")
+        response.headers.pop("Content-Type", None)
+        return response
+    encoding = _negotiate() if len(body) >= HTTP_COMPRESS_MIN_BYTES else None
+    if encoding:
+        compressed = cache.get((digest, encoding))
+        HTTP_COMPRESSION_CACHE.inc(result="hit" if compressed is not None else "miss")
+        if compressed is None:
+            compressed = compress(body, encoding)
+            cache.put((digest, encoding), compressed)
+        response.set_data(compressed)
+        response.headers["Content-Encoding"] = encoding
+    return response
+
+
+def _cache_key() -> Tuple[str, str]:
+    # Per presented credential: a cached body is only ever replayed to the caller
+    # that was authorized (and scope-checked) for it
+    caller = hashlib.sha256(request.headers.get("Authorization", "").encode("utf-8")).hexdigest()
+    return caller, request.full_path
+
+
+def _accounts() -> FrozenSet[str]:
+    return frozenset(u.strip().lower() for u in request.args.getlist("username") if u.strip())
+
+
+def cached(fn: Callable) -> Callable:
+    """Serve a GET JSON view from the response cache while its entry is fresh.
+    Goes under @admin_auth_required, so authentication, scope and quotas still apply."""
+    def lookup() -> Optional[Response]:
+        if HTTP_RESPONSE_CACHE_TTL <= 0 or request.method != "GET":
+            return None
+        key = _cache_key()
+        body = responses.get(key)
+        HTTP_RESPONSE_CACHE.inc(result="hit" if body is not None else "miss")
+        if body is not None:
+            return Response(body, mimetype="application/json")
+        g.response_cache_key = key
+        g.response_cache_accounts = _accounts()
+        return None
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            hit = lookup()
+            return hit if hit is not None else await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        hit = lookup()
+        return hit if hit is not None else fn(*args, **kwargs)
+    return wrapper
+
+
+def _invalidate_written_accounts() -> None:
+    from ..middleware import request_usernames
+
+    accounts = request_usernames()
+    if accounts:
+        responses.invalidate(accounts)
+
+
+def init_app(app: Flask) -> None:
+    @app.after_request
+    def _conditional(response: Response) -> Response:
+        if request.method not in ("GET", "HEAD", "OPTIONS"):
+            if response.status_code < 400:
+                _invalidate_written_accounts()
+            return response
+        if (request.method == "OPTIONS" or response.status_code != 200
+                or response.direct_passthrough or "Content-Encoding" in response.headers
+                or response.mimetype not in COMPRESSIBLE):
+            return response
+        if response.is_streamed and response.mimetype == "application/json":
+            response = _collect(response)
+        if response.is_streamed:
+            return _finish_streamed(response)
+        if response.mimetype == "application/json":
+            return _finish_buffered(response)
+        return response
@@ -0,0 +1,164 @@
+import asyncio
+import hashlib
+import inspect
+import os
+import time
+import uuid
+from functools import wraps
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Response, make_response, request
+
+from ..errors import BadRequestError, ConflictError
+from .state_store import get_store
+
+# Retried sends/publishes carrying the same Idempotency-Key get the first
+# response back (or wait for it while it is still running) instead of
+# calling Instagram again. Results live in the shared state store, so this
+# also holds across workers with the sqlite/redis backends.
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+IDEMPOTENCY_TTL = float(os.getenv("IDEMPOTENCY_TTL", "86400"))
+# How long a request may run before its key is released again (crashed worker)
+IDEMPOTENCY_LOCK_TTL = float(os.getenv("IDEMPOTENCY_LOCK_TTL", "300"))
+# How long a duplicate waits for the in-flight original before giving up with 409
+IDEMPOTENCY_WAIT = float(os.getenv("IDEMPOTENCY_WAIT", "60"))
+
+_POLL_MIN = 0.05
+_POLL_MAX = 0.5
+
+
+def _request_key() -> Optional[Tuple[str, str]]:
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if key is None:
+        return None
+    key = key.strip()
+    if not key or len(key) > 255:
+        raise BadRequestError(f"{IDEMPOTENCY_HEADER} must be 1-255 characters")
+    # Scoped per caller and endpoint; the fingerprint catches a key reused for a different request
+    caller = hashlib.sha256(request.headers.get("Authorization", "").encode()).hexdigest()[:16]
+    store_key = f"idempotency:{caller}:{request.endpoint}:{key}"
+    fingerprint = hashlib.sha256(request.method.encode() + request.path.encode() + request.get_data()).hexdigest()
+    return store_key, fingerprint
+
+
+def _replay(entry: Dict[str, Any]) -> Response:
+    response = Response(entry["body"], status=entry["status"], content_type=entry["content_type"])
+    response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+
+def _check(entry: Dict[str, Any], fingerprint: str) -> Optional[Response]:
+    if entry["fingerprint"] != fingerprint:
+        raise ConflictError(f"{IDEMPOTENCY_HEADER} was already used for a different request")
+    if entry["state"] == "done":
+        return _replay(entry)
+    return None
+
+
+def _claim(store_key: str, fingerprint: str) -> Optional[str]:
+    owner = uuid.uuid4().hex
+    pending = {"state": "pending", "fingerprint": fingerprint, "owner": owner}
+    return owner if get_store().add(store_key, pending, IDEMPOTENCY_LOCK_TTL) else None
+
+
+def _finish(store_key: str, fingerprint: str, owner: str, rv: Any) -> Response:
+    response = make_response(rv)
+    store = get_store()
+    entry = store.get(store_key)
+    if entry is None or entry.get("owner") != owner:
+        return response  # our claim expired meanwhile; don't overwrite someone else's
+    if response.is_streamed or response.status_code >= 500:
+        store.delete(store_key)
+        return response
+    store.set(store_key, {
+        "state": "done", "fingerprint": fingerprint, "owner": owner, "status": response.status_code,
+        "content_type": response.content_type, "body": response.get_data(as_text=True),
+    }, IDEMPOTENCY_TTL)
+    return response
+
+
+def _release(store_key: str, owner: str) -> None:
+    # Failed requests are not cached: the client may retry with the same key
+    store = get_store()
+    entry = store.get(store_key)
+    if entry is not None and entry.get("owner") == owner:
+        store.delete(store_key)
+
+
+class _Claim:
+    """One request's hold on its Idempotency-Key: waiting for a duplicate in flight,
+    replaying a finished one, and storing or releasing the result. The sync and
+    async wrappers only differ in how they sleep and call the view."""
+
+    def __init__(self, store_key: str, fingerprint: str) -> None:
+        self.store_key = store_key
+        self.fingerprint = fingerprint
+        self.owner = _claim(store_key, fingerprint)
+        self.replay: Optional[Response] = None
+        self._deadline = time.monotonic() + IDEMPOTENCY_WAIT
+        self._attempt = 0
+
+    def wait(self) -> Optional[float]:
+        """Seconds to sleep before asking again; None once the view may run
+        (self.owner) or the first response is replayed (self.replay)."""
+        if self.owner is not None or self.replay is not None:
+            return None
+        # Replay, take over a released key, or wait
+        entry = get_store().get(self.store_key)
+        if entry is None:
+            self.owner = _claim(self.store_key, self.fingerprint)
+            return None if self.owner is not None else 0.0
+        self.replay = _check(entry, self.fingerprint)
+        if self.replay is not None:
+            return None
+        delay = min(_POLL_MAX, _POLL_MIN * 2 ** self._attempt)
+        if time.monotonic() + delay > self._deadline:
+            raise ConflictError("A request with this Idempotency-Key is still in progress")
+        self._attempt += 1
+        return delay
+
+    def __enter__(self) -> "_Claim":
+        return self
+
+    def __exit__(self, exc_type: Any, *exc: Any) -> None:
+        if exc_type is not None:
+            _release(self.store_key, self.owner)
+
+    def finish(self, rv: Any) -> Response:
+        return _finish(self.store_key, self.fingerprint, self.owner, rv)
+
+
+def _begin() -> Optional[_Claim]:
+    request_key = _request_key()
+    return _Claim(*request_key) if request_key is not None else None
+
+
+def idempotent(fn):
+    if inspect.iscoroutinefunction(fn):
+        @wraps(fn)
+        async def async_wrapper(*args, **kwargs):
+            claim = _begin()
+            if claim is None:
+                return await fn(*args, **kwargs)
+            while (delay := claim.wait()) is not None:
+                await asyncio.sleep(delay)
+            if claim.replay is not None:
+                return claim.replay
+            with claim:
+                rv = await fn(*args, **kwargs)
+            return claim.finish(rv)
+        return async_wrapper
+
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        claim = _begin()
+        if claim is None:
+            return fn(*args, **kwargs)
+        while (delay := claim.wait()) is not None:
+            time.sleep(delay)
+        if claim.replay is not None:
+            return claim.replay
+        with claim:
+            rv = fn(*args, **kwargs)
+        return claim.finish(rv)
+    return wrapper
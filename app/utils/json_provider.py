@@ -0,0 +1,120 @@
+import datetime
+import decimal
+import json
+import os
+import uuid
+from typing import Any, Iterator
+
+from flask import Flask, Response
+from flask.json.provider import JSONProvider
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback keeps the app working without the wheel
+    orjson = None
+
+# Arrays longer than this are encoded and sent in chunks instead of one buffer
+JSON_STREAM_THRESHOLD = int(os.getenv("JSON_STREAM_THRESHOLD", "500"))
+JSON_STREAM_CHUNK = int(os.getenv("JSON_STREAM_CHUNK", "200"))
+
+
+def _default(obj: Any) -> Any:
+    # orjson handles datetime/date/uuid/dataclasses natively; this covers the rest
+    to_dict = getattr(obj, "to_dict", None)
+    if callable(to_dict):
+        return to_dict()
+    model_dump = getattr(obj, "model_dump", None)
+    if callable(model_dump):
+        return model_dump()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, (set, frozenset, tuple)):
+        return list(obj)
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    if hasattr(obj, "__html__"):
+        return str(obj.__html__())
+    # pydantic Url / HttpUrl and similar string-like values
+    if type(obj).__name__ in ("Url", "HttpUrl", "AnyUrl", "MultiHostUrl"):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def dumps_bytes(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=_OPTIONS)
+
+    def loads(s: Any) -> Any:
+        return orjson.loads(s)
+else:
+    def dumps_bytes(obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+    def loads(s: Any) -> Any:
+        return json.loads(s)
+
+
+def dumps(obj: Any) -> str:
+    return dumps_bytes(obj).decode("utf-8")
+
+
+class FastJSONProvider(JSONProvider):
+    """orjson-backed provider: native datetime/pydantic support, compact output, no key sorting."""
+
+    mimetype = "application/json"
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        return dumps(obj)
+
+    def loads(self, s: Any, **kwargs: Any) -> Any:
+        return loads(s)
+
+    def response(self, *args: Any, **kwargs: Any) -> Response:
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps_bytes(obj), mimetype=self.mimetype)
+
+
+def _iter_array(items: list) -> Iterator[bytes]:
+    yield b"["
+    for start in range(0, len(items), JSON_STREAM_CHUNK):
+        chunk = dumps_bytes(items[start:start + JSON_STREAM_CHUNK])[1:-1]
+        if start and chunk:
+            yield b","
+        yield chunk
+    yield b"]"
+
+
+def _iter_value(value: Any) -> Iterator[bytes]:
+    if isinstance(value, list) and len(value) > JSON_STREAM_THRESHOLD:
+        yield from _iter_array(value)
+    elif isinstance(value, dict) and _needs_streaming(value):
+        yield b"{"
+        for i, (key, item) in enumerate(value.items()):
+            yield (b"," if i else b"") + dumps_bytes(str(key)) + b":"
+            yield from _iter_value(item)
+        yield b"}"
+    else:
+        yield dumps_bytes(value)
+
+
+def _needs_streaming(data: Any) -> bool:
+    if isinstance(data, list):
+        return len(data) > JSON_STREAM_THRESHOLD
+    if isinstance(data, dict):
+        return any(isinstance(v, list) and len(v) > JSON_STREAM_THRESHOLD for v in data.values())
+    return False
+
+
+def json_response(data: Any) -> Response:
+    """jsonify() for potentially large payloads: big arrays are encoded and sent chunk by chunk."""
+    if not _needs_streaming(data):
+        return Response(dumps_bytes(data), mimetype="application/json")
+    # No stream_with_context: the views using this are async, and a request
+    # context pushed from asgiref's thread can't be popped by the WSGI thread
+    return Response(_iter_value(data), mimetype="application/json")
+
+
+def init_app(app: Flask) -> None:
+    app.json = FastJSONProvider(app)
@@ -0,0 +1,76 @@
+import logging
+import os
+import signal
+import threading
+import time
+from typing import Callable, List, Tuple
+
+# Graceful drain of a worker. On SIGTERM (gunicorn graceful stop, container
+# restart) the worker is flagged as draining before gunicorn stops accepting:
+# /readyz fails, admission refuses new requests, and operations that have not
+# reached Instagram yet are journaled instead of started (see
+# services.operations). When the worker exits, the registered drain hooks have
+# until DRAIN_TIMEOUT after the signal (keep it below gunicorn's
+# graceful_timeout) to finish or persist what is left.
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT", "25"))
+
+logger = logging.getLogger("pipegram.lifecycle")
+
+_draining = threading.Event()
+_drain_started = 0.0
+_hooks: List[Tuple[str, Callable[[float], None]]] = []
+_shutdown_lock = threading.Lock()
+_shut_down = False
+
+
+def draining() -> bool:
+    return _draining.is_set()
+
+
+def begin_drain(reason: str = "shutdown") -> None:
+    global _drain_started
+    if not _draining.is_set():
+        _drain_started = time.monotonic()
+        _draining.set()
+        logger.info("Draining worker %d (%s)", os.getpid(), reason)
+
+
+def on_drain(name: str, hook: Callable[[float], None]) -> None:
+    """Register hook(deadline) to run at shutdown; deadline is a time.monotonic() value."""
+    if all(existing != name for existing, _ in _hooks):
+        _hooks.append((name, hook))
+
+
+def shutdown(timeout: float = DRAIN_TIMEOUT) -> None:
+    """Run the drain hooks once, in registration order, sharing one deadline
+    counted from the start of the drain (at least a second from now)."""
+    global _shut_down
+    with _shutdown_lock:
+        if _shut_down:
+            return
+        _shut_down = True
+    begin_drain()
+    deadline = max(_drain_started + timeout, time.monotonic() + 1)
+    for name, hook in _hooks:
+        try:
+            hook(deadline)
+        except Exception:
+            logger.exception("Drain hook %s failed", name)
+    logger.info("Worker %d drained", os.getpid())
+
+
+def install_signal_handlers() -> None:
+    """Flag the worker as draining on SIGTERM/SIGINT, then let the server's own
+    handler (gunicorn's graceful stop) run as before."""
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        previous = signal.getsignal(signum)
+
+        def handler(sig, frame, previous=previous):
+            begin_drain(signal.Signals(sig).name)
+            if callable(previous):
+                previous(sig, frame)
+            elif previous == signal.SIG_DFL:
+                signal.signal(sig, signal.SIG_DFL)
+                os.kill(os.getpid(), sig)
+
+        signal.signal(signum, handler)
@@ -0,0 +1,220 @@
+import atexit
+import contextvars
+import logging
+import os
+import queue
+import sys
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+from flask import Flask, g, has_request_context, request
+
+from .json_provider import dumps_bytes
+from .sharding import extract_username
+from .tracing import RequestIdFilter
+
+# Structured logging: records are enriched (request id, trace id, account)
+# and sampled in the calling thread, then formatted and written by a
+# background thread so a burst of errors never blocks a request on stdout.
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Identical warnings/errors: LOG_SAMPLE_BURST per LOG_SAMPLE_WINDOW seconds, the rest are counted
+LOG_SAMPLE_BURST = int(os.getenv("LOG_SAMPLE_BURST", "20"))
+LOG_SAMPLE_WINDOW = float(os.getenv("LOG_SAMPLE_WINDOW", "60"))
+
+_account: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("pipegram_account", default=None)
+
+# LogRecord attributes that are not user-supplied `extra=` fields
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {
+    "message", "asctime", "request_id", "trace_id", "account", "suppressed"}
+
+
+@contextmanager
+def account_context(username: Optional[str]) -> Iterator[None]:
+    """Tag every record logged inside the block with `account` (background jobs)."""
+    token = _account.set(username)
+    try:
+        yield
+    finally:
+        _account.reset(token)
+
+
+def current_account() -> Optional[str]:
+    account = _account.get()
+    if account is None and has_request_context():
+        if "log_account" not in g:
+            body = request.get_json(silent=True) if request.is_json else None
+            g.log_account = extract_username(request.args, body)
+        account = g.log_account
+    return account
+
+
+class AccountFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.account = current_account() or "-"
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Lets through LOG_SAMPLE_BURST identical WARNING+ records per window; the
+    first record of the next window carries how many were suppressed."""
+
+    def __init__(self, burst: int = LOG_SAMPLE_BURST, window: float = LOG_SAMPLE_WINDOW) -> None:
+        super().__init__()
+        self.burst = burst
+        self.window = window
+        self._seen: Dict[Tuple[Any, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.burst <= 0 or record.levelno < logging.WARNING:
+            return True
+        exc_type = record.exc_info[0].__name__ if record.exc_info and record.exc_info[0] else None
+        key = (record.name, record.levelno, record.msg, exc_type)
+        now = time.monotonic()
+        with self._lock:
+            state = self._seen.get(key)
+            if state is None or now - state[0] >= self.window:
+                suppressed = state[2] if state else 0
+                self._seen[key] = [now, 1, 0]
+                if len(self._seen) > 10000:
+                    self._seen = {k: v for k, v in self._seen.items() if now - v[0] < self.window}
+                if suppressed:
+                    record.suppressed = suppressed
+                return True
+            if state[1] < self.burst:
+                state[1] += 1
+                return True
+            state[2] += 1
+            return False
+
+
+class JsonFormatter(logging.Formatter):
+    converter = time.gmtime
+
+    def format(self, record: logging.LogRecord) -> str:
+        data: Dict[str, Any] = {
+            "ts": self.formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+            "pid": record.process,
+        }
+        for key in ("request_id", "trace_id", "account"):
+            value = getattr(record, key, "-")
+            if value != "-":
+                data[key] = value
+        suppressed = getattr(record, "suppressed", None)
+        if suppressed:
+            data["suppressed"] = suppressed
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_"):
+                data[key] = value
+        if record.exc_info and record.exc_info[0]:
+            data["exc_type"] = record.exc_info[0].__name__
+            data["exc"] = "".join(traceback.format_exception(*record.exc_info)).rstrip()
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return dumps_bytes(data).decode("utf-8")
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self) -> None:
+        super().__init__("%(asctime)s %(levelname)s [%(request_id)s] [%(account)s] %(name)s: %(message)s")
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        suppressed = getattr(record, "suppressed", None)
+        return f"{line} (+{suppressed} similar suppressed)" if suppressed else line
+
+
+class AsyncHandler(logging.Handler):
+    """Hands records to a writer thread through a bounded queue; drops (and counts) when it is full."""
+
+    def __init__(self, target: logging.Handler, maxsize: int = LOG_QUEUE_SIZE) -> None:
+        super().__init__()
+        self.target = target
+        self.maxsize = maxsize
+        self.dropped = 0
+        self._queue: "queue.Queue[logging.LogRecord]" = queue.Queue(maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                if self._thread_pid != os.getpid():
+                    self._queue = queue.Queue(self.maxsize)  # forked child: don't inherit the parent's backlog
+                self._thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._ensure_thread()
+        # Resolve the message now (args may be mutated later); formatting happens in the writer
+        record.msg = record.getMessage()
+        record.args = None
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self) -> None:
+        q = self._queue
+        while True:
+            record = q.get()
+            if self.dropped:
+                dropped, self.dropped = self.dropped, 0
+                self.target.handle(logging.makeLogRecord({
+                    "name": "pipegram.log", "levelno": logging.WARNING, "levelname": "WARNING",
+                    "msg": f"Log queue full, dropped {dropped} record(s)",
+                    "request_id": "-", "trace_id": "-", "account": "-"}))
+            self.target.handle(record)
+
+    def flush(self) -> None:
+        while True:
+            try:
+                record = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            self.target.handle(record)
+        self.target.flush()
+
+
+_handler: Optional[AsyncHandler] = None
+
+
+def configure() -> None:
+    global _handler
+    root = logging.getLogger()
+    if root.handlers:
+        # Logging was set up by someone else (tests, an embedding server): only enrich it
+        for handler in root.handlers:
+            for cls in (RequestIdFilter, AccountFilter):
+                if not any(isinstance(f, cls) for f in handler.filters):
+                    handler.addFilter(cls())
+        return
+    target = logging.StreamHandler(sys.stdout)
+    target.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else TextFormatter())
+    _handler = AsyncHandler(target)
+    # Filters run in the caller's thread: context vars and request data are only visible there
+    _handler.addFilter(SamplingFilter())
+    _handler.addFilter(RequestIdFilter())
+    _handler.addFilter(AccountFilter())
+    root.addHandler(_handler)
+    root.setLevel(LOG_LEVEL)
+    atexit.register(_handler.flush)
+
+
+def init_app(app: Flask) -> None:
+    configure()
+    # Flask's own handler would bypass the queue
+    app.logger.handlers.clear()
+    app.logger.propagate = True
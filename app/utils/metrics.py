@@ -0,0 +1,266 @@
+import functools
+import inspect
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from flask import Flask, Response, g, request
+
+# Minimal Prometheus text-format registry (no client library needed).
+# Values are per worker process; scrape each worker/backend separately.
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, math.inf)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric(ABC):
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def _labels_text(self, key: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{n}="{_escape(v)}"' for n, v in pairs) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+    @abstractmethod
+    def _samples(self) -> List[str]:
+        ...
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._labels_text(k)} {_fmt(v)}" for k, v in self._values.items()]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def get(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{self._labels_text(k)} {_fmt(v)}" for k, v in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(set(buckets) | {math.inf}))
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            # [bucket counts..., sum, count]
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+                    break
+            row[-2] += value
+            row[-1] += 1
+
+    @contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, row in self._values.items():
+                cumulative = 0.0
+                for bound, count in zip(self.buckets, row):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{self._labels_text(key, ('le', _fmt(bound)))} {_fmt(cumulative)}")
+                lines.append(f"{self.name}_sum{self._labels_text(key)} {_fmt(row[-2])}")
+                lines.append(f"{self.name}_count{self._labels_text(key)} {_fmt(row[-1])}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> Any:
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        return "\n".join(line for m in self._metrics.values() for line in m.render()) + "\n"
+
+
+registry = Registry()
+
+HTTP_REQUEST_SECONDS = registry.register(Histogram(
+    "pipegram_http_request_duration_seconds", "HTTP request latency by route", ["endpoint", "method", "status"]))
+HTTP_IN_FLIGHT = registry.register(Gauge(
+    "pipegram_http_requests_in_flight", "HTTP requests currently being served", ["endpoint"]))
+ADAPTER_SECONDS = registry.register(Histogram(
+    "pipegram_adapter_method_duration_seconds", "InstagramSessionAdapter method latency", ["method"]))
+INSTAGRAM_CALL_SECONDS = registry.register(Histogram(
+    "pipegram_instagram_call_duration_seconds", "instagrapi call latency", ["call"]))
+INSTAGRAM_IN_FLIGHT = registry.register(Gauge(
+    "pipegram_instagram_calls_in_flight", "instagrapi calls currently running"))
+INSTAGRAM_ERRORS = registry.register(Counter(
+    "pipegram_instagram_errors_total", "instagrapi call errors by exception class", ["call", "exception"]))
+SESSION_LOAD_SECONDS = registry.register(Histogram(
+    "pipegram_session_load_duration_seconds", "Time to load a stored session"))
+CLIENT_BUILD_SECONDS = registry.register(Histogram(
+    "pipegram_client_build_duration_seconds", "Time to build an instagrapi client from a session"))
+CLIENT_CACHE = registry.register(Counter(
+    "pipegram_client_cache_total", "Warm client cache lookups", ["result"]))
+MEDIA_SECONDS = registry.register(Histogram(
+    "pipegram_media_duration_seconds", "Media intake time by stage (download, decode, transform)", ["stage"]))
+MEDIA_BYTES = registry.register(Counter(
+    "pipegram_media_bytes_total", "Media bytes taken in by stage", ["stage"]))
+MEDIA_CACHE = registry.register(Counter(
+    "pipegram_media_cache_total", "Staged media cache lookups (downloads by URL, transforms by content)",
+    ["stage", "result"]))
+WEBHOOK_DELIVERIES = registry.register(Counter(
+    "pipegram_webhook_deliveries_total", "Webhook batch deliveries by result", ["result"]))
+WEBHOOK_DROPPED = registry.register(Counter(
+    "pipegram_webhook_events_dropped_total", "Webhook events dropped because the queue was full", ["event"]))
+WEBHOOK_QUEUE_DEPTH = registry.register(Gauge(
+    "pipegram_webhook_queue_depth", "Webhook events waiting for delivery"))
+CIRCUIT_TRANSITIONS = registry.register(Counter(
+    "pipegram_circuit_transitions_total", "Circuit breaker state changes by scope", ["scope", "state"]))
+CIRCUIT_REJECTIONS = registry.register(Counter(
+    "pipegram_circuit_rejections_total", "Instagram calls refused by an open circuit, by scope", ["scope"]))
+API_KEY_REQUESTS = registry.register(Counter(
+    "pipegram_api_key_requests_total", "Authenticated requests by API key", ["key"]))
+API_KEY_REJECTIONS = registry.register(Counter(
+    "pipegram_api_key_rejections_total", "Requests refused by API key quota or scope", ["key", "reason"]))
+ADMISSION_REJECTIONS = registry.register(Counter(
+    "pipegram_admission_rejections_total", "Requests shed with 503 by admission control, by reason", ["reason"]))
+REQUEST_QUEUE_SECONDS = registry.register(Histogram(
+    "pipegram_request_queue_seconds", "Time requests waited before reaching a worker (X-Request-Start)"))
+
+HTTP_NOT_MODIFIED = registry.register(Counter(
+    "pipegram_http_not_modified_total", "GET JSON responses answered 304 Not Modified"))
+HTTP_COMPRESSION_CACHE = registry.register(Counter(
+    "pipegram_http_compression_cache_total",
+    "Compressed JSON bodies served from the compression cache (hit) or compressed afresh (miss)", ["result"]))
+HTTP_RESPONSE_CACHE = registry.register(Counter(
+    "pipegram_http_response_cache_total",
+    "Cached read endpoints answered from cached bytes (hit) or by running the view (miss)", ["result"]))
+
+
+def _timed_method(name: str, fn: Callable) -> Callable:
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            with ADAPTER_SECONDS.time(method=name):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with ADAPTER_SECONDS.time(method=name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def instrument_methods(cls: type) -> type:
+    """Class decorator: time every public method into ADAPTER_SECONDS."""
+    for name, fn in list(vars(cls).items()):
+        if not name.startswith("_") and inspect.isfunction(fn):
+            setattr(cls, name, _timed_method(name, fn))
+    return cls
+
+
+def _endpoint() -> str:
+    return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+
+def init_app(app: Flask) -> None:
+    @app.before_request
+    def _metrics_start():
+        g.metrics_started = time.perf_counter()
+        g.metrics_endpoint = _endpoint()
+        HTTP_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+    @app.after_request
+    def _metrics_observe(response):
+        started = g.pop("metrics_started", None)
+        if started is not None:
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                endpoint=g.metrics_endpoint, method=request.method, status=response.status_code,
+            )
+        return response
+
+    @app.teardown_request
+    def _metrics_done(_exc):
+        endpoint = g.pop("metrics_endpoint", None)
+        if endpoint is not None:
+            HTTP_IN_FLIGHT.dec(endpoint=endpoint)
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4")
@@ -1,28 +1,74 @@
 import json
+import os
 from pathlib import Path
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Optional
 
-SESSIONS_DIR = Path(__file__).resolve().parent.parent.parent / "sessions"
+from .state_store import SharedCache, get_store
+
+SESSIONS_DIR = Path(os.getenv("SESSIONS_DIR") or Path(__file__).resolve().parent.parent.parent / "sessions")
 SESSIONS_DIR.mkdir(parents=True, exist_ok=True)
 
+# Session files stay the source of truth; with a shared state backend the
+# parsed sessions are also kept there so every worker (and pod) reads them
+# without touching the disk.
+_cache = SharedCache("session")
+
 def _session_path(username: str) -> Path:
     return SESSIONS_DIR / f"{username}.json"
 
-def save_session(username: str, session: Dict[str, Any]) -> None:
-    _session_path(username).write_text(json.dumps(session, indent=2), encoding="utf-8")
-
-def load_session(username: str) -> Optional[Dict[str, Any]]:
+def _read_session_file(username: str) -> Optional[Dict[str, Any]]:
     p = _session_path(username)
     if not p.exists():
         return None
     return json.loads(p.read_text(encoding="utf-8"))
 
+def _cache_enabled() -> bool:
+    return get_store().shared
+
+def save_session(username: str, session: Dict[str, Any]) -> None:
+    _session_path(username).write_text(json.dumps(session, indent=2), encoding="utf-8")
+    if _cache_enabled():
+        _cache.set(username, session)
+
+def save_sessions(sessions: Dict[str, Dict[str, Any]]) -> None:
+    for username, session in sessions.items():
+        _session_path(username).write_text(json.dumps(session, indent=2), encoding="utf-8")
+    if _cache_enabled() and sessions:
+        # One store round-trip and one invalidation broadcast for the whole batch
+        _cache.set_many(sessions)
+
+def load_session(username: str) -> Optional[Dict[str, Any]]:
+    if _cache_enabled():
+        return _cache.get(username, loader=lambda: _read_session_file(username))
+    return _read_session_file(username)
+
 def delete_session(username: str) -> bool:
     p = _session_path(username)
-    if p.exists():
+    existed = p.exists()
+    if existed:
         p.unlink()
-        return True
-    return False
+    if _cache_enabled():
+        existed = _cache.invalidate(username) or existed
+    return existed
 
 def session_exists(username: str) -> bool:
-    return _session_path(username).exists()
+    if _session_path(username).exists():
+        return True
+    return _cache_enabled() and _cache.get(username) is not None
+
+def read_session_files() -> Dict[str, Dict[str, Any]]:
+    # Straight from disk, bypassing the shared store: safe in a master process before it forks
+    sessions = {}
+    for p in sorted(SESSIONS_DIR.glob("*.json")):
+        try:
+            sessions[p.stem] = json.loads(p.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            continue
+    return sessions
+
+def list_sessions() -> List[str]:
+    usernames = {p.stem for p in SESSIONS_DIR.glob("*.json")}
+    if _cache_enabled():
+        prefix = f"{_cache.namespace}:"
+        usernames.update(k[len(prefix):] for k in _cache.store.keys(prefix))
+    return sorted(usernames)
@@ -0,0 +1,79 @@
+import bisect
+import hashlib
+import os
+import threading
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+SHARD_VNODES = int(os.getenv("SHARD_VNODES", "160"))
+
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring with virtual nodes.
+
+    Adding or removing a node only moves the keys owned by that node, so the
+    other workers keep their warm sessions when the pool is resized.
+    """
+
+    def __init__(self, nodes: Sequence[str] = (), vnodes: int = SHARD_VNODES) -> None:
+        self.vnodes = vnodes
+        self._nodes: List[str] = []
+        # (points, owners, node count), replaced as one object so lookups never mix two rings
+        self._ring: Tuple[List[int], List[str], int] = ([], [], 0)
+        # Writers only; lookups read self._ring without locking
+        self._lock = threading.RLock()
+        self.rebuild(nodes)
+
+    @property
+    def nodes(self) -> List[str]:
+        return list(self._nodes)
+
+    def rebuild(self, nodes: Sequence[str]) -> None:
+        nodes = list(dict.fromkeys(nodes))
+        ring = sorted((_hash(f"{node}#{i}"), node) for node in nodes for i in range(self.vnodes))
+        with self._lock:
+            self._ring = ([p for p, _ in ring], [n for _, n in ring], len(nodes))
+            self._nodes = nodes
+
+    def add(self, node: str) -> None:
+        with self._lock:
+            if node not in self._nodes:
+                self.rebuild(self._nodes + [node])
+
+    def remove(self, node: str) -> None:
+        with self._lock:
+            if node in self._nodes:
+                self.rebuild([n for n in self._nodes if n != node])
+
+    def get(self, key: str) -> Optional[str]:
+        points, owners, _ = self._ring
+        if not points:
+            return None
+        return owners[bisect.bisect(points, _hash(key)) % len(points)]
+
+    def iter_nodes(self, key: str) -> Iterator[str]:
+        """Owner first, then the next distinct nodes clockwise (failover order)."""
+        points, owners, count = self._ring
+        if not points:
+            return
+        start = bisect.bisect(points, _hash(key))
+        seen = set()
+        for i in range(len(points)):
+            node = owners[(start + i) % len(points)]
+            if node not in seen:
+                seen.add(node)
+                yield node
+                if len(seen) == count:
+                    return
+
+
+def extract_username(args: Dict[str, Any], body: Any) -> Optional[str]:
+    # Every account-scoped route carries the acting account as `username`,
+    # either in the query string (GET/DELETE) or in the JSON body (POST).
+    username = args.get("username")
+    if not username and isinstance(body, dict):
+        username = body.get("username")
+    return username.strip().lower() if isinstance(username, str) and username.strip() else None
@@ -0,0 +1,487 @@
+import json
+import os
+from abc import ABC, abstractmethod
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# sqlite: file-backed, shared by every worker on the same host (default)
+# memory: per-process only, for a single worker (gunicorn warns otherwise)
+# redis:  shared across hosts/pods (requires the optional `redis` package)
+STATE_BACKEND = os.getenv("STATE_BACKEND", "sqlite").lower()
+STATE_SQLITE_PATH = os.getenv("STATE_SQLITE_PATH")
+STATE_POLL_INTERVAL = float(os.getenv("STATE_POLL_INTERVAL", "0.5"))
+STATE_LOCAL_TTL = float(os.getenv("STATE_LOCAL_TTL", "30"))
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+STATE_PREFIX = os.getenv("STATE_PREFIX", "pipegram:")
+
+Subscriber = Callable[[str], None]
+
+
+class StateStore(ABC):
+    # True when every worker sees the same data (safe to use as a cross-worker cache)
+    shared = False
+
+    @abstractmethod
+    def get(self, key: str) -> Any:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        ...
+
+    @abstractmethod
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """Set key only if it does not exist yet. Returns True when stored."""
+
+    @abstractmethod
+    def delete(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        ...
+
+    @abstractmethod
+    def keys(self, prefix: str = "") -> List[str]:
+        ...
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        for key, value in items.items():
+            self.set(key, value, ttl)
+
+    @abstractmethod
+    def publish(self, channel: str, message: str) -> None:
+        ...
+
+    @abstractmethod
+    def subscribe(self, channel: str, callback: Subscriber) -> None:
+        ...
+
+    def ping(self) -> bool:
+        return True
+
+
+class MemoryStore(StateStore):
+    def __init__(self) -> None:
+        self._data: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self._subscribers: Dict[str, List[Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def _alive(self, key: str, now: float) -> bool:
+        item = self._data.get(key)
+        if item is None:
+            return False
+        if item[1] is not None and item[1] <= now:
+            del self._data[key]
+            return False
+        return True
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            if not self._alive(key, time.monotonic()):
+                return None
+            return self._data[key][0]
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ttl if ttl else None)
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            if self._alive(key, now):
+                return False
+            self._data[key] = (value, now + ttl if ttl else None)
+            return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.monotonic()
+        with self._lock:
+            if self._alive(key, now):
+                value, expires_at = self._data[key]
+                value = int(value) + amount
+            else:
+                value, expires_at = amount, (now + ttl if ttl else None)
+            self._data[key] = (value, expires_at)
+            return value
+
+    def keys(self, prefix: str = "") -> List[str]:
+        now = time.monotonic()
+        with self._lock:
+            return [k for k in list(self._data) if k.startswith(prefix) and self._alive(k, now)]
+
+    def publish(self, channel: str, message: str) -> None:
+        for callback in list(self._subscribers.get(channel, [])):
+            callback(message)
+
+    def subscribe(self, channel: str, callback: Subscriber) -> None:
+        self._subscribers.setdefault(channel, []).append(callback)
+
+
+class SqliteStore(StateStore):
+    shared = True
+
+    def __init__(self, path: Path, poll_interval: float = STATE_POLL_INTERVAL) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.poll_interval = poll_interval
+        self._local = threading.local()
+        self._subscribers: Dict[str, List[Subscriber]] = {}
+        self._poller: Optional[threading.Thread] = None
+        self._last_event = 0
+        self._lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS kv (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL
+            );
+            CREATE TABLE IF NOT EXISTS events (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                channel TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            """
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread and per process (connections must not cross fork)
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.path), timeout=10, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key: str) -> Any:
+        row = self._conn().execute(
+            "SELECT value FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value), time.time() + ttl if ttl else None),
+        )
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        expires_at = time.time() + ttl if ttl else None
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                [(k, json.dumps(v), expires_at) for k, v in items.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires_at IS NOT NULL AND expires_at <= ?", (key, now))
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now + ttl if ttl else None),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return cur.rowcount == 1
+
+    def delete(self, key: str) -> bool:
+        return self._conn().execute("DELETE FROM kv WHERE key = ?", (key,)).rowcount > 0
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT value, expires_at FROM kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, now),
+            ).fetchone()
+            if row:
+                value, expires_at = int(json.loads(row[0])) + amount, row[1]
+            else:
+                value, expires_at = amount, (now + ttl if ttl else None)
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), expires_at),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return value
+
+    def keys(self, prefix: str = "") -> List[str]:
+        rows = self._conn().execute(
+            "SELECT key FROM kv WHERE key >= ? AND key < ? AND (expires_at IS NULL OR expires_at > ?)",
+            (prefix, prefix + "\uffff", time.time()),
+        ).fetchall()
+        return [r[0] for r in rows]
+
+    def publish(self, channel: str, message: str) -> None:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("INSERT INTO events (channel, message, created_at) VALUES (?, ?, ?)", (channel, message, now))
+        # Events only need to outlive the slowest poller
+        conn.execute("DELETE FROM events WHERE created_at < ?", (now - 60,))
+
+    def subscribe(self, channel: str, callback: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+            if self._poller is None or not self._poller.is_alive():
+                row = self._conn().execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()
+                self._last_event = row[0]
+                self._poller = threading.Thread(target=self._poll, name="state-store-events", daemon=True)
+                self._poller.start()
+
+    def _poll(self) -> None:
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                rows = self._conn().execute(
+                    "SELECT id, channel, message FROM events WHERE id > ? ORDER BY id", (self._last_event,)
+                ).fetchall()
+            except sqlite3.Error:
+                continue
+            for event_id, channel, message in rows:
+                self._last_event = event_id
+                for callback in list(self._subscribers.get(channel, [])):
+                    try:
+                        callback(message)
+                    except Exception:
+                        pass
+
+    def ping(self) -> bool:
+        try:
+            self._conn().execute("SELECT 1").fetchone()
+            return True
+        except sqlite3.Error:
+            return False
+
+
+class RedisStore(StateStore):
+    shared = True
+
+    def __init__(self, url: str = REDIS_URL, client: Any = None, prefix: str = STATE_PREFIX) -> None:
+        if client is None:
+            try:
+                import redis
+            except ImportError as exc:
+                raise RuntimeError("STATE_BACKEND=redis requires the 'redis' package") from exc
+            client = redis.Redis.from_url(url)
+        # Any redis-py compatible client works here (e.g. fakeredis in local runs)
+        self.client = client
+        self.prefix = prefix
+        self._pubsub = None
+        self._pubsub_thread = None
+        self._subscribers: Dict[str, List[Subscriber]] = {}
+        self._lock = threading.Lock()
+
+    def _k(self, key: str) -> str:
+        return self.prefix + key
+
+    def get(self, key: str) -> Any:
+        raw = self.client.get(self._k(key))
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self.client.set(self._k(key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    def set_many(self, items: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in items.items():
+            pipe.set(self._k(key), json.dumps(value), px=int(ttl * 1000) if ttl else None)
+        pipe.execute()
+
+    def add(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return bool(self.client.set(self._k(key), json.dumps(value), px=int(ttl * 1000) if ttl else None, nx=True))
+
+    def delete(self, key: str) -> bool:
+        return self.client.delete(self._k(key)) > 0
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        if not ttl:
+            return int(self.client.incrby(self._k(key), amount))
+        # One MULTI/EXEC: a missing key is created with its expiry and then
+        # incremented, so a crash in between can't leave a counter that never expires
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(self._k(key), 0, px=int(ttl * 1000), nx=True)
+        pipe.incrby(self._k(key), amount)
+        return int(pipe.execute()[1])
+
+    def keys(self, prefix: str = "") -> List[str]:
+        start = len(self.prefix)
+        keys = self.client.scan_iter(match=self._k(prefix) + "*", count=500)
+        return [(k.decode() if isinstance(k, bytes) else k)[start:] for k in keys]
+
+    def publish(self, channel: str, message: str) -> None:
+        self.client.publish(self._k(channel), message)
+
+    def subscribe(self, channel: str, callback: Subscriber) -> None:
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+            if self._pubsub is None:
+                self._pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            self._pubsub.subscribe(**{self._k(channel): self._dispatch})
+            if self._pubsub_thread is None:
+                self._pubsub_thread = self._pubsub.run_in_thread(sleep_time=STATE_POLL_INTERVAL, daemon=True)
+
+    def _dispatch(self, message: Dict[str, Any]) -> None:
+        channel = message["channel"]
+        channel = (channel.decode() if isinstance(channel, bytes) else channel)[len(self.prefix):]
+        data = message["data"]
+        data = data.decode() if isinstance(data, bytes) else data
+        for callback in list(self._subscribers.get(channel, [])):
+            try:
+                callback(data)
+            except Exception:
+                pass
+
+    def ping(self) -> bool:
+        try:
+            return bool(self.client.ping())
+        except Exception:
+            return False
+
+
+class SharedCache:
+    """Per-process L1 cache in front of the state store.
+
+    Writes and invalidations are broadcast on the store, so every worker drops
+    its local copy and the next read goes back to the shared backend.
+    """
+
+    def __init__(self, namespace: str, ttl: Optional[float] = None, local_ttl: float = STATE_LOCAL_TTL,
+                 store: Optional[StateStore] = None) -> None:
+        self.namespace = namespace
+        self.ttl = ttl
+        self.local_ttl = local_ttl
+        self._store = store
+        self._local: Dict[str, Tuple[Any, float]] = {}
+        self._lock = threading.Lock()
+        self._origin = ""
+        self._subscribed_pid: Optional[int] = None
+
+    @property
+    def store(self) -> StateStore:
+        store = self._store or get_store()
+        if self._subscribed_pid != os.getpid():
+            self._subscribed_pid = os.getpid()
+            # Forked workers inherit this object; give each process its own identity
+            self._origin = uuid.uuid4().hex
+            self._local.clear()
+            store.subscribe(self._channel, self._on_invalidate)
+        return store
+
+    @property
+    def _channel(self) -> str:
+        return f"invalidate:{self.namespace}"
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def _on_invalidate(self, message: str) -> None:
+        origin, _, key = message.partition("|")
+        if origin == self._origin:
+            return
+        with self._lock:
+            if key == "*":
+                self._local.clear()
+            else:
+                self._local.pop(key, None)
+
+    def get(self, key: str, loader: Optional[Callable[[], Any]] = None) -> Any:
+        store = self.store
+        now = time.monotonic()
+        with self._lock:
+            hit = self._local.get(key)
+            if hit and hit[1] > now:
+                return hit[0]
+        value = store.get(self._key(key))
+        if value is None and loader is not None:
+            value = loader()
+            if value is not None:
+                store.set(self._key(key), value, self.ttl)
+        if value is not None and self.local_ttl > 0:
+            with self._lock:
+                self._local[key] = (value, now + self.local_ttl)
+        return value
+
+    def set(self, key: str, value: Any) -> None:
+        store = self.store
+        store.set(self._key(key), value, self.ttl)
+        with self._lock:
+            self._local[key] = (value, time.monotonic() + self.local_ttl)
+        store.publish(self._channel, f"{self._origin}|{key}")
+
+    def set_many(self, items: Dict[str, Any]) -> None:
+        store = self.store
+        store.set_many({self._key(k): v for k, v in items.items()}, self.ttl)
+        now = time.monotonic()
+        with self._lock:
+            for key, value in items.items():
+                self._local[key] = (value, now + self.local_ttl)
+        store.publish(self._channel, f"{self._origin}|*")
+
+    def invalidate(self, key: str) -> bool:
+        store = self.store
+        existed = store.delete(self._key(key))
+        with self._lock:
+            self._local.pop(key, None)
+        store.publish(self._channel, f"{self._origin}|{key}")
+        return existed
+
+
+_store: Optional[StateStore] = None
+_store_pid: Optional[int] = None
+_store_lock = threading.Lock()
+
+
+def _build_store() -> StateStore:
+    if STATE_BACKEND == "redis":
+        return RedisStore(REDIS_URL)
+    if STATE_BACKEND == "sqlite":
+        from .session_manager import SESSIONS_DIR
+        return SqliteStore(Path(STATE_SQLITE_PATH) if STATE_SQLITE_PATH else SESSIONS_DIR / ".state.db")
+    if STATE_BACKEND != "memory":
+        raise ValueError(f"Unknown STATE_BACKEND: {STATE_BACKEND}")
+    return MemoryStore()
+
+
+def get_store() -> StateStore:
+    global _store, _store_pid
+    if _store is None or _store_pid != os.getpid():
+        with _store_lock:
+            if _store is None or _store_pid != os.getpid():
+                _store = _build_store()
+                _store_pid = os.getpid()
+    return _store
+
+
+def set_store(store: StateStore) -> None:
+    global _store, _store_pid
+    _store, _store_pid = store, os.getpid()
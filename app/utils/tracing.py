@@ -0,0 +1,301 @@
+import atexit
+import contextvars
+import functools
+import inspect
+import json
+import logging
+import os
+import queue
+import random
+import re
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional
+from urllib.parse import urlsplit
+
+from flask import Flask, g, request
+
+if TYPE_CHECKING:
+    import requests
+
+# Lightweight tracing with an OTLP/JSON exporter (OpenTelemetry collector
+# compatible): "file" appends one ExportTraceServiceRequest per line (the
+# collector's file exporter format), "otlp" POSTs to an OTLP/HTTP endpoint.
+TRACE_EXPORT = os.getenv("TRACE_EXPORT", "").lower()
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE", "traces.jsonl")
+TRACE_EXPORT_URL = os.getenv("TRACE_EXPORT_URL", "http://localhost:4318/v1/traces")
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "1.0"))
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "pipegram")
+TRACE_BATCH_SIZE = 512
+TRACE_FLUSH_INTERVAL = 1.0
+
+REQUEST_ID_HEADER = "X-Request-ID"
+_TRACEPARENT = re.compile(r"^00-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$")
+
+logger = logging.getLogger("pipegram.request")
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start_ns", "end_ns", "attributes", "error", "sampled")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str], sampled: bool,
+                 attributes: Optional[Dict[str, Any]] = None, start_ns: Optional[int] = None) -> None:
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.start_ns = start_ns or time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes or {}
+        self.error: Optional[str] = None
+        self.sampled = sampled
+
+    def set(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self, end_ns: Optional[int] = None) -> None:
+        if self.end_ns is None:
+            self.end_ns = end_ns or time.time_ns()
+            if self.sampled:
+                _exporter.submit(self)
+
+    def to_otlp(self) -> Dict[str, Any]:
+        data: Dict[str, Any] = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": 1,
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns),
+            "attributes": [_otlp_attr(k, v) for k, v in self.attributes.items() if v is not None],
+            "status": {"code": 2, "message": self.error} if self.error else {"code": 1},
+        }
+        if self.parent_id:
+            data["parentSpanId"] = self.parent_id
+        return data
+
+
+def _otlp_attr(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class _Exporter:
+    def __init__(self) -> None:
+        self.enabled = TRACE_EXPORT in ("file", "otlp")
+        self._queue: "queue.Queue[Span]" = queue.Queue(maxsize=10000)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def submit(self, span: Span) -> None:
+        if not self.enabled:
+            return
+        self._ensure_thread()
+        try:
+            self._queue.put_nowait(span)
+        except queue.Full:
+            pass  # never block a request on tracing
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._thread_pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or self._thread_pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="trace-exporter", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = self._drain(timeout=TRACE_FLUSH_INTERVAL)
+            if batch:
+                self._export(batch)
+
+    def _drain(self, timeout: float) -> List[Span]:
+        batch: List[Span] = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+            while len(batch) < TRACE_BATCH_SIZE:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def flush(self) -> None:
+        while True:
+            batch = self._drain(timeout=0)
+            if not batch:
+                return
+            self._export(batch)
+
+    def _export(self, spans: List[Span]) -> None:
+        payload = {
+            "resourceSpans": [{
+                "resource": {"attributes": [
+                    _otlp_attr("service.name", TRACE_SERVICE_NAME),
+                    _otlp_attr("process.pid", os.getpid()),
+                ]},
+                "scopeSpans": [{"scope": {"name": "pipegram"}, "spans": [s.to_otlp() for s in spans]}],
+            }]
+        }
+        try:
+            if TRACE_EXPORT == "file":
+                path = Path(TRACE_EXPORT_FILE)
+                with path.open("a", encoding="utf-8") as fh:
+                    fh.write(json.dumps(payload, separators=(",", ":")) + "\n")
+            else:
+                import requests
+                requests.post(TRACE_EXPORT_URL, json=payload, timeout=5)
+        except Exception as exc:
+            logger.warning("Trace export failed: %s", exc)
+
+
+_exporter = _Exporter()
+atexit.register(_exporter.flush)
+
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("pipegram_span", default=None)
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("pipegram_request_id", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def start_span(name: str, parent: Optional[Span] = None, **attributes: Any) -> Optional[Span]:
+    if not _exporter.enabled:
+        return None
+    parent = parent or _current_span.get()
+    if parent is None:
+        return Span(name, uuid.uuid4().hex, None, random.random() < TRACE_SAMPLE_RATE, attributes)
+    return Span(name, parent.trace_id, parent.span_id, parent.sampled, attributes)
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    current = start_span(name, **attributes)
+    if current is None:
+        yield None
+        return
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as exc:
+        current.error = f"{type(exc).__name__}: {exc}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def _traced_method(name: str, fn: Callable) -> Callable:
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name):
+                return await fn(*args, **kwargs)
+        return async_wrapper
+
+    @functools.wraps(fn)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        with span(name):
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+def trace_methods(prefix: str) -> Callable[[type], type]:
+    """Class decorator: one span per public method call, named `<prefix>.<method>`."""
+    def decorate(cls: type) -> type:
+        for name, fn in list(vars(cls).items()):
+            if not name.startswith("_") and inspect.isfunction(fn):
+                setattr(cls, name, _traced_method(f"{prefix}.{name}", fn))
+        return cls
+    return decorate
+
+
+def http_response_hook(response: "requests.Response", *args: Any, **kwargs: Any) -> None:
+    """requests hook: records each upstream HTTP exchange as a finished child span."""
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return
+    end_ns = time.time_ns()
+    req = response.request
+    url = urlsplit(req.url)
+    child = start_span(
+        f"HTTP {req.method}", parent=parent,
+        **{"http.method": req.method, "http.host": url.netloc, "http.target": url.path,
+           "http.status_code": response.status_code},
+    )
+    if child is not None:
+        child.start_ns = end_ns - int(response.elapsed.total_seconds() * 1e9)
+        if response.status_code >= 400:
+            child.error = f"HTTP {response.status_code}"
+        child.end(end_ns)
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = _request_id.get() or "-"
+        current = _current_span.get()
+        record.trace_id = current.trace_id if current else "-"
+        return True
+
+
+def init_app(app: Flask) -> None:
+    @app.before_request
+    def _trace_start():
+        request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.trace_started = time.perf_counter()
+        g.trace_tokens = [_request_id.set(request_id[:128])]
+        rule = request.url_rule.rule if request.url_rule is not None else request.path
+        parent = None
+        match = _TRACEPARENT.match(request.headers.get("traceparent", ""))
+        if match and _exporter.enabled:
+            parent = Span("remote", match.group(1), None, match.group(3) == "01")
+            parent.span_id = match.group(2)
+        root_span = start_span(
+            f"{request.method} {rule}", parent=parent,
+            **{"http.method": request.method, "http.route": rule, "request.id": request_id},
+        )
+        if root_span is not None:
+            g.trace_tokens.append(_current_span.set(root_span))
+            g.trace_span = root_span
+
+    @app.after_request
+    def _trace_headers(response):
+        request_id = _request_id.get()
+        if request_id:
+            response.headers[REQUEST_ID_HEADER] = request_id
+        root_span = g.get("trace_span")
+        if root_span is not None:
+            root_span.set("http.status_code", response.status_code)
+            if response.status_code >= 500:
+                root_span.error = f"HTTP {response.status_code}"
+            response.headers["traceparent"] = f"00-{root_span.trace_id}-{root_span.span_id}-{'01' if root_span.sampled else '00'}"
+        started = g.get("trace_started")
+        if started is not None:
+            logger.info("%s %s -> %s (%.1f ms)", request.method, request.path, response.status_code,
+                        (time.perf_counter() - started) * 1000)
+        return response
+
+    @app.teardown_request
+    def _trace_end(exc):
+        root_span = g.pop("trace_span", None)
+        if root_span is not None:
+            if exc is not None and root_span.error is None:
+                root_span.error = f"{type(exc).__name__}: {exc}"
+            root_span.end()
+        for token in reversed(g.pop("trace_tokens", [])):
+            token.var.reset(token)
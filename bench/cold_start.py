@@ -0,0 +1,114 @@
+"""Cold-start benchmark: worker boot time and memory in fresh interpreters.
+
+    python -m bench.cold_start              # every mode, 5 runs each
+    python -m bench.cold_start -n 10 --json
+
+Each run starts a new Python process that imports the app (create_app()
+included) and then serves the first /apispec_1.json request, the way a
+freshly recycled worker would.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional
+
+_CHILD = r"""
+import json, sys, time
+started = time.perf_counter()
+import app
+import_ms = (time.perf_counter() - started) * 1000
+
+def rss_mb():
+    with open("/proc/self/status", encoding="ascii") as fh:
+        for line in fh:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return 0.0
+
+rss = rss_mb()
+client = app.app.test_client()
+started = time.perf_counter()
+status = client.get("/apispec_1.json").status_code
+spec_ms = (time.perf_counter() - started) * 1000
+print(json.dumps({
+    "import_ms": import_ms, "rss_mb": rss, "first_spec_ms": spec_ms if status == 200 else None,
+    "modules": len(sys.modules), "instagrapi_loaded": "instagrapi" in sys.modules,
+}))
+"""
+
+# name -> (env overrides, clear the spec cache before every run)
+MODES = {
+    "docs-cold": ({"DOCS_ENABLED": "true"}, True),
+    "docs-cached": ({"DOCS_ENABLED": "true"}, False),
+    "docs-off": ({"DOCS_ENABLED": "false"}, False),
+}
+
+
+def _run_once(env: Dict[str, str]) -> Dict[str, Any]:
+    out = subprocess.run([sys.executable, "-c", _CHILD], env=env, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def _clear(cache_dir: str) -> None:
+    for name in os.listdir(cache_dir):
+        os.unlink(os.path.join(cache_dir, name))
+
+
+def run_mode(overrides: Dict[str, str], cold: bool, runs: int, cache_dir: str) -> Dict[str, Any]:
+    env = {**os.environ, **overrides, "APISPEC_CACHE_DIR": cache_dir, "SESSION_KEEPER_INTERVAL": "0",
+           "PROXY_PROBE_INTERVAL": "0", "PYTHONDONTWRITEBYTECODE": "1"}
+    env.setdefault("SESSIONS_DIR", tempfile.mkdtemp(prefix="pipegram-cold-"))
+    samples: List[Dict[str, Any]] = []
+    for _ in range(runs):
+        if cold:
+            _clear(cache_dir)
+        samples.append(_run_once(env))
+
+    def median(key: str) -> Optional[float]:
+        values = [s[key] for s in samples if s[key] is not None]
+        return round(statistics.median(values), 1) if values else None
+
+    return {
+        "runs": runs,
+        "import_ms": median("import_ms"),
+        "first_spec_ms": median("first_spec_ms"),
+        "rss_mb": median("rss_mb"),
+        "modules": samples[-1]["modules"],
+        "instagrapi_loaded": samples[-1]["instagrapi_loaded"],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modes", nargs="*", help=f"modes to run (default: all of {', '.join(MODES)})")
+    parser.add_argument("-n", "--runs", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    selected = args.modes or list(MODES)
+    unknown = [m for m in selected if m not in MODES]
+    if unknown:
+        parser.error(f"unknown mode(s): {', '.join(unknown)}; choose from {', '.join(MODES)}")
+
+    cache_dir = tempfile.mkdtemp(prefix="pipegram-apispec-")
+    results = {name: run_mode(*MODES[name], runs=args.runs, cache_dir=cache_dir) for name in selected}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    header = f"{'mode':<14}{'import ms':>11}{'1st spec ms':>13}{'rss MB':>9}{'modules':>9}  instagrapi"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        spec = "-" if r["first_spec_ms"] is None else r["first_spec_ms"]
+        print(f"{name:<14}{r['import_ms']:>11}{spec:>13}{r['rss_mb']:>9}{r['modules']:>9}  "
+              f"{'loaded' if r['instagrapi_loaded'] else 'lazy'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
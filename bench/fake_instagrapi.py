@@ -0,0 +1,251 @@
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from instagrapi import exceptions, types
+
+# Deterministic stand-in for instagrapi.Client. Swap it in with
+#     InstagramSessionAdapter.client_factory = FakeClient
+# Latency and error injection are configured on the class (FakeClient.config).
+
+_EPOCH = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeConfig:
+    def __init__(self, latency: float = 0.02, jitter: float = 0.01, error_rate: float = 0.0,
+                 upload_latency: float = 0.1, threads: int = 20, users_per_thread: int = 3,
+                 messages_per_thread: int = 20, stories: int = 5, seed: int = 42) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.upload_latency = upload_latency
+        self.threads = threads
+        self.users_per_thread = users_per_thread
+        self.messages_per_thread = messages_per_thread
+        self.stories = stories
+        self.seed = seed
+
+
+def _user_short(i: int) -> types.UserShort:
+    return types.UserShort(
+        pk=str(1000 + i), username=f"user_{i}", full_name=f"User {i}",
+        profile_pic_url=f"https://cdn.example.com/u/{i}.jpg", is_private=bool(i % 3 == 0),
+    )
+
+
+def _message(thread: int, i: int) -> types.DirectMessage:
+    return types.DirectMessage(
+        id=f"{thread:06d}{i:06d}", user_id=str(1000 + (thread + i) % 50), thread_id=str(thread),
+        timestamp=_EPOCH + timedelta(minutes=thread * 100 + i), item_type="text",
+        is_sent_by_viewer=bool(i % 2), text=f"Message {i} in thread {thread}: order #{thread * 1000 + i}",
+    )
+
+
+def _thread(i: int, config: FakeConfig) -> types.DirectThread:
+    users = [_user_short(i * config.users_per_thread + u) for u in range(config.users_per_thread)]
+    # Newest first, as Instagram lists thread items
+    messages = [_message(i, m) for m in reversed(range(config.messages_per_thread))]
+    return types.DirectThread(
+        pk=str(340282366841710300949128000000000000 + i), id=str(340282366841710300949128000000000000 + i),
+        messages=messages, users=users, admin_user_ids=[], last_activity_at=messages[0].timestamp,
+        muted=False, named=bool(i % 4 == 0), canonical=True, pending=False, archived=False,
+        thread_type="private", thread_title=f"Thread {i}" if i % 4 == 0 else "", folder=0,
+        vc_muted=False, is_group=config.users_per_thread > 1, mentions_muted=False,
+        approval_required_for_new_members=False, input_mode=0, business_thread_folder=0,
+        read_state=0, is_close_friend_thread=False, assigned_admin_id=0, shh_mode_enabled=False,
+        last_seen_at={},
+    )
+
+
+def _user(username: str, i: int) -> types.User:
+    return types.User(
+        pk=str(5000 + i), username=username, full_name=username.replace("_", " ").title(),
+        is_private=False, profile_pic_url=f"https://cdn.example.com/p/{i}.jpg", is_verified=False,
+        media_count=100 + i, follower_count=10000 + i * 7, following_count=300 + i, is_business=False,
+        biography="Benchmark fixture",
+    )
+
+
+def _story(username: str, i: int) -> types.Story:
+    return types.Story(
+        pk=str(9000 + i), id=f"{9000 + i}_{5000}", code=f"S{i}", taken_at=_EPOCH + timedelta(hours=i),
+        media_type=1 if i % 3 else 2, product_type="story",
+        thumbnail_url=f"https://cdn.example.com/s/{username}/{i}.jpg",
+        video_url=None if i % 3 else f"https://cdn.example.com/s/{username}/{i}.mp4",
+        user=types.UserShort(pk="5000", username=username), sponsor_tags=[], mentions=[], links=[],
+        hashtags=[], locations=[], stickers=[],
+    )
+
+
+def _media(username: str, i: int, caption: str = "") -> types.Media:
+    return types.Media(
+        pk=str(7000 + i), id=f"{7000 + i}_5000", code=f"M{i}", taken_at=_EPOCH + timedelta(days=i),
+        media_type=1, product_type="feed", thumbnail_url=f"https://cdn.example.com/m/{username}/{i}.jpg",
+        user=types.UserShort(pk="5000", username=username), like_count=10 * i, caption_text=caption,
+        usertags=[], sponsor_tags=[],
+    )
+
+
+class FakeClient:
+    config = FakeConfig()
+
+    # Fixtures are built once per config and shared (they are read-only)
+    _fixture_lock = threading.Lock()
+    _fixtures: Dict[int, List[types.DirectThread]] = {}
+
+    def __init__(self) -> None:
+        self.private = requests.Session()
+        self.public = requests.Session()
+        self.settings: Dict[str, Any] = {}
+        self.proxy: Optional[str] = None
+        self.username: Optional[str] = None
+        self._rng = random.Random(self.config.seed)
+        self._uploads = 0
+
+    # -- behaviour injection -------------------------------------------------
+
+    def _latency(self, base: Optional[float] = None) -> None:
+        base = self.config.latency if base is None else base
+        delay = base + self._rng.uniform(0, self.config.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _maybe_fail(self) -> None:
+        if self.config.error_rate and self._rng.random() < self.config.error_rate:
+            raise exceptions.ClientConnectionError("injected upstream failure")
+
+    def _request(self, base: Optional[float] = None) -> None:
+        self._latency(base)
+        self._maybe_fail()
+
+    @classmethod
+    def _threads(cls) -> List[types.DirectThread]:
+        key = id(cls.config)
+        if key not in cls._fixtures:
+            with cls._fixture_lock:
+                if key not in cls._fixtures:
+                    cls._fixtures[key] = [_thread(i, cls.config) for i in range(cls.config.threads)]
+        return cls._fixtures[key]
+
+    # -- session ---------------------------------------------------------------
+
+    def set_proxy(self, dsn: str) -> None:
+        self.proxy = dsn
+
+    def login(self, username: str, password: str, *args: Any, **kwargs: Any) -> bool:
+        self._request()
+        if password == "bad":
+            raise exceptions.BadPassword("bad_password")
+        self.username = username
+        self.settings = {"uuids": {"phone_id": f"fake-{username}"}, "cookies": {"sessionid": f"sid-{username}"},
+                         "authorization_data": {"ds_user_id": "5000", "sessionid": f"sid-{username}"}}
+        return True
+
+    def get_settings(self) -> Dict[str, Any]:
+        return dict(self.settings)
+
+    def set_settings(self, settings: Dict[str, Any]) -> bool:
+        self.settings = dict(settings)
+        return True
+
+    # -- account / users -------------------------------------------------------
+
+    def account_info(self) -> types.Account:
+        self._request()
+        return types.Account(
+            pk="5000", username=self.username or "bench_account", full_name="Bench Account", is_private=False,
+            profile_pic_url="https://cdn.example.com/p/me.jpg", is_verified=False, is_business=False,
+        )
+
+    def account_edit(self, **data: Any) -> types.Account:
+        self._request()
+        return self.account_info()
+
+    def account_change_picture(self, path: Any) -> types.UserShort:
+        self._request(self.config.upload_latency)
+        return _user_short(0)
+
+    def user_id_from_username(self, username: str) -> str:
+        self._request()
+        return str(5000 + sum(map(ord, username)) % 1000)
+
+    def user_info_by_username(self, username: str, use_cache: bool = True) -> types.User:
+        self._request()
+        return _user(username, sum(map(ord, username)) % 1000)
+
+    def user_stories(self, user_id: str, amount: Optional[int] = None) -> List[types.Story]:
+        self._request()
+        count = self.config.stories if amount is None else min(amount, self.config.stories)
+        return [_story(f"user_{user_id}", i) for i in range(count)]
+
+    def user_medias_paginated(self, user_id: str, amount: int = 0, end_cursor: str = "") -> Tuple[List[types.Media], str]:
+        self._request()
+        start = int(end_cursor or 0)
+        page = [_media(f"user_{user_id}", i) for i in range(start, start + (amount or 12))]
+        return page, str(start + len(page)) if start + len(page) < 60 else ""
+
+    def _relations_chunk(self, user_id: str, max_amount: int, cursor: str, total: int) -> Tuple[List[types.UserShort], str]:
+        self._request()
+        start = int(cursor or 0)
+        end = min(total, start + (max_amount or 200))
+        return [_user_short(i) for i in range(start, end)], (str(end) if end < total else "")
+
+    def user_followers_v1_chunk(self, user_id: str, max_amount: int = 0, max_id: str = "") -> Tuple[List[types.UserShort], str]:
+        return self._relations_chunk(user_id, max_amount, max_id, total=1000)
+
+    def user_following_v1_chunk(self, user_id: str, max_amount: int = 0, max_id: str = "") -> Tuple[List[types.UserShort], str]:
+        return self._relations_chunk(user_id, max_amount, max_id, total=300)
+
+    # -- direct ----------------------------------------------------------------
+
+    def direct_threads(self, amount: int = 20, *args: Any, **kwargs: Any) -> List[types.DirectThread]:
+        self._request()
+        return self._threads()
+
+    def direct_thread(self, thread_id: Any, amount: int = 20) -> types.DirectThread:
+        self._request()
+        threads = self._threads()
+        thread = next((t for t in threads if t.id == str(thread_id)), None)
+        if thread is None:
+            thread = threads[int(str(thread_id)[-4:]) % len(threads)]
+        if amount and len(thread.messages) > amount:
+            return thread.model_copy(update={"messages": thread.messages[:amount]})
+        return thread
+
+    def private_request(self, endpoint: str, params: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        # Only the paged thread read (direct_v2/threads/<id>/) is served
+        self._request()
+        params = params or {}
+        thread = self.direct_thread(endpoint.rstrip("/").rsplit("/", 1)[-1], 0)
+        start = int(params.get("cursor") or 0)
+        end = min(len(thread.messages), start + int(params.get("limit") or 20))
+        items = [{
+            "item_id": m.id, "user_id": int(m.user_id), "thread_id": m.thread_id, "item_type": m.item_type,
+            "timestamp": int(m.timestamp.timestamp() * 1_000_000), "is_sent_by_viewer": m.is_sent_by_viewer,
+            "text": m.text,
+        } for m in thread.messages[start:end]]
+        return {"thread": {"thread_id": thread.id, "items": items,
+                           "oldest_cursor": str(end) if end < len(thread.messages) else None}, "status": "ok"}
+
+    def direct_send(self, text: str, user_ids: List[int] = (), thread_ids: List[int] = ()) -> types.DirectMessage:
+        self._request()
+        return _message(0, 0)
+
+    def direct_send_photo(self, path: Any, user_ids: List[int] = (), thread_ids: List[int] = ()) -> types.DirectMessage:
+        self._request(self.config.upload_latency)
+        return _message(0, 1)
+
+    # -- publishing ------------------------------------------------------------
+
+    def photo_upload(self, path: Any, caption: str, *args: Any, **kwargs: Any) -> types.Media:
+        self._request(self.config.upload_latency)
+        self._uploads += 1
+        return _media(self.username or "bench_account", self._uploads, caption)
+
+    def photo_upload_to_story(self, path: Any, *args: Any, **kwargs: Any) -> types.Story:
+        self._request(self.config.upload_latency)
+        self._uploads += 1
+        return _story(self.username or "bench_account", self._uploads)
@@ -0,0 +1,178 @@
+"""Offline load benchmarks against a fake instagrapi backend.
+
+    python -m bench.run                                   # every scenario
+    python -m bench.run inbox send_dm -n 500 -c 8         # selected scenarios
+    python -m bench.run --latency 0.05 --error-rate 0.02  # slower, flaky upstream
+    python -m bench.run --json > bench/baseline.json      # record a baseline
+    python -m bench.run --compare bench/baseline.json     # diff against it
+
+Requests go through the real Flask app (routing, auth, session resume,
+adapter, serialization); only instagrapi.Client is replaced.
+"""
+import argparse
+import base64
+import io
+import json
+import logging
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+ADMIN_TOKEN = "bench-token"
+AUTH = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
+
+
+def _configure_env() -> None:
+    # Must run before the app is imported: settings are read at import time
+    os.environ.setdefault("SESSIONS_DIR", tempfile.mkdtemp(prefix="pipegram-bench-"))
+    os.environ["ADMIN_TOKEN"] = ADMIN_TOKEN
+    os.environ.setdefault("SESSION_KEEPER_INTERVAL", "0")
+    os.environ.setdefault("PROXY_PROBE_INTERVAL", "0")
+
+
+def _rss_mb() -> float:
+    try:
+        with open("/proc/self/status", encoding="ascii") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def _jpeg_b64() -> str:
+    try:
+        from PIL import Image
+        buf = io.BytesIO()
+        Image.new("RGB", (1080, 1080), (200, 120, 40)).save(buf, format="JPEG", quality=85)
+        data = buf.getvalue()
+    except ImportError:
+        data = b"\xff\xd8\xff\xe0" + b"\x00" * 200_000 + b"\xff\xd9"
+    return "data:image/jpeg;base64," + base64.b64encode(data).decode()
+
+
+def _percentile(sorted_values: List[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[idx]
+
+
+def build_scenarios(accounts: int) -> Dict[str, Callable[[Any, int], Any]]:
+    photo = _jpeg_b64()
+
+    def account(i: int) -> str:
+        return f"bench_{i % accounts}"
+
+    return {
+        "login": lambda c, i: c.post("/auth/login", json={"username": f"login_{i}", "password": "secret"}),
+        "inbox": lambda c, i: c.get(f"/dm/inbox?username={account(i)}", headers=AUTH),
+        "thread": lambda c, i: c.get(
+            f"/dm/thread/340282366841710300949128000000000{i % 20:03d}?username={account(i)}", headers=AUTH),
+        "send_dm": lambda c, i: c.post("/dm/send", headers=AUTH, json={
+            "username": account(i), "toUsername": f"user_{i}", "message": f"hello {i}"}),
+        "send_photo": lambda c, i: c.post("/dm/send-photo", headers=AUTH, json={
+            "username": account(i), "toUsername": f"user_{i}", "base64": photo}),
+        "profile": lambda c, i: c.get(f"/profile/target_{i % 50}?username={account(i)}", headers=AUTH),
+        "stories": lambda c, i: c.get(f"/stories/?username={account(i)}&targetUsername=target_{i % 50}",
+                                      headers=AUTH),
+        "publish": lambda c, i: c.post("/post/photo-feed", headers=AUTH, json={
+            "username": account(i), "caption": f"bench {i}", "base64": photo}),
+    }
+
+
+def run_scenario(app: Any, fn: Callable[[Any, int], Any], requests: int, concurrency: int) -> Dict[str, Any]:
+    latencies: List[float] = []
+    errors = 0
+
+    def one(i: int) -> None:
+        nonlocal errors
+        client = app.test_client()
+        started = time.perf_counter()
+        resp = fn(client, i)
+        resp.get_data()  # drain streamed bodies
+        latencies.append(time.perf_counter() - started)
+        if resp.status_code >= 400:
+            errors += 1
+
+    rss_before = _rss_mb()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "throughput_rps": round(requests / wall, 1),
+        "p50_ms": round(_percentile(latencies, 50) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 99) * 1000, 2),
+        "rss_mb": round(_rss_mb(), 1),
+        "rss_delta_mb": round(_rss_mb() - rss_before, 1),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scenarios", nargs="*", help="scenarios to run (default: all)")
+    parser.add_argument("-n", "--requests", type=int, default=200)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--accounts", type=int, default=20, help="distinct managed accounts")
+    parser.add_argument("--latency", type=float, default=0.02, help="fake upstream latency (s)")
+    parser.add_argument("--upload-latency", type=float, default=0.1, help="fake upload latency (s)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of upstream calls that fail")
+    parser.add_argument("--threads", type=int, default=20, help="threads returned by the fake inbox")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--compare", help="baseline JSON to compare against")
+    args = parser.parse_args(argv)
+
+    _configure_env()
+    from bench.fake_instagrapi import FakeClient, FakeConfig
+    from app import app
+    from app.services.session_adapter import InstagramSessionAdapter
+    from app.utils import session_manager
+
+    logging.getLogger("pipegram.request").setLevel(logging.WARNING)
+    FakeClient.config = FakeConfig(latency=args.latency, upload_latency=args.upload_latency,
+                                   error_rate=args.error_rate, threads=args.threads)
+    InstagramSessionAdapter.client_factory = FakeClient
+    for i in range(args.accounts):
+        username = f"bench_{i}"
+        session_manager.save_session(username, {
+            "username": username, "proxy": None,
+            "settings": {"cookies": {"sessionid": f"sid-{username}"}, "authorization_data": {"ds_user_id": "5000"}},
+        })
+
+    scenarios = build_scenarios(args.accounts)
+    selected = args.scenarios or list(scenarios)
+    unknown = [s for s in selected if s not in scenarios]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}; choose from {', '.join(scenarios)}")
+
+    results = {name: run_scenario(app, scenarios[name], args.requests, args.concurrency) for name in selected}
+    baseline = json.load(open(args.compare, encoding="utf-8")) if args.compare else {}
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return 0
+    header = f"{'scenario':<12}{'rps':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}{'rss MB':>9}"
+    print(header)
+    print("-" * len(header))
+    for name, r in results.items():
+        line = f"{name:<12}{r['throughput_rps']:>10}{r['p50_ms']:>10}{r['p99_ms']:>10}{r['errors']:>8}{r['rss_mb']:>9}"
+        base = baseline.get(name)
+        if base:
+            line += f"   rps {r['throughput_rps'] / base['throughput_rps'] - 1:+.0%}  p99 {r['p99_ms'] / max(base['p99_ms'], 1e-9) - 1:+.0%}"
+        print(line)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
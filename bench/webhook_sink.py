@@ -0,0 +1,105 @@
+"""Local HTTP sink for webhook deliveries: verifies signatures and counts events.
+
+    python -m bench.webhook_sink --port 9000 --secret <secret from POST /webhooks>
+    python -m bench.webhook_sink --fail-rate 0.3     # exercise retries
+    python -m bench.webhook_sink --fail-first 2      # first two deliveries get 503
+
+Also usable in-process (see WebhookSink) to check the delivery path end to end.
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import random
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional
+
+
+class WebhookSink:
+    def __init__(self, port: int = 0, secret: Optional[str] = None, fail_rate: float = 0.0,
+                 verbose: bool = False, fail_first: int = 0) -> None:
+        self.secret = secret
+        self.fail_rate = fail_rate
+        self.fail_first = fail_first
+        self.verbose = verbose
+        self.deliveries: List[Dict[str, Any]] = []
+        self.bad_signatures = 0
+        self.failed = 0
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hook"
+
+    @property
+    def events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [e for d in self.deliveries for e in d["events"]]
+
+    def verify(self, timestamp: str, body: bytes, signature: str) -> bool:
+        if self.secret is None:
+            return True
+        expected = hmac.new(self.secret.encode(), timestamp.encode() + b"." + body, hashlib.sha256).hexdigest()
+        return hmac.compare_digest(f"sha256={expected}", signature)
+
+    def _should_fail(self) -> bool:
+        with self._lock:
+            if self.failed < self.fail_first or (self.fail_rate and random.random() < self.fail_rate):
+                self.failed += 1
+                return True
+        return False
+
+    def _handler(self) -> type:
+        sink = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self) -> None:
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+                if not sink.verify(self.headers.get("X-Pipegram-Timestamp", ""), body,
+                                   self.headers.get("X-Pipegram-Signature", "")):
+                    with sink._lock:
+                        sink.bad_signatures += 1
+                    self.send_response(401)
+                elif sink._should_fail():
+                    self.send_response(503)
+                else:
+                    delivery = json.loads(body)
+                    with sink._lock:
+                        sink.deliveries.append(delivery)
+                    if sink.verbose:
+                        print(json.dumps(delivery), flush=True)
+                    self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args: Any) -> None:
+                pass
+
+        return Handler
+
+    def start(self) -> "WebhookSink":
+        threading.Thread(target=self.server.serve_forever, name="webhook-sink", daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        self.server.shutdown()
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--secret", help="webhook secret; deliveries with a bad signature get 401")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of deliveries answered with 503")
+    parser.add_argument("--fail-first", type=int, default=0, help="answer the first N deliveries with 503")
+    args = parser.parse_args(argv)
+
+    sink = WebhookSink(args.port, args.secret, args.fail_rate, verbose=True, fail_first=args.fail_first)
+    print(f"Listening on {sink.url}", file=sys.stderr)
+    try:
+        sink.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,58 @@
+import os
+
+# gunicorn -c gunicorn.conf.py app:app
+#
+# With PRELOAD_APP (default) the master imports the app, loads the session
+# index, builds warm clients and the API spec once, then forks: workers share
+# that memory copy-on-write instead of each rebuilding it. Workers are
+# recycled after MAX_REQUESTS (+ jitter, so they don't all restart at once)
+# and every replacement is forked warm from the master.
+
+bind = f"0.0.0.0:{os.getenv('PORT', '3000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", "2"))
+# Threaded (gthread) workers: requests mostly wait on Instagram, and the spare
+# thread is what lets admission control answer 503 instead of queueing
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+
+preload_app = os.getenv("PRELOAD_APP", "true").lower() not in ("0", "false", "no", "off")
+max_requests = int(os.getenv("MAX_REQUESTS", "2000"))
+max_requests_jitter = int(os.getenv("MAX_REQUESTS_JITTER", str(max_requests // 4)))
+
+if preload_app:
+    # Background threads must not be running when the master forks
+    os.environ.setdefault("DEFER_BACKGROUND_JOBS", "1")
+
+
+def on_starting(server):
+    state_backend = os.getenv("STATE_BACKEND", "sqlite").lower()
+    if state_backend == "memory" and workers > 1:
+        # Webhooks, idempotency claims, rate windows and locks would be private to each worker
+        server.log.warning("STATE_BACKEND=memory with %d workers: state is not shared between them; "
+                           "use sqlite or redis, or WEB_CONCURRENCY=1", workers)
+
+
+def when_ready(server):
+    if preload_app:
+        from app import preload
+        preload.warm()
+        preload.freeze()
+
+
+def post_fork(server, worker):
+    if preload_app:
+        from app import preload
+        preload.after_fork()
+
+
+def post_worker_init(worker):
+    # Flag the worker as draining as soon as it is told to stop (see app/utils/lifecycle.py)
+    from app.utils import lifecycle
+    lifecycle.install_signal_handlers()
+
+
+def worker_exit(server, worker):
+    # Requests are done; finish or persist background work before the process ends
+    from app.utils import lifecycle
+    lifecycle.shutdown()
@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import time
+from typing import Callable, Dict
+
+import pytest
+
+# Settings are read at import time, so point the app at scratch state before `app` is imported
+os.environ.setdefault("SESSIONS_DIR", tempfile.mkdtemp(prefix="pipegram-tests-"))
+os.environ["STATE_BACKEND"] = "memory"
+os.environ.setdefault("SESSION_KEEPER_INTERVAL", "0")
+os.environ.setdefault("PROXY_PROBE_INTERVAL", "0")
+os.environ.setdefault("WEBHOOK_INBOX_POLL_INTERVAL", "0")
+os.environ.setdefault("OPERATIONS_RESUME_INTERVAL", "0")
+os.environ.setdefault("SNAPSHOT_INTERVAL", "0")
+os.environ["DEFER_BACKGROUND_JOBS"] = "1"
+os.environ["ADMIN_TOKEN"] = "test-admin-token"
+os.environ["API_KEYS"] = json.dumps([
+    {"name": "tenant-a", "key": "tenant-a-key", "usernames": ["alice"]},
+    {"name": "tenant-b", "key": "tenant-b-key", "usernames": ["bob"]},
+])
+os.environ.pop("API_KEYS_FILE", None)
+
+
+def auth(token: str = "test-admin-token") -> Dict[str, str]:
+    return {"Authorization": f"Bearer {token}"}
+
+
+def wait_until(condition: Callable[[], bool], timeout: float = 5.0, interval: float = 0.02) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(interval)
+    return condition()
+
+
+@pytest.fixture
+def store():
+    from app.utils import state_store
+
+    previous = state_store._store
+    memory = state_store.MemoryStore()
+    state_store.set_store(memory)
+    yield memory
+    state_store.set_store(previous)
+
+
+@pytest.fixture
+def client(store):
+    from app import app
+
+    return app.test_client()
+
+
+@pytest.fixture
+def instagram(monkeypatch):
+    """Fake instagrapi backend with saved sessions for alice and bob."""
+    from app.services.session_adapter import InstagramSessionAdapter
+    from app.utils import session_manager
+    from bench.fake_instagrapi import FakeClient, FakeConfig
+
+    monkeypatch.setattr(FakeClient, "config", FakeConfig(latency=0, jitter=0, upload_latency=0, threads=5))
+    monkeypatch.setattr(InstagramSessionAdapter, "client_factory", FakeClient)
+    for username in ("alice", "bob"):
+        session_manager.save_session(username, {
+            "username": username, "proxy": None,
+            "settings": {"cookies": {"sessionid": f"sid-{username}"}, "authorization_data": {"ds_user_id": "5000"}},
+        })
+    return FakeClient
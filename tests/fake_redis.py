@@ -0,0 +1,120 @@
+import fnmatch
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Local stand-in for a Redis server, speaking the subset of the redis-py client
+# API that RedisStore uses (values are bytes, as redis-py returns them).
+
+
+class FakeRedis:
+    def __init__(self) -> None:
+        self._data: Dict[str, Tuple[bytes, Optional[float]]] = {}
+        self._handlers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def _encode(value: Any) -> bytes:
+        return value if isinstance(value, bytes) else str(value).encode()
+
+    def _live(self, key: str) -> Optional[bytes]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        if item[1] is not None and item[1] <= time.monotonic():
+            del self._data[key]
+            return None
+        return item[0]
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            return self._live(key)
+
+    def set(self, key: str, value: Any, px: Optional[int] = None, nx: bool = False) -> Optional[bool]:
+        with self._lock:
+            if nx and self._live(key) is not None:
+                return None
+            self._data[key] = (self._encode(value), time.monotonic() + px / 1000 if px else None)
+            return True
+
+    def delete(self, *keys: str) -> int:
+        with self._lock:
+            return sum(self._live(k) is not None and self._data.pop(k) is not None for k in keys)
+
+    def incrby(self, key: str, amount: int = 1) -> int:
+        with self._lock:
+            current = self._live(key)
+            value = int(current or 0) + amount
+            expires_at = self._data[key][1] if current is not None else None
+            self._data[key] = (self._encode(value), expires_at)
+            return value
+
+    def pexpire(self, key: str, ms: int) -> bool:
+        with self._lock:
+            current = self._live(key)
+            if current is None:
+                return False
+            self._data[key] = (current, time.monotonic() + ms / 1000)
+            return True
+
+    def pttl(self, key: str) -> int:
+        with self._lock:
+            if self._live(key) is None:
+                return -2
+            expires_at = self._data[key][1]
+            return -1 if expires_at is None else int((expires_at - time.monotonic()) * 1000)
+
+    def scan_iter(self, match: str = "*", count: int = 10) -> Iterator[bytes]:
+        with self._lock:
+            keys = [k for k in list(self._data) if fnmatch.fnmatchcase(k, match) and self._live(k) is not None]
+        return iter(k.encode() for k in keys)
+
+    def pipeline(self, transaction: bool = True) -> "FakePipeline":
+        return FakePipeline(self)
+
+    def publish(self, channel: str, message: Any) -> int:
+        with self._lock:
+            handlers = list(self._handlers.get(channel, []))
+        for handler in handlers:
+            handler({"type": "message", "channel": channel.encode(), "data": self._encode(message)})
+        return len(handlers)
+
+    def pubsub(self, ignore_subscribe_messages: bool = False) -> "FakePubSub":
+        return FakePubSub(self)
+
+    def ping(self) -> bool:
+        return True
+
+
+class FakePipeline:
+    """Queues commands and runs them under the server lock, like MULTI/EXEC."""
+
+    def __init__(self, server: FakeRedis) -> None:
+        self._server = server
+        self._commands: List[Tuple[str, tuple, dict]] = []
+
+    def __getattr__(self, name: str) -> Callable[..., "FakePipeline"]:
+        def queue(*args: Any, **kwargs: Any) -> "FakePipeline":
+            self._commands.append((name, args, kwargs))
+            return self
+        return queue
+
+    def execute(self) -> List[Any]:
+        with self._server._lock:
+            results = [getattr(self._server, name)(*args, **kwargs) for name, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+
+class FakePubSub:
+    def __init__(self, server: FakeRedis) -> None:
+        self._server = server
+
+    def subscribe(self, **handlers: Callable[[Dict[str, Any]], None]) -> None:
+        with self._server._lock:
+            for channel, handler in handlers.items():
+                self._server._handlers.setdefault(channel, []).append(handler)
+
+    def run_in_thread(self, sleep_time: float = 0, daemon: bool = False) -> threading.Thread:
+        # Messages are delivered synchronously on publish; nothing to poll
+        return threading.current_thread()
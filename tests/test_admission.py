@@ -0,0 +1,95 @@
+import time
+
+import pytest
+
+from app.utils import admission, lifecycle
+
+from .conftest import auth
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    fresh = admission.AdmissionController(1)
+    monkeypatch.setattr(admission, "controller", fresh)
+    return fresh
+
+
+def _webhooks(client, **headers):
+    return client.get("/webhooks/", headers={**auth(), **headers})
+
+
+def test_requests_are_admitted_and_released(client, controller):
+    assert _webhooks(client).status_code == 200
+    assert _webhooks(client).status_code == 200
+
+    assert controller.in_flight == 0
+    assert controller.admitted == 2
+
+
+def test_worker_at_its_limit_sheds_with_503(client, controller):
+    assert controller.acquire()
+
+    resp = _webhooks(client)
+
+    assert resp.status_code == 503
+    assert resp.headers["Retry-After"] == str(admission.ADMISSION_RETRY_AFTER)
+    assert controller.shed == 1
+    assert controller.in_flight == 1
+
+
+def test_probes_are_exempt_and_report_shedding(client, controller):
+    assert controller.acquire()
+    _webhooks(client)
+
+    ready = client.get("/readyz")
+
+    assert ready.status_code == 503
+    assert ready.get_json()["checks"]["admission"]["shedding"]
+    assert client.get("/healthz").status_code == 200
+    assert client.get("/health/operations", headers=auth()).status_code == 200
+
+    controller.release()
+    controller.last_shed = time.monotonic() - admission.READY_SHED_WINDOW - 1
+    assert client.get("/readyz").get_json()["checks"]["admission"]["ok"]
+
+
+def test_stale_queue_stamp_is_shed_only_when_trusted(client, controller, monkeypatch):
+    stamp = f"t={int((time.time() - 5) * 1000)}"
+
+    assert _webhooks(client, **{"X-Request-Start": stamp}).status_code == 200
+
+    monkeypatch.setattr(admission, "TRUST_QUEUE_HEADER", True)
+    resp = _webhooks(client, **{"X-Request-Start": stamp})
+
+    assert resp.status_code == 503
+    assert "in queue" in resp.get_json()["error"]
+    # About that request, not the worker
+    assert not controller.shedding()
+
+
+def test_draining_worker_refuses_new_requests(client, controller, monkeypatch):
+    monkeypatch.setattr(lifecycle, "draining", lambda: True)
+
+    assert _webhooks(client).status_code == 503
+    assert controller.in_flight == 0
+
+
+def test_admission_can_be_switched_off(client, controller, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_ENABLED", False)
+    assert controller.acquire()
+
+    assert _webhooks(client).status_code == 200
+
+
+@pytest.mark.parametrize("value,waited", [
+    ("t=1699999998", 2.0),
+    ("1699999998.5", 1.5),
+    ("1699999998000", 2.0),
+    ("t=1699999999000000", 1.0),
+    ("1699999000", None),
+    ("1700000500", None),
+    ("garbage", None),
+    ("", None),
+])
+def test_queue_seconds(value, waited):
+    assert admission.queue_seconds(value, now=1700000000.0) == waited
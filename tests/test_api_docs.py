@@ -0,0 +1,36 @@
+import json
+import os
+
+import pytest
+
+from app.utils import api_docs
+
+
+@pytest.fixture
+def spec_cache(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(api_docs, "APISPEC_CACHE_DIR", tmp_path)
+    monkeypatch.setattr(api_docs._cache, "_bytes", {})
+    return api_docs._cache
+
+
+def test_cache_defaults_to_an_app_owned_dir():
+    assert api_docs.APISPEC_CACHE_DIR.parent == api_docs.session_manager.SESSIONS_DIR
+
+
+def test_built_spec_is_cached_on_disk(client, spec_cache):
+    resp = client.get("/apispec_1.json")
+
+    assert resp.status_code == 200
+    assert spec_cache._path("apispec_1").read_bytes() == resp.data
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="no file owners")
+def test_a_file_owned_by_someone_else_is_not_served(client, spec_cache, monkeypatch):
+    path = spec_cache._path("apispec_1")
+    path.write_text(json.dumps({"paths": {"/planted": {}}}))
+    monkeypatch.setattr(os, "getuid", lambda: os.stat(path).st_uid + 1)
+
+    resp = client.get("/apispec_1.json")
+
+    assert "/planted" not in resp.get_json()["paths"]
+    assert "/dm/inbox" in resp.get_json()["paths"]
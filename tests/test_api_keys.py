@@ -0,0 +1,108 @@
+import json
+
+import pytest
+
+from app import middleware
+
+from .conftest import auth
+
+
+def _key(monkeypatch, token="limited-key", **limits):
+    key = middleware.ApiKey("limited", middleware._digest(token), ["alice"], **limits)
+    monkeypatch.setitem(middleware._keys, key.digest, key)
+    return key
+
+
+def _operations(client, token="limited-key"):
+    return client.get("/health/operations", headers=auth(token))
+
+
+def test_missing_and_unknown_tokens(client):
+    assert client.get("/health/operations").status_code == 401
+    assert _operations(client, "nope").status_code == 403
+
+
+def test_bearer_prefix_is_optional(client):
+    assert client.get("/health/operations", headers={"Authorization": "Bearer tenant-a-key"}).status_code == 200
+    assert client.get("/health/operations", headers={"Authorization": "tenant-a-key"}).status_code == 200
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"query_string": {"username": "bob"}},
+    {"query_string": [("username", "alice"), ("username", "bob")]},
+    {"json": {"username": "Bob", "toUsername": "carol", "message": "hi"}},
+    {"json": {"accounts": [{"username": "alice", "password": "x"}, {"username": "bob", "password": "y"}]}},
+    # The routes parse bodies with force=True, so the Content-Type can't hide the account
+    {"data": json.dumps({"username": "bob"}), "content_type": "text/plain"},
+])
+def test_scoped_key_cannot_name_another_account(client, kwargs):
+    resp = client.post("/dm/send", headers=auth("tenant-a-key"), **kwargs)
+
+    assert resp.status_code == 403
+    assert "bob" in resp.get_json()["error"]
+
+
+def test_scoped_key_can_act_on_its_own_account(client, instagram):
+    resp = client.post("/dm/send", headers=auth("tenant-a-key"),
+                       json={"username": "alice", "toUsername": "carol", "message": "hi"})
+
+    assert resp.status_code == 200
+
+
+def test_rate_limit_rejects_past_the_quota(client, store, monkeypatch):
+    _key(monkeypatch, rate_limit=2)
+
+    statuses = [_operations(client).status_code for _ in range(4)]
+
+    assert statuses == [200, 200, 429, 429]
+    rejected = _operations(client)
+    assert 1 <= int(rejected.headers["Retry-After"]) <= 60
+    # Rejected requests don't use up the window
+    window = next(k for k in store.keys("ratelimit:limited:"))
+    assert store.get(window) == 2
+
+
+def test_concurrency_limit(client, monkeypatch):
+    key = _key(monkeypatch, concurrency=1)
+
+    assert key.acquire()
+    assert _operations(client).status_code == 429
+    key.release()
+
+    assert _operations(client).status_code == 200
+    assert key._in_flight == 0
+
+
+def test_slot_is_released_when_the_view_fails(client, monkeypatch):
+    key = _key(monkeypatch, concurrency=1)
+
+    resp = client.post("/dm/send", headers=auth("limited-key"), json={"username": "alice"})
+
+    assert resp.status_code >= 400
+    assert key._in_flight == 0
+
+
+def test_streamed_response_holds_the_slot_until_closed(client, instagram, monkeypatch):
+    key = _key(monkeypatch, concurrency=1)
+
+    resp = client.get("/profile/carol/following?username=alice", headers=auth("limited-key"), buffered=False)
+    assert resp.status_code == 200
+    assert key._in_flight == 1
+    resp.get_data()
+    resp.close()
+
+    assert key._in_flight == 0
+
+
+def test_keys_can_be_given_as_sha256(monkeypatch):
+    digest = middleware._digest("hashed-key")
+    monkeypatch.setattr(middleware, "API_KEYS", json.dumps([
+        {"name": "hashed", "key_sha256": digest.hex(), "usernames": ["*"], "rate_limit": 5},
+    ]))
+    monkeypatch.setattr(middleware, "API_KEYS_FILE", None)
+
+    key = middleware._load_keys()[digest]
+
+    assert key.name == "hashed"
+    assert not key.scoped
+    assert key.rate_limit == 5
@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from .conftest import auth
+
+
+def _lines(resp):
+    return [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+
+
+@pytest.mark.parametrize("path,body", [
+    ("/auth/login/bulk", {"accounts": [
+        {"username": "carol", "password": "x"},
+        {"username": "dave", "password": "y"},
+        {"username": "Carol", "password": "z"},
+    ]}),
+    ("/auth/import-session/bulk", {"sessions": [
+        {"username": "carol", "session": {}},
+        {"username": "carol", "session": {}},
+    ]}),
+])
+def test_duplicate_usernames_are_rejected(client, instagram, path, body):
+    resp = client.post(path, headers=auth(), json=body)
+
+    assert resp.status_code == 400
+    assert "carol" in resp.get_json()["error"].lower()
+
+
+def test_each_account_gets_its_own_line(client, instagram):
+    resp = client.post("/auth/login/bulk", headers=auth(), json={"accounts": [
+        {"username": "carol", "password": "x"},
+        {"username": "dave", "password": "y"},
+    ]})
+
+    lines = _lines(resp)
+    assert sorted(line["username"] for line in lines[:-1]) == ["carol", "dave"]
+    assert lines[-1]["summary"]["total"] == 2
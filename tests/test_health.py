@@ -0,0 +1,54 @@
+import uuid
+
+import pytest
+
+from app.services import circuit_breaker, operations
+
+from .conftest import auth
+
+
+@pytest.fixture
+def journal():
+    ids = {}
+    for account, message in (("alice", "hi from alice"), ("bob", "secret from bob")):
+        ids[account] = uuid.uuid4().hex
+        operations._insert(ids[account], "dm.text", account, {"to": "carol", "message": message}, None,
+                           operations.DONE)
+    yield ids
+    operations._conn().execute("DELETE FROM operations WHERE id IN (?, ?)", tuple(ids.values()))
+
+
+def test_scoped_key_only_sees_its_own_operations(client, journal):
+    resp = client.get("/health/operations", headers=auth("tenant-a-key"))
+
+    assert resp.status_code == 200
+    listed = resp.get_json()["operations"]
+    assert journal["alice"] in {op["id"] for op in listed}
+    assert {op["account"] for op in listed} == {"alice"}
+    assert "secret from bob" not in resp.get_data(as_text=True)
+    assert sum(resp.get_json()["counts"].values()) == len(listed)
+
+
+def test_scoped_key_cannot_ask_for_another_account(client, journal):
+    resp = client.get("/health/operations?username=bob", headers=auth("tenant-a-key"))
+
+    assert resp.status_code == 403
+
+
+def test_admin_sees_every_account(client, journal):
+    resp = client.get("/health/operations", headers=auth())
+
+    ids = {op["id"] for op in resp.get_json()["operations"]}
+    assert set(journal.values()) <= ids
+
+
+def test_scoped_key_only_sees_its_own_breakers(client, monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "_breakers", {})
+    for username in ("alice", "bob"):
+        circuit_breaker.after_call(username, None, RuntimeError("boom"))
+
+    scoped = client.get("/health/circuits", headers=auth("tenant-a-key")).get_json()
+    admin = client.get("/health/circuits", headers=auth()).get_json()
+
+    assert [b["name"] for b in scoped["accounts"]] == ["account:alice"]
+    assert sorted(b["name"] for b in admin["accounts"]) == ["account:alice", "account:bob"]
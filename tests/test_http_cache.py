@@ -0,0 +1,119 @@
+import gzip
+import json
+import time
+
+import pytest
+
+from app.utils import http_cache, json_provider
+
+from .conftest import auth
+
+
+@pytest.fixture(autouse=True)
+def fresh_caches():
+    http_cache.responses.clear()
+    yield
+    http_cache.responses.clear()
+
+
+@pytest.fixture
+def upstream_calls(instagram, monkeypatch):
+    calls = []
+    original = instagram.direct_threads
+
+    def direct_threads(self, *args, **kwargs):
+        calls.append(1)
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(instagram, "direct_threads", direct_threads)
+    return calls
+
+
+def _inbox(client, token="test-admin-token", **headers):
+    return client.get("/dm/inbox?username=alice", headers={**auth(token), **headers})
+
+
+def test_inbox_has_an_etag_and_answers_304(client, upstream_calls, monkeypatch):
+    monkeypatch.setattr(http_cache, "HTTP_RESPONSE_CACHE_TTL", 0)
+    first = _inbox(client)
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    assert etag.startswith('W/"')
+
+    again = _inbox(client, **{"If-None-Match": etag})
+
+    assert again.status_code == 304
+    assert again.data == b""
+    assert again.headers["ETag"] == etag
+
+
+def test_repeated_polls_are_served_from_cached_bytes(client, upstream_calls):
+    first = _inbox(client)
+    second = _inbox(client)
+    revalidated = _inbox(client, **{"If-None-Match": first.headers["ETag"]})
+
+    assert upstream_calls == [1]
+    assert second.data == first.data
+    assert revalidated.status_code == 304
+
+
+def test_cached_bytes_expire(client, upstream_calls, monkeypatch):
+    monkeypatch.setattr(http_cache, "HTTP_RESPONSE_CACHE_TTL", 0.05)
+    _inbox(client)
+    time.sleep(0.06)
+
+    _inbox(client)
+
+    assert upstream_calls == [1, 1]
+
+
+def test_cache_is_per_credential(client, upstream_calls):
+    _inbox(client)
+
+    assert _inbox(client, "tenant-b-key").status_code == 403
+    assert _inbox(client, "tenant-a-key").status_code == 200
+    assert upstream_calls == [1, 1]
+
+
+def test_a_write_drops_the_accounts_cached_reads(client, upstream_calls):
+    _inbox(client)
+
+    resp = client.post("/dm/send", headers=auth(), json={"username": "alice", "toUsername": "carol", "message": "hi"})
+    assert resp.status_code == 200
+    _inbox(client)
+
+    assert upstream_calls == [1, 1]
+
+
+def test_streamed_json_gets_an_etag(client, upstream_calls, monkeypatch):
+    monkeypatch.setattr(json_provider, "JSON_STREAM_THRESHOLD", 2)
+    monkeypatch.setattr(http_cache, "HTTP_RESPONSE_CACHE_TTL", 0)
+
+    first = _inbox(client)
+    assert len(first.get_json()) == 5
+    assert "ETag" in first.headers
+
+    assert _inbox(client, **{"If-None-Match": first.headers["ETag"]}).status_code == 304
+
+
+def test_streamed_json_past_the_bound_keeps_streaming(client, upstream_calls, monkeypatch):
+    monkeypatch.setattr(json_provider, "JSON_STREAM_THRESHOLD", 2)
+    monkeypatch.setattr(http_cache, "HTTP_ETAG_MAX_BYTES", 100)
+
+    first = _inbox(client)
+    _inbox(client)
+
+    assert "ETag" not in first.headers
+    assert len(first.get_json()) == 5
+    # Not cached either: the body was never held in full
+    assert upstream_calls == [1, 1]
+
+
+def test_gzip_is_negotiated(client, upstream_calls):
+    plain = _inbox(client)
+    compressed = _inbox(client, **{"Accept-Encoding": "gzip"})
+
+    assert compressed.headers["Content-Encoding"] == "gzip"
+    assert "Accept-Encoding" in compressed.headers["Vary"]
+    assert json.loads(gzip.decompress(compressed.data)) == plain.get_json()
+    assert compressed.headers["ETag"] == plain.headers["ETag"]
@@ -0,0 +1,96 @@
+import pytest
+
+from app.utils import idempotency
+from app.utils.state_store import get_store
+
+from .conftest import auth
+
+
+@pytest.fixture
+def sends(instagram, monkeypatch):
+    calls = []
+    original = instagram.direct_send
+
+    def direct_send(self, *args, **kwargs):
+        calls.append(kwargs.get("text"))
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(instagram, "direct_send", direct_send)
+    return calls
+
+
+def _send(client, key, message="hi", token="test-admin-token"):
+    headers = {**auth(token), "Idempotency-Key": key} if key is not None else auth(token)
+    return client.post("/dm/send", headers=headers, json={"username": "alice", "toUsername": "carol", "message": message})
+
+
+def test_retry_replays_the_first_response(client, sends):
+    first = _send(client, "k1")
+    again = _send(client, "k1")
+
+    assert first.status_code == again.status_code == 200
+    assert again.data == first.data
+    assert again.headers["Idempotent-Replayed"] == "true"
+    assert "Idempotent-Replayed" not in first.headers
+    assert sends == ["hi"]
+
+
+def test_without_a_key_every_request_runs(client, sends):
+    _send(client, None)
+    _send(client, None)
+
+    assert sends == ["hi", "hi"]
+
+
+def test_key_reused_for_a_different_body_is_a_conflict(client, sends):
+    _send(client, "k1")
+
+    resp = _send(client, "k1", message="something else")
+
+    assert resp.status_code == 409
+    assert sends == ["hi"]
+
+
+def test_keys_are_scoped_per_caller(client, sends):
+    _send(client, "k1")
+    resp = _send(client, "k1", token="tenant-a-key")
+
+    assert "Idempotent-Replayed" not in resp.headers
+    assert sends == ["hi", "hi"]
+
+
+def test_failed_request_releases_the_key(client, sends, instagram, monkeypatch):
+    original = instagram.direct_send
+
+    def failing(self, *args, **kwargs):
+        raise RuntimeError("upstream down")
+
+    monkeypatch.setattr(instagram, "direct_send", failing)
+    assert _send(client, "k1").status_code >= 400
+    monkeypatch.setattr(instagram, "direct_send", original)
+
+    resp = _send(client, "k1")
+
+    assert resp.status_code == 200
+    assert "Idempotent-Replayed" not in resp.headers
+    assert sends == ["hi"]
+
+
+def test_duplicate_of_a_running_request_gives_up_with_409(client, sends, monkeypatch):
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT", 0.2)
+    with client.application.test_request_context(
+            "/dm/send", method="POST", headers={**auth(), "Idempotency-Key": "k1"},
+            json={"username": "alice", "toUsername": "carol", "message": "hi"}):
+        store_key, fingerprint = idempotency._request_key()
+    get_store().add(store_key, {"state": "pending", "fingerprint": fingerprint, "owner": "other"}, 60)
+
+    resp = _send(client, "k1")
+
+    assert resp.status_code == 409
+    assert sends == []
+
+
+@pytest.mark.parametrize("key", ["", " ", "x" * 256])
+def test_malformed_key_is_rejected(client, sends, key):
+    assert _send(client, key).status_code == 400
+    assert sends == []
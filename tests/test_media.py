@@ -0,0 +1,159 @@
+import base64
+import io
+
+import pytest
+from PIL import Image
+
+from app.errors import BadRequestError
+from app.services import media
+
+
+@pytest.fixture(autouse=True)
+def staging(tmp_path, monkeypatch):
+    monkeypatch.setattr(media, "MEDIA_STAGING_DIR", tmp_path)
+    return tmp_path
+
+
+def _image(fmt, size=(20, 10), mode="RGB"):
+    buf = io.BytesIO()
+    Image.new(mode, size, (200, 30, 30) if mode == "RGB" else (200, 30, 30, 0)).save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def _b64(data):
+    return base64.b64encode(data).decode()
+
+
+class FakeResponse:
+    def __init__(self, chunks, headers=None):
+        self.chunks = chunks
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield from self.chunks
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    fetched = []
+
+    def install(data, headers=None):
+        class Session:
+            def get(self, url, **kwargs):
+                fetched.append(url)
+                return FakeResponse([data[i:i + 64] for i in range(0, len(data), 64)], headers)
+
+        monkeypatch.setattr(media, "_http", Session)
+        return fetched
+    return install
+
+
+@pytest.mark.parametrize("head,fmt", [
+    (b"\xff\xd8\xff\xe0rest", "jpeg"),
+    (b"\x89PNG\r\n\x1a\nrest", "png"),
+    (b"RIFF\x00\x00\x00\x00WEBPVP8 ", "webp"),
+    (b"GIF89a", "gif"),
+    (b"\x00\x00\x00\x18ftypheic", "heic"),
+    (b"\x00\x00\x00\x18ftypisom", "mp4"),
+    (b"<!doctype html>", None),
+])
+def test_detect_format(head, fmt):
+    assert media.detect_format(head) == fmt
+
+
+def test_small_jpeg_is_passed_through(staging):
+    data = _image("JPEG")
+
+    with media.ingest(b64=f"data:image/jpeg;base64,{_b64(data)}") as staged:
+        assert staged.format == "jpeg"
+        assert staged.path.read_bytes() == data
+        assert (staged.width, staged.height) == (20, 10)
+        path = staged.path
+
+    assert not path.exists()
+
+
+def test_line_breaks_in_base64_are_tolerated():
+    encoded = _b64(_image("JPEG"))
+    wrapped = "\n".join(encoded[i:i + 76] for i in range(0, len(encoded), 76))
+
+    with media.ingest(b64=wrapped) as staged:
+        assert staged.format == "jpeg"
+
+
+def test_png_is_reencoded_as_jpeg_with_white_background():
+    with media.ingest(b64=_b64(_image("PNG", mode="RGBA"))) as staged:
+        assert staged.format == "jpeg"
+        assert staged.path.suffix == ".jpg"
+        with Image.open(staged.path) as image:
+            assert image.format == "JPEG"
+            assert all(c > 240 for c in image.getpixel((0, 0)))
+
+
+def test_oversized_picture_is_scaled_into_the_box():
+    with media.ingest(b64=_b64(_image("JPEG", size=(2000, 1000))), max_size=media.MEDIA_MAX_SIZE) as staged:
+        assert (staged.width, staged.height) == (1080, 540)
+
+
+@pytest.mark.parametrize("data", [_image("GIF"), b"\x00\x00\x00\x18ftypisom" + b"\x00" * 32, b"plain text"])
+def test_unsupported_formats_are_refused(staging, data):
+    with pytest.raises(BadRequestError, match="Unsupported media format"):
+        media.ingest(b64=_b64(data))
+    assert list(staging.iterdir()) == []
+
+
+def test_too_large_is_refused_and_leaves_nothing(staging, monkeypatch):
+    monkeypatch.setattr(media, "MEDIA_MAX_BYTES", 100)
+
+    with pytest.raises(BadRequestError, match="larger than"):
+        media.ingest(b64=_b64(_image("JPEG", size=(200, 200))))
+    assert list(staging.iterdir()) == []
+
+
+def test_bad_base64_is_refused(staging):
+    with pytest.raises(BadRequestError):
+        media.ingest(b64="/9j/" + "!" * 10)
+    assert list(staging.iterdir()) == []
+
+
+def test_nothing_given():
+    with pytest.raises(BadRequestError):
+        media.ingest()
+
+
+def test_url_download_is_cached(serve):
+    fetched = serve(_image("JPEG"))
+
+    with media.ingest(url="https://cdn.example.com/a.jpg") as first:
+        assert first.format == "jpeg"
+    with media.ingest(url="https://cdn.example.com/a.jpg") as second:
+        assert second.path == first.path
+
+    assert fetched == ["https://cdn.example.com/a.jpg"]
+    assert second.path.exists()
+
+
+def test_url_declaring_too_much_is_refused(serve, staging, monkeypatch):
+    monkeypatch.setattr(media, "MEDIA_MAX_BYTES", 100)
+    serve(_image("JPEG"), {"Content-Length": "5000"})
+
+    with pytest.raises(BadRequestError, match="larger than"):
+        media.ingest(url="https://cdn.example.com/a.jpg")
+    assert list(staging.iterdir()) == []
+
+
+def test_url_that_is_not_an_image_is_refused(serve, staging):
+    serve(b"<!doctype html><p>not found</p>")
+
+    with pytest.raises(BadRequestError, match="Unsupported media format"):
+        media.ingest(url="https://cdn.example.com/a.jpg")
+    assert list(staging.iterdir()) == []
@@ -0,0 +1,86 @@
+import pytest
+
+from app.services import media_archive
+
+
+class FakeResponse:
+    def __init__(self, chunks, headers=None):
+        self.chunks = chunks
+        self.headers = headers or {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def raise_for_status(self):
+        pass
+
+    def iter_content(self, chunk_size):
+        yield from self.chunks
+
+
+@pytest.fixture
+def serve(monkeypatch):
+    def install(chunks, headers=None):
+        class Session:
+            def get(self, url, **kwargs):
+                return FakeResponse(chunks, headers)
+
+        monkeypatch.setattr(media_archive, "_http", Session)
+    return install
+
+
+@pytest.mark.parametrize("value,expected", [
+    ("alice", "alice"),
+    ("a.b_c-d", "a.b_c-d"),
+    ("../etc", "..etc"),
+    (".", "_"),
+    ("..", "_"),
+    ("/../", "_"),
+    ("", "_"),
+])
+def test_safe_name(value, expected):
+    assert media_archive._safe_name(value) == expected
+
+
+def test_dot_only_target_falls_back_to_the_given_name():
+    assert media_archive._safe_name("..", fallback="12345") == "12345"
+
+
+def test_download_writes_the_file(serve, tmp_path):
+    serve([b"ab", b"cd"])
+
+    assert media_archive._download("https://cdn.example.com/x.jpg", tmp_path / "x.jpg", None) == 4
+    assert (tmp_path / "x.jpg").read_bytes() == b"abcd"
+    assert list(tmp_path.iterdir()) == [tmp_path / "x.jpg"]
+
+
+def test_download_past_the_cap_leaves_nothing(serve, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_archive, "ARCHIVE_MAX_BYTES", 3)
+    serve([b"ab", b"cd"])
+
+    with pytest.raises(ValueError):
+        media_archive._download("https://cdn.example.com/x.jpg", tmp_path / "x.jpg", None)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_declared_size_past_the_cap_is_refused(serve, tmp_path, monkeypatch):
+    monkeypatch.setattr(media_archive, "ARCHIVE_MAX_BYTES", 3)
+    serve([b"a"], {"Content-Length": "10"})
+
+    with pytest.raises(ValueError):
+        media_archive._download("https://cdn.example.com/x.jpg", tmp_path / "x.jpg", None)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_interrupted_download_leaves_nothing(serve, tmp_path):
+    def chunks():
+        yield b"ab"
+        raise ConnectionError("reset")
+    serve(chunks())
+
+    with pytest.raises(ConnectionError):
+        media_archive._download("https://cdn.example.com/x.jpg", tmp_path / "x.jpg", None)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,72 @@
+import asyncio
+
+import pytest
+
+from app.services import message_index
+from app.services.instagram_client import resume_session
+from bench.fake_instagrapi import FakeConfig
+
+
+@pytest.fixture
+def thread(instagram, monkeypatch):
+    """alice's first thread, holding 50 messages; yields (adapter, thread id, calls)."""
+    monkeypatch.setattr(instagram, "config", FakeConfig(latency=0, jitter=0, threads=2, messages_per_thread=50))
+    calls = []
+    original = instagram.private_request
+
+    def private_request(self, endpoint, params=None, **kwargs):
+        calls.append(dict(params or {}))
+        return original(self, endpoint, params, **kwargs)
+
+    monkeypatch.setattr(instagram, "private_request", private_request)
+    client = asyncio.run(resume_session("alice"))
+    thread_id = instagram._threads()[0].id
+    return client, thread_id, calls
+
+
+def _since(client, thread_id, indexed):
+    return asyncio.run(message_index._messages_since(client, thread_id, indexed))
+
+
+def test_first_sync_takes_one_page(thread):
+    client, thread_id, calls = thread
+
+    messages, truncated = _since(client, thread_id, None)
+
+    assert len(messages) == message_index.SYNC_PAGE
+    assert not truncated
+    assert len(calls) == 1
+
+
+def test_pages_back_with_the_cursor_fetching_each_message_once(thread):
+    client, thread_id, calls = thread
+
+    messages, truncated = _since(client, thread_id, 0)
+
+    assert len(messages) == 50
+    assert len({m.id for m in messages}) == 50
+    assert not truncated
+    assert [c.get("cursor") for c in calls] == [None, "20", "40"]
+
+
+def test_stops_at_the_indexed_timestamp(thread):
+    client, thread_id, calls = thread
+    newest = _since(client, thread_id, None)[0]
+    indexed = message_index._epoch(newest[5].timestamp)
+    calls.clear()
+
+    messages, truncated = _since(client, thread_id, indexed)
+
+    assert len(calls) == 1
+    assert not truncated
+
+
+def test_stops_at_the_sync_cap(thread, monkeypatch):
+    monkeypatch.setattr(message_index, "MESSAGE_SYNC_MAX_MESSAGES", 30)
+    client, thread_id, calls = thread
+
+    messages, truncated = _since(client, thread_id, 0)
+
+    assert len(messages) == 30
+    assert truncated
+    assert [c["limit"] for c in calls] == ["20", "10"]
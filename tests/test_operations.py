@@ -0,0 +1,223 @@
+import asyncio
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from app.errors import CircuitOpenError
+from app.services import operations, webhooks
+from app.services.instagram_client import resume_session
+from app.utils import lifecycle
+from app.utils.json_provider import loads
+
+from .conftest import wait_until
+
+
+@pytest.fixture
+def journal():
+    conn = operations._conn()
+    conn.execute("DELETE FROM operations")
+    yield conn
+    conn.execute("DELETE FROM operations")
+
+
+@pytest.fixture
+def sends(instagram, monkeypatch):
+    calls = []
+
+    def direct_send(self, text, user_ids=(), thread_ids=()):
+        calls.append(text)
+
+    monkeypatch.setattr(instagram, "direct_send", direct_send)
+    return calls
+
+
+def _row(journal, op_id):
+    return journal.execute("SELECT state, owner, error, media, not_before FROM operations WHERE id = ?",
+                           (op_id,)).fetchone()
+
+
+@pytest.fixture
+def stuck_dispatcher(monkeypatch, store):
+    """A dispatcher whose sends hang until released."""
+    release = threading.Event()
+    started = threading.Event()
+    fresh = webhooks.Dispatcher()
+
+    def deliver(http, sub, events, attempt):
+        started.set()
+        release.wait(5)
+
+    monkeypatch.setattr(fresh, "_deliver", deliver)
+    monkeypatch.setattr(webhooks, "WEBHOOK_WORKERS", 1)
+    monkeypatch.setattr(webhooks, "WEBHOOK_BATCH_WAIT", 0)
+    monkeypatch.setattr(webhooks, "dispatcher", fresh)
+    fresh.started = started
+    yield fresh
+    release.set()
+    fresh.stop()
+
+
+def _sub():
+    return {"id": "sub-1", "url": "https://hooks.example.com/x", "secret": "s", "username": "alice"}
+
+
+def _event(n):
+    return {"id": f"evt-{n}", "type": webhooks.POST_PUBLISHED, "username": "alice", "data": {"n": n}}
+
+
+def test_take_pending_includes_batches_being_sent(stuck_dispatcher):
+    stuck_dispatcher.submit(_sub(), _event(1))
+    assert stuck_dispatcher.started.wait(5)
+    stuck_dispatcher.submit(_sub(), _event(2))
+
+    assert stuck_dispatcher.pending() == 2
+    taken = stuck_dispatcher.take_pending()
+
+    assert sorted(event["id"] for _, event in taken) == ["evt-1", "evt-2"]
+
+
+def test_drain_journals_events_still_being_sent(stuck_dispatcher, journal):
+    stuck_dispatcher.submit(_sub(), _event(1))
+    assert stuck_dispatcher.started.wait(5)
+
+    operations._persist_webhooks(time.monotonic() + 0.2)
+
+    rows = journal.execute("SELECT kind, state, params FROM operations").fetchall()
+    assert [(kind, state) for kind, state, _ in rows] == [(operations.WEBHOOK_EVENT, operations.QUEUED)]
+    assert loads(rows[0][2])["event"]["id"] == "evt-1"
+
+
+def test_stopped_dispatcher_does_not_restart(stuck_dispatcher):
+    stuck_dispatcher.stop(0.1)
+
+    stuck_dispatcher.submit(_sub(), _event(1))
+
+    assert not wait_until(lambda: stuck_dispatcher.started.is_set(), timeout=0.3)
+    assert stuck_dispatcher.queued() == 1
+
+
+def test_resumer_can_be_switched_off(monkeypatch):
+    monkeypatch.setattr(operations, "OPERATIONS_RESUME_INTERVAL", 0)
+    monkeypatch.setattr(operations, "_thread", None)
+
+    operations.start()
+
+    assert operations._thread is None
+
+
+def test_operation_is_journaled_as_done(journal, sends):
+    client = asyncio.run(resume_session("alice"))
+
+    op = asyncio.run(operations.perform("dm.text", client, {"to": "carol", "message": "hi"}))
+
+    assert op["status"] == operations.DONE
+    assert _row(journal, op["id"])[0] == operations.DONE
+    assert sends == ["hi"]
+
+
+def test_failed_operation_is_journaled_as_failed(journal, instagram, monkeypatch):
+    def direct_send(self, *args, **kwargs):
+        raise RuntimeError("rejected")
+
+    monkeypatch.setattr(instagram, "direct_send", direct_send)
+    client = asyncio.run(resume_session("alice"))
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(operations.perform("dm.text", client, {"to": "carol", "message": "hi"}))
+
+    (state, error), = journal.execute("SELECT state, error FROM operations").fetchall()
+    assert (state, error) == (operations.FAILED, "rejected")
+
+
+def test_draining_worker_queues_instead_of_running(journal, sends, monkeypatch, tmp_path):
+    client = asyncio.run(resume_session("alice"))
+    staged = tmp_path / "in-1.jpg"
+    staged.write_bytes(b"\xff\xd8\xff picture")
+    monkeypatch.setattr(lifecycle, "draining", lambda: True)
+
+    op = asyncio.run(operations.perform("dm.photo", client, {"to": "carol"}, str(staged)))
+    staged.unlink()
+
+    assert op["status"] == operations.QUEUED
+    state, owner, _, media, _ = _row(journal, op["id"])
+    assert (state, owner) == (operations.QUEUED, None)
+    # The media was kept outside the staging dir, which does not survive the restart
+    assert open(media, "rb").read() == b"\xff\xd8\xff picture"
+    assert sends == []
+
+
+def test_next_worker_runs_queued_operations(journal, sends):
+    op_id = operations.enqueue("dm.text", "alice", {"to": "carol", "message": "queued hi"})
+
+    assert operations.resume_once() == 1
+
+    assert _row(journal, op_id)[0] == operations.DONE
+    assert sends == ["queued hi"]
+    assert operations.resume_once() == 0
+
+
+def test_queued_media_is_removed_once_run(journal, instagram, tmp_path):
+    staged = tmp_path / "in-1.jpg"
+    staged.write_bytes(b"\xff\xd8\xff picture")
+    op_id = operations.enqueue("dm.photo", "alice", {"to": "carol"}, str(staged))
+    media = _row(journal, op_id)[3]
+
+    operations.resume_once()
+
+    assert _row(journal, op_id)[0] == operations.DONE
+    assert not Path(media).exists()
+
+
+def test_open_circuit_puts_the_operation_back(journal, instagram, monkeypatch):
+    def direct_send(self, *args, **kwargs):
+        raise CircuitOpenError("open", retry_after=30)
+
+    monkeypatch.setattr(instagram, "direct_send", direct_send)
+    op_id = operations.enqueue("dm.text", "alice", {"to": "carol", "message": "hi"})
+
+    operations.resume_once()
+
+    state, owner, _, _, not_before = _row(journal, op_id)
+    assert (state, owner) == (operations.QUEUED, None)
+    assert not_before > time.time() + 20
+    # Not due yet
+    assert operations.resume_once() == 0
+
+
+def test_stale_running_rows_become_interrupted_and_are_not_replayed(journal, sends):
+    stale = "stale-op"
+    fresh = "fresh-op"
+    for op_id in (stale, fresh):
+        operations._insert(op_id, "dm.text", "alice", {"to": "carol", "message": "hi"}, None, operations.RUNNING)
+    journal.execute("UPDATE operations SET updated_at = ? WHERE id = ?",
+                    (time.time() - operations.OPERATIONS_STALE_AFTER - 1, stale))
+
+    assert operations.resume_once() == 0
+
+    assert _row(journal, stale)[0] == operations.INTERRUPTED
+    assert _row(journal, fresh)[0] == operations.RUNNING
+    assert sends == []
+
+
+def test_drain_deadline_interrupts_this_workers_running_rows(journal, monkeypatch):
+    operations._insert("mine", "dm.text", "alice", {}, None, operations.RUNNING)
+    monkeypatch.setattr(operations, "_active", 1)
+
+    operations._drain_operations(time.monotonic() + 0.05)
+
+    assert _row(journal, "mine")[0] == operations.INTERRUPTED
+
+
+def test_journaled_webhook_event_goes_back_to_the_dispatcher(journal, store, monkeypatch):
+    sub = webhooks.create_subscription("https://hooks.example.com/x", "alice", [webhooks.POST_PUBLISHED])
+    submitted = []
+    monkeypatch.setattr(webhooks.dispatcher, "submit", lambda s, e: submitted.append((s["id"], e["id"])))
+    operations._insert("evt-op", operations.WEBHOOK_EVENT, "alice",
+                       {"subscription": sub["id"], "event": _event(1)}, None, operations.QUEUED)
+
+    operations.resume_once()
+
+    assert submitted == [(sub["id"], "evt-1")]
+    assert _row(journal, "evt-op")[0] == operations.DONE
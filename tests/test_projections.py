@@ -0,0 +1,33 @@
+from datetime import datetime, timezone
+from types import SimpleNamespace
+
+from app.services.projections import ThreadDTO
+
+from .conftest import auth
+
+
+def _message(text, minute):
+    return SimpleNamespace(text=text, timestamp=datetime(2025, 1, 1, 0, minute, tzinfo=timezone.utc))
+
+
+def test_thread_without_users_or_items():
+    thread = SimpleNamespace(id=1, users=None, messages=None, thread_title="")
+
+    dto = ThreadDTO.from_model(thread)
+
+    assert dto.to_dict() == {"thread_id": "1", "thread_title": "Direct Message", "users": [],
+                             "last_message": None, "last_message_timestamp": None}
+
+
+def test_last_message_is_the_newest_whatever_the_order():
+    thread = SimpleNamespace(id=1, users=[], thread_title="t",
+                             messages=[_message("old", 1), _message("new", 5), _message("mid", 3)])
+
+    assert ThreadDTO.from_model(thread).last_message == "new"
+
+
+def test_inbox_lists_every_thread(client, instagram):
+    resp = client.get("/dm/inbox?username=alice", headers=auth())
+
+    assert resp.status_code == 200
+    assert len(resp.get_json()) == instagram.config.threads
@@ -0,0 +1,220 @@
+import threading
+import time
+
+import pytest
+
+from app.utils.state_store import MemoryStore, RedisStore, SharedCache, SqliteStore, StateStore
+
+from .conftest import wait_until
+from .fake_redis import FakeRedis
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStore()
+    if request.param == "redis":
+        return RedisStore(client=FakeRedis(), prefix="test:")
+    return SqliteStore(tmp_path / "state.db", poll_interval=0.02)
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        StateStore()
+
+
+def test_round_trip(backend):
+    value = {"user": "alice", "ids": [1, 2, 3], "ok": True}
+    backend.set("a:1", value)
+
+    assert backend.get("a:1") == value
+    assert backend.get("missing") is None
+    assert backend.delete("a:1") is True
+    assert backend.delete("a:1") is False
+    assert backend.get("a:1") is None
+
+
+def test_keys_and_set_many(backend):
+    backend.set_many({"a:1": 1, "a:2": 2, "b:1": 3})
+
+    assert sorted(backend.keys("a:")) == ["a:1", "a:2"]
+    assert sorted(backend.keys()) == ["a:1", "a:2", "b:1"]
+    assert backend.get("b:1") == 3
+
+
+def test_incr(backend):
+    assert backend.incr("n") == 1
+    assert backend.incr("n", 4) == 5
+    assert backend.incr("n", -2) == 3
+    assert backend.get("n") == 3
+
+
+def test_ttl_expires(backend):
+    backend.set("short", "x", ttl=0.1)
+    backend.set("long", "y", ttl=60)
+    backend.set_many({"many": "z"}, ttl=0.1)
+    assert backend.get("short") == "x"
+
+    time.sleep(0.15)
+
+    assert backend.get("short") is None
+    assert backend.get("many") is None
+    assert backend.get("long") == "y"
+    assert backend.keys() == ["long"]
+
+
+def test_incr_keeps_the_first_expiry(backend):
+    backend.incr("window", ttl=0.1)
+    backend.incr("window", ttl=60)
+
+    time.sleep(0.15)
+
+    assert backend.get("window") is None
+    assert backend.incr("window", ttl=60) == 1
+
+
+def test_add_only_stores_missing_keys(backend):
+    assert backend.add("lock", "first") is True
+    assert backend.add("lock", "second") is False
+    assert backend.get("lock") == "first"
+
+    backend.delete("lock")
+    assert backend.add("lock", "third") is True
+
+
+def test_add_succeeds_after_expiry(backend):
+    assert backend.add("lease", "a", ttl=0.1) is True
+    assert backend.add("lease", "b", ttl=0.1) is False
+
+    time.sleep(0.15)
+
+    assert backend.add("lease", "b", ttl=0.1) is True
+    assert backend.get("lease") == "b"
+
+
+def test_add_is_exclusive_across_threads(backend):
+    barrier = threading.Barrier(8)
+    results = []
+
+    def claim(n):
+        barrier.wait()
+        results.append(backend.add("claim", n))
+
+    threads = [threading.Thread(target=claim, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results.count(True) == 1
+
+
+def test_sqlite_add_is_exclusive_across_connections(tmp_path):
+    first = SqliteStore(tmp_path / "state.db")
+    second = SqliteStore(tmp_path / "state.db")
+
+    assert first.add("lock", 1) is True
+    assert second.add("lock", 2) is False
+    assert second.get("lock") == 1
+
+
+def test_publish_reaches_subscribers(backend):
+    received = []
+    backend.subscribe("news", received.append)
+    backend.subscribe("other", lambda message: received.append("wrong channel"))
+
+    backend.publish("news", "hello")
+
+    assert wait_until(lambda: received == ["hello"])
+
+
+def test_shared_cache_loads_once(backend):
+    cache = SharedCache("profiles", store=backend)
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return {"followers": 10}
+
+    assert cache.get("alice", loader) == {"followers": 10}
+    assert cache.get("alice", loader) == {"followers": 10}
+    assert calls == [1]
+    assert backend.get("profiles:alice") == {"followers": 10}
+
+
+def test_shared_cache_set_invalidates_other_instances(backend):
+    # Two caches on one store stand in for two workers
+    reader = SharedCache("profiles", store=backend)
+    writer = SharedCache("profiles", store=backend)
+    reader.get("alice", lambda: {"followers": 10})
+
+    writer.set("alice", {"followers": 11})
+
+    assert wait_until(lambda: reader.get("alice") == {"followers": 11})
+
+
+def test_shared_cache_invalidate_drops_local_copies(backend):
+    reader = SharedCache("profiles", store=backend)
+    writer = SharedCache("profiles", store=backend)
+    reader.get("alice", lambda: {"followers": 10})
+
+    assert writer.invalidate("alice") is True
+
+    assert wait_until(lambda: reader.get("alice") is None)
+    assert reader.get("alice", lambda: {"followers": 12}) == {"followers": 12}
+
+
+def test_shared_cache_set_many_invalidates_every_key(backend):
+    reader = SharedCache("profiles", store=backend)
+    writer = SharedCache("profiles", store=backend)
+    reader.get("alice", lambda: 1)
+    reader.get("bob", lambda: 2)
+
+    writer.set_many({"alice": 10, "bob": 20})
+
+    assert wait_until(lambda: (reader.get("alice"), reader.get("bob")) == (10, 20))
+
+
+def test_shared_cache_invalidation_crosses_sqlite_connections(tmp_path):
+    # Separate SqliteStore objects on one file behave like separate worker processes
+    reader = SharedCache("profiles", store=SqliteStore(tmp_path / "state.db", poll_interval=0.02))
+    writer = SharedCache("profiles", store=SqliteStore(tmp_path / "state.db", poll_interval=0.02))
+    reader.get("alice", lambda: {"followers": 10})
+    writer.get("alice")
+
+    writer.set("alice", {"followers": 11})
+
+    assert wait_until(lambda: reader.get("alice") == {"followers": 11})
+
+
+def test_redis_incr_creates_the_counter_with_its_expiry():
+    server = FakeRedis()
+    store = RedisStore(client=server, prefix="test:")
+
+    assert store.incr("window", ttl=60) == 1
+    assert 0 < server.pttl("test:window") <= 60000
+    assert store.incr("window", 2, ttl=60) == 3
+    assert store.incr("plain") == 1
+    assert server.pttl("test:plain") == -1
+
+
+def test_redis_keys_strip_the_prefix():
+    server = FakeRedis()
+    server.set("other:a:1", "x")
+    store = RedisStore(client=server, prefix="test:")
+    store.set("a:1", 1)
+
+    assert store.keys("a:") == ["a:1"]
+
+
+def test_shared_cache_invalidation_crosses_redis_clients():
+    # Two RedisStore objects on one server behave like two workers
+    server = FakeRedis()
+    reader = SharedCache("profiles", store=RedisStore(client=server, prefix="test:"))
+    writer = SharedCache("profiles", store=RedisStore(client=server, prefix="test:"))
+    reader.get("alice", lambda: {"followers": 10})
+    writer.get("alice")
+
+    writer.set("alice", {"followers": 11})
+
+    assert wait_until(lambda: reader.get("alice") == {"followers": 11})
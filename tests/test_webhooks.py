@@ -0,0 +1,170 @@
+import pytest
+
+from app.services import webhooks
+from bench.webhook_sink import WebhookSink
+
+from .conftest import auth, wait_until
+
+
+@pytest.fixture
+def sink():
+    server = WebhookSink().start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def dispatcher(monkeypatch, store):
+    # A fresh dispatcher per test, with one worker so batching is deterministic
+    monkeypatch.setattr(webhooks, "WEBHOOK_WORKERS", 1)
+    monkeypatch.setattr(webhooks, "WEBHOOK_BATCH_WAIT", 0.3)
+    monkeypatch.setattr(webhooks, "WEBHOOK_RETRY_BASE", 0.05)
+    monkeypatch.setattr(webhooks, "_subs_cache", (0.0, []))
+    # The sink listens on loopback, which is refused unless allowed
+    monkeypatch.setattr(webhooks, "WEBHOOK_ALLOWED_HOSTS", "127.0.0.1")
+    fresh = webhooks.Dispatcher()
+    monkeypatch.setattr(webhooks, "dispatcher", fresh)
+    yield fresh
+    threads = list(fresh._threads)
+    fresh.stop()
+    assert not [t.name for t in threads if t.is_alive()]
+
+
+def _subscribe(sink, username="alice"):
+    sub = webhooks.create_subscription(sink.url, username, [webhooks.POST_PUBLISHED])
+    sink.secret = sub["secret"]
+    return sub
+
+
+def test_events_are_batched_into_one_signed_delivery(sink, dispatcher):
+    _subscribe(sink)
+
+    for i in range(5):
+        assert webhooks.emit(webhooks.POST_PUBLISHED, "alice", {"media_id": str(i)}) == 1
+
+    assert wait_until(lambda: len(sink.events) == 5)
+    assert len(sink.deliveries) == 1
+    delivery = sink.deliveries[0]
+    assert delivery["attempt"] == 1
+    assert [e["data"]["media_id"] for e in delivery["events"]] == ["0", "1", "2", "3", "4"]
+    assert all(e["type"] == webhooks.POST_PUBLISHED and e["username"] == "alice" for e in delivery["events"])
+    assert sink.bad_signatures == 0
+
+
+def test_events_for_other_accounts_are_not_delivered(sink, dispatcher):
+    _subscribe(sink)
+
+    assert webhooks.emit(webhooks.POST_PUBLISHED, "bob", {"media_id": "1"}) == 0
+    assert webhooks.emit(webhooks.POST_PUBLISHED, "alice", {"media_id": "2"}) == 1
+
+    assert wait_until(lambda: len(sink.events) == 1)
+    assert sink.events[0]["username"] == "alice"
+
+
+def test_signature_uses_the_subscription_secret(sink, dispatcher):
+    _subscribe(sink)
+    sink.secret = "not-the-secret"
+
+    webhooks.emit(webhooks.POST_PUBLISHED, "alice", {"media_id": "1"})
+
+    assert wait_until(lambda: sink.bad_signatures == 1)
+    # 401 is not retried
+    assert wait_until(lambda: dispatcher.pending() == 0)
+    assert sink.deliveries == []
+    assert sink.bad_signatures == 1
+
+
+def test_sign_matches_the_sink_check():
+    server = WebhookSink(secret="s3cret")
+    try:
+        body = b'{"events": []}'
+        assert server.verify("1700000000", body, webhooks.sign("s3cret", "1700000000", body))
+        assert not server.verify("1700000001", body, webhooks.sign("s3cret", "1700000000", body))
+        assert not server.verify("1700000000", body, webhooks.sign("other", "1700000000", body))
+    finally:
+        server.server.server_close()
+
+
+def test_5xx_is_retried_with_the_same_events(sink, dispatcher):
+    sink.fail_first = 2
+    _subscribe(sink)
+
+    webhooks.emit(webhooks.POST_PUBLISHED, "alice", {"media_id": "1"})
+
+    assert wait_until(lambda: len(sink.deliveries) == 1)
+    assert sink.failed == 2
+    assert sink.deliveries[0]["attempt"] == 3
+    assert [e["data"]["media_id"] for e in sink.events] == ["1"]
+
+
+def test_retries_stop_at_max_attempts(sink, dispatcher, monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_MAX_ATTEMPTS", 3)
+    sink.fail_rate = 1.0
+    _subscribe(sink)
+
+    webhooks.emit(webhooks.POST_PUBLISHED, "alice", {"media_id": "1"})
+
+    assert wait_until(lambda: sink.failed == 3)
+    assert wait_until(lambda: dispatcher.pending() == 0)
+    assert sink.failed == 3
+    assert sink.deliveries == []
+
+
+def test_retry_is_dropped_when_the_subscription_is_deleted(sink, dispatcher, monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_RETRY_BASE", 0.3)
+    sink.fail_first = 1
+    sub = _subscribe(sink)
+
+    webhooks.emit(webhooks.POST_PUBLISHED, "alice", {"media_id": "1"})
+    assert wait_until(lambda: sink.failed == 1)
+    webhooks.delete_subscription(sub["id"])
+
+    assert wait_until(lambda: dispatcher.pending() == 0)
+    assert sink.deliveries == []
+
+
+@pytest.mark.parametrize("url", [
+    "http://127.0.0.1:9000/hook",
+    "http://localhost/hook",
+    "http://169.254.169.254/latest/meta-data/",
+    "http://10.0.0.5/hook",
+    "http://192.168.1.10/hook",
+    "http://[::1]/hook",
+    "ftp://example.com/hook",
+])
+def test_non_public_urls_are_refused(client, url):
+    resp = client.post("/webhooks/", headers=auth("tenant-a-key"), json={"url": url, "username": "alice"})
+
+    assert resp.status_code == 400
+    assert webhooks.list_subscriptions() == []
+
+
+def test_allowlisted_hosts_can_be_registered(client, monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_ALLOWED_HOSTS", "10.0.0.0/8, localhost")
+
+    for url in ("http://10.0.0.5/hook", "http://localhost:8080/hook"):
+        resp = client.post("/webhooks/", headers=auth(), json={"url": url})
+        assert resp.status_code == 201, resp.get_json()
+
+
+def test_delivery_rechecks_the_address(sink, dispatcher, monkeypatch):
+    _subscribe(sink)
+    # The allowlist no longer covers the host (as if its DNS now pointed inside)
+    monkeypatch.setattr(webhooks, "WEBHOOK_ALLOWED_HOSTS", "")
+
+    webhooks.emit(webhooks.POST_PUBLISHED, "alice", {"media_id": "1"})
+
+    assert wait_until(lambda: dispatcher.pending() == 0)
+    assert not wait_until(lambda: sink.deliveries or sink.failed, timeout=0.5)
+
+
+def test_stop_leaves_queued_events_for_take_pending(store, monkeypatch):
+    monkeypatch.setattr(webhooks, "WEBHOOK_WORKERS", 2)
+    fresh = webhooks.Dispatcher()
+    fresh.start()
+    fresh.stop()
+
+    sub = {"id": "s", "url": "http://127.0.0.1:1/hook", "secret": "x"}
+    fresh._queue.put_nowait((sub, {"type": webhooks.POST_PUBLISHED}))
+    assert fresh.take_pending() == [(sub, {"type": webhooks.POST_PUBLISHED})]
+    assert fresh.queued() == 0